@@ -14,6 +14,9 @@ PARTIES = [" AP ", " AP-PIS ", " APP ", " BM ", " BDP ", " BOP ", " BS ", " BSS
             " E "," FP ", " HYD ", " JP ", " IJPP-VP "," JPP-VP ", " NA ", " NP ", 
             " PL ", " PLG ", " PM ", " PP ", " SP ", " sP ", " RP ", " 8S ", " 8M "] 
 
+# Options as printed in the vote pages: yes, no, abstention, absent and leaves
+VOTE_RESULTS = ["SI", "NO", "ABST.", "AUS", "LP", "LE", "LO", "COM"]
+
 # Dictionary to avoid creation of duplicate parties objects
 PARTY_ALIASES = {
     'Alianza para el Progreso': "Alianza para el Progreso del Perú",
@@ -33,17 +36,31 @@ class VoteOption(str, Enum):
     ABSTENCION = "abstencion"
     SIN_RESPUESTA = "sin respuesta"
 
+# int8 codes of the options in the vote matrices (see analytics/vote_matrix.py).
+# 0 is reserved for congresistas that didn't take part in a vote event.
+NO_VOTE_CODE = 0
+VOTE_OPTION_CODES = {
+    VoteOption.SI: 1,
+    VoteOption.NO: 2,
+    VoteOption.ABSTENCION: 3,
+    VoteOption.SIN_RESPUESTA: 4,
+}
+
 class AttendanceStatus(str, Enum):
     PRESENTE = "presente"
     AUSENTE = "ausente"
     LICENCIA = "con licencia"
     SUSPENDIDO = "suspendido"
 
+# int8 codes of the attendance statuses in columnar vote events (see scrapers/schema.py)
+ATTENDANCE_STATUS_CODES = {status: code for code, status in enumerate(AttendanceStatus)}
+
 class BillStepType(str, Enum):
     VOTE = "vote event"
     ASSIGNED = "assigned to committee"
     PRESENTED = "presented"
     PUBLISHED = "published"
+    OTHER = "other"
 
 class RoleTypeBill(str, Enum):
     AUTHOR = "author"
@@ -0,0 +1,236 @@
+"""
+Pairwise voting agreement between congresistas.
+
+Counts are computed from a VoteMatrix with matrix products over one-hot
+encodings of its codes instead of comparing votes pair by pair: for every
+option, X @ X.T counts the events where two congresistas chose it. For each
+pair of congresistas we keep
+
+    agreements        events where both voted the same (si, no or abstención)
+    co_votes          events where both voted si, no or abstención
+    co_absences       events where both were "sin respuesta"
+    co_participation  events where both took part (any code but NO_VOTE_CODE)
+
+Events a congresista didn't take part in (NO_VOTE_CODE) are ignored. The counts
+are additive over vote events, so an AgreementAccumulator only processes the
+columns appended to the matrix since its last update.
+"""
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import polars as pl
+from loguru import logger
+
+from estecon.backend import NO_VOTE_CODE, VOTE_OPTION_CODES, LegPeriod, VoteOption
+from estecon.backend.analytics.vote_matrix import (
+    MATRIX_DIR,
+    VoteMatrix,
+    period_slug,
+    update_vote_matrix,
+)
+from estecon.backend.config import directories
+from estecon.backend.database.session import get_engine
+
+AGREEMENT_DIR = directories.PROCESSED_DATA / "agreement"
+
+VOTED_CODES = [
+    VOTE_OPTION_CODES[option]
+    for option in (VoteOption.SI, VoteOption.NO, VoteOption.ABSTENCION)
+]
+ABSENT_CODE = VOTE_OPTION_CODES[VoteOption.SIN_RESPUESTA]
+COUNTS = ["agreements", "co_votes", "co_absences", "co_participation"]
+
+# Vote events encoded at a time, which bounds the memory of the one-hot blocks
+EVENT_CHUNK = 2048
+
+
+def _gram(block: np.ndarray) -> np.ndarray:
+    # float32 products go through BLAS and are exact for counts below 2**24
+    block = block.astype(np.float32)
+    return block @ block.T
+
+
+def pairwise_counts(
+    codes: np.ndarray, chunk_size: int = EVENT_CHUNK
+) -> Dict[str, np.ndarray]:
+    """
+    Computes the pairwise count matrices (see COUNTS) of a congresista × vote
+    event matrix of codes, processing `chunk_size` events at a time.
+    """
+    n_voters = codes.shape[0]
+    counts = {name: np.zeros((n_voters, n_voters), dtype=np.int64) for name in COUNTS}
+    for start in range(0, codes.shape[1], chunk_size):
+        block = np.asarray(codes[:, start : start + chunk_size])
+        for code in VOTED_CODES:
+            counts["agreements"] += _gram(block == code).astype(np.int64)
+        counts["co_votes"] += _gram(np.isin(block, VOTED_CODES)).astype(np.int64)
+        counts["co_absences"] += _gram(block == ABSENT_CODE).astype(np.int64)
+        counts["co_participation"] += _gram(block != NO_VOTE_CODE).astype(np.int64)
+    return counts
+
+
+def _rate(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    rate = np.full(numerator.shape, np.nan)
+    np.divide(numerator, denominator, out=rate, where=denominator > 0)
+    return rate
+
+
+class AgreementAccumulator:
+    """
+    Running pairwise counts of a period's vote matrix.
+
+    Attributes:
+        leg_period (LegPeriod): Legislative period of the vote events.
+        voter_ids (List[int]): Congresista of each row and column of the counts.
+        event_ids (List[str]): Vote events already counted, in matrix order.
+        counts (Dict[str, np.ndarray]): Pairwise count matrices, see COUNTS.
+    """
+
+    def __init__(
+        self,
+        leg_period: LegPeriod,
+        voter_ids: Optional[List[int]] = None,
+        event_ids: Optional[List[str]] = None,
+        counts: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.leg_period = LegPeriod(leg_period)
+        self.reset(voter_ids or [])
+        if event_ids is not None:
+            self.event_ids = list(event_ids)
+        if counts is not None:
+            self.counts = counts
+
+    def reset(self, voter_ids: List[int]):
+        """
+        Forgets every counted event and starts over with the given congresistas.
+        """
+        self.voter_ids = list(voter_ids)
+        self.event_ids = []
+        self.counts = {
+            name: np.zeros((len(voter_ids), len(voter_ids)), dtype=np.int64)
+            for name in COUNTS
+        }
+
+    def update(self, vote_matrix: VoteMatrix) -> int:
+        """
+        Adds the vote events of the matrix that weren't counted yet. If the
+        matrix was rebuilt (other rows, or reordered columns) everything is
+        counted again. Returns the number of events counted.
+        """
+        n_done = len(self.event_ids)
+        if (
+            vote_matrix.voter_ids != self.voter_ids
+            or vote_matrix.event_ids[:n_done] != self.event_ids
+        ):
+            self.reset(vote_matrix.voter_ids)
+            n_done = 0
+
+        new_counts = pairwise_counts(vote_matrix.matrix[:, n_done:])
+        for name in COUNTS:
+            self.counts[name] += new_counts[name]
+        self.event_ids = list(vote_matrix.event_ids)
+        return len(self.event_ids) - n_done
+
+    @property
+    def agreement_rate(self) -> np.ndarray:
+        """
+        Share of the events both voted in where they voted the same.
+        """
+        return _rate(self.counts["agreements"], self.counts["co_votes"])
+
+    @property
+    def co_absence_rate(self) -> np.ndarray:
+        """
+        Share of the events both took part in where neither answered.
+        """
+        return _rate(self.counts["co_absences"], self.counts["co_participation"])
+
+    def to_frame(self) -> pl.DataFrame:
+        """
+        One row per pair of congresistas (voter_a < voter_b) with their counts
+        and rates.
+        """
+        rows, cols = np.triu_indices(len(self.voter_ids), k=1)
+        voter_ids = np.asarray(self.voter_ids, dtype=np.int64)
+        return pl.DataFrame(
+            {
+                "leg_period": [self.leg_period.value] * len(rows),
+                "voter_a": voter_ids[rows],
+                "voter_b": voter_ids[cols],
+                **{name: self.counts[name][rows, cols] for name in COUNTS},
+                "agreement_rate": self.agreement_rate[rows, cols],
+                "co_absence_rate": self.co_absence_rate[rows, cols],
+            }
+        ).with_columns(pl.col("agreement_rate", "co_absence_rate").fill_nan(None))
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                leg_period=self.leg_period.value,
+                voter_ids=np.asarray(self.voter_ids, dtype=np.int64),
+                event_ids=np.asarray(self.event_ids, dtype=str),
+                **self.counts,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "AgreementAccumulator":
+        with np.load(path) as data:
+            return cls(
+                str(data["leg_period"]),
+                data["voter_ids"].tolist(),
+                data["event_ids"].tolist(),
+                {name: data[name] for name in COUNTS},
+            )
+
+
+def agreement_paths(
+    leg_period: LegPeriod, root: Path = AGREEMENT_DIR
+) -> tuple[Path, Path]:
+    """
+    Paths of the saved accumulator and of the Parquet export of a period.
+    """
+    slug = period_slug(leg_period)
+    return root / f"agreement_{slug}.npz", root / f"agreement_{slug}.parquet"
+
+
+def update_agreement(
+    vote_matrix: VoteMatrix, root: Path = AGREEMENT_DIR
+) -> AgreementAccumulator:
+    """
+    Updates the saved accumulator of the matrix's period with its new vote
+    events, then saves it and exports the pairs to Parquet for the frontend.
+    """
+    state_path, parquet_path = agreement_paths(vote_matrix.leg_period, root)
+    if state_path.exists():
+        accumulator = AgreementAccumulator.load(state_path)
+    else:
+        accumulator = AgreementAccumulator(vote_matrix.leg_period)
+    n_events = accumulator.update(vote_matrix)
+    accumulator.save(state_path)
+    accumulator.to_frame().write_parquet(parquet_path, compression="zstd")
+    logger.info(
+        f"Counted {n_events} new vote events of {vote_matrix.leg_period.value} into {parquet_path}"
+    )
+    return accumulator
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute the pairwise voting agreement of each period"
+    )
+    parser.add_argument(
+        "--period",
+        type=LegPeriod,
+        action="append",
+        help="legislative period, e.g. 'Parlamentario 2021 - 2026' (all by default)",
+    )
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        for period in args.period or list(LegPeriod):
+            update_agreement(update_vote_matrix(conn, period, MATRIX_DIR))
@@ -0,0 +1,214 @@
+"""
+Cohesion and discipline of bancadas and parties.
+
+For every (vote event, group) pair of a period, where a group is a bancada or a
+party, cohesion_metrics computes in a single group-by over the votes:
+
+    rice_index        |si - no| / (si + no)
+    defection_share   share of the members who voted (si, no or abstención)
+                      against the group's majority option
+    abstention_rate   share of the members that abstained
+    absence_rate      share of the members that didn't answer ("sin respuesta")
+
+which grows linearly with the number of votes, instead of looping over vote
+events like VoteEvent.get_counts_by_bancada. rolling_cohesion turns the per
+event metrics into time series per group.
+"""
+
+import argparse
+from pathlib import Path
+from typing import Union
+
+import polars as pl
+from loguru import logger
+from sqlalchemy import Connection, and_, select
+
+from estecon.backend import LegPeriod, VoteOption
+from estecon.backend.analytics.vote_matrix import period_slug
+from estecon.backend.config import directories
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import get_engine
+
+COHESION_DIR = directories.PROCESSED_DATA / "cohesion"
+VOTES = Base.metadata.tables["votes"]
+VOTE_EVENTS = Base.metadata.tables["vote_events"]
+CONGRESISTAS = Base.metadata.tables["congresistas"]
+
+# Group column of each kind of group
+GROUPS = {"bancada": "bancada_id", "party": "party_id"}
+METRICS = ["rice_index", "defection_share", "abstention_rate", "absence_rate"]
+
+VOTES_SCHEMA = {
+    "vote_event_id": pl.Utf8,
+    "date": pl.Datetime("us"),
+    "voter_id": pl.Int64,
+    "option": pl.Utf8,
+    "bancada_id": pl.Int64,
+    "party_id": pl.Int64,
+}
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+
+def load_votes(conn: Connection, leg_period: LegPeriod) -> pl.DataFrame:
+    """
+    Votes of a period with the date of their event and the party of the voter
+    (null if the congresista isn't in the congresistas table).
+    """
+    query = (
+        select(
+            VOTES.c.vote_event_id,
+            VOTE_EVENTS.c.date,
+            VOTES.c.voter_id,
+            VOTES.c.option,
+            VOTES.c.bancada_id,
+            CONGRESISTAS.c.party_id,
+        )
+        .join(VOTE_EVENTS, VOTES.c.vote_event_id == VOTE_EVENTS.c.id)
+        .outerjoin(
+            CONGRESISTAS,
+            and_(
+                CONGRESISTAS.c.id == VOTES.c.voter_id,
+                CONGRESISTAS.c.leg_period == VOTE_EVENTS.c.leg_period,
+            ),
+        )
+        .where(VOTE_EVENTS.c.leg_period == LegPeriod(leg_period))
+    )
+    rows = conn.execute(query).all()
+    columns = list(VOTES_SCHEMA)
+    data = {col: [row[i] for row in rows] for i, col in enumerate(columns)}
+    data["option"] = [option.value for option in data["option"]]
+    return pl.DataFrame(data, schema=VOTES_SCHEMA)
+
+
+def cohesion_metrics(votes: Frame, group: str = "bancada_id") -> pl.DataFrame:
+    """
+    Computes the metrics of every (vote event, group) pair.
+
+    Args:
+        votes: Votes with vote_event_id, date, option and the group column, e.g.
+            from load_votes or parquet_export.scan_votes. Options may be
+            VoteOption values or their strings.
+        group: Column that defines the groups, "bancada_id" or "party_id".
+
+    Returns:
+        One row per vote event and group with the date, the number of members
+        and votes per option, the majority option and the METRICS.
+    """
+    option = pl.col("option").cast(pl.Utf8)
+    counts = (
+        votes.lazy()
+        .filter(pl.col(group).is_not_null())
+        .group_by("vote_event_id", group)
+        .agg(
+            pl.col("date").first(),
+            pl.len().cast(pl.Int64).alias("members"),
+            # Signed counts, since sums of booleans are unsigned and si - no can be negative
+            *[
+                (option == opt.value).sum().cast(pl.Int64).alias(opt.name.lower())
+                for opt in VoteOption
+            ],
+        )
+    )
+
+    voted = pl.col("si") + pl.col("no") + pl.col("abstencion")
+    majority = pl.max_horizontal("si", "no", "abstencion")
+    # Ties between the most voted options leave the group without a majority
+    tied = (
+        pl.sum_horizontal(
+            [
+                (pl.col(opt) == majority).cast(pl.Int32)
+                for opt in ("si", "no", "abstencion")
+            ]
+        )
+        > 1
+    )
+    return (
+        counts.with_columns(
+            pl.when(voted == 0)
+            .then(None)
+            .when(tied)
+            .then(None)
+            .when(pl.col("si") == majority)
+            .then(pl.lit(VoteOption.SI.value))
+            .when(pl.col("no") == majority)
+            .then(pl.lit(VoteOption.NO.value))
+            .otherwise(pl.lit(VoteOption.ABSTENCION.value))
+            .alias("majority"),
+            pl.when(pl.col("si") + pl.col("no") > 0)
+            .then((pl.col("si") - pl.col("no")).abs() / (pl.col("si") + pl.col("no")))
+            .alias("rice_index"),
+            pl.when((voted > 0) & ~tied)
+            .then((voted - majority) / voted)
+            .alias("defection_share"),
+            (pl.col("abstencion") / pl.col("members")).alias("abstention_rate"),
+            (pl.col("sin_respuesta") / pl.col("members")).alias("absence_rate"),
+        )
+        .sort(group, "date", "vote_event_id")
+        .collect()
+    )
+
+
+def rolling_cohesion(
+    metrics: pl.DataFrame, group: str = "bancada_id", window: str = "90d"
+) -> pl.DataFrame:
+    """
+    Rolling means of the METRICS of each group over a time window (a polars
+    duration, e.g. "30d" or "6mo"), evaluated at every vote event of the group.
+    """
+    return (
+        metrics.sort(group, "date")
+        .rolling(index_column="date", period=window, group_by=group)
+        .agg(
+            pl.len().alias("events"),
+            *[pl.col(metric).mean() for metric in METRICS],
+        )
+        .unique(subset=[group, "date"], keep="last", maintain_order=True)
+    )
+
+
+def export_cohesion(
+    conn: Connection,
+    leg_period: LegPeriod,
+    root: Path = COHESION_DIR,
+    window: str = "90d",
+) -> dict:
+    """
+    Computes the metrics and rolling series of a period for bancadas and
+    parties and writes them to Parquet. Returns the paths written.
+    """
+    votes = load_votes(conn, leg_period)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for kind, group in GROUPS.items():
+        metrics = cohesion_metrics(votes, group)
+        for name, frame in (
+            ("events", metrics),
+            ("rolling", rolling_cohesion(metrics, group, window)),
+        ):
+            path = root / f"{kind}_{name}_{period_slug(leg_period)}.parquet"
+            frame.write_parquet(path, compression="zstd")
+            paths[f"{kind}_{name}"] = path
+    logger.info(
+        f"Computed cohesion metrics of {votes.height} votes of {LegPeriod(leg_period).value}"
+    )
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute bancada and party cohesion metrics"
+    )
+    parser.add_argument(
+        "--period",
+        type=LegPeriod,
+        default=LegPeriod.PERIODO_2021_2026,
+        help="legislative period, e.g. 'Parlamentario 2021 - 2026'",
+    )
+    parser.add_argument(
+        "--window", default="90d", help="window of the rolling series, e.g. 30d or 6mo"
+    )
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        export_cohesion(conn, args.period, window=args.window)
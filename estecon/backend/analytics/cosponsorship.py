@@ -0,0 +1,349 @@
+"""
+Co-sponsorship network of congresistas.
+
+Two congresistas are linked when they sign the same bill. Each signature is
+weighted by its role (ROLE_WEIGHTS), so with B the weighted bill × congresista
+incidence matrix of a period, the adjacency matrix is B.T @ B without its
+diagonal: the weight of a link adds w_a * w_b over the bills both signed. The
+adjacency is a SciPy CSR matrix, and loading new bills only adds the products of
+their own incidence rows, so the network is never rebuilt from scratch. Updates
+read back only the bills whose signatures were loaded or changed since the last
+one (bills_congresistas.loaded_at), replacing the previous signers of those
+already in the network.
+"""
+
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+import scipy.sparse as sp
+from loguru import logger
+from sqlalchemy import Connection, func, select
+
+from estecon.backend import LegPeriod, RoleTypeBill
+from estecon.backend.analytics.vote_matrix import period_slug
+from estecon.backend.config import directories
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import get_engine
+
+NETWORK_DIR = directories.PROCESSED_DATA / "cosponsorship"
+BILLS = Base.metadata.tables["bills"]
+BILLS_CONGRESISTAS = Base.metadata.tables["bills_congresistas"]
+
+ROLE_WEIGHTS = {
+    RoleTypeBill.AUTHOR: 1.0,
+    RoleTypeBill.COAUTHOR: 0.75,
+    RoleTypeBill.ADHERENTE: 0.5,
+}
+
+# (bill_id, person_id, role_type)
+Signature = Tuple[str, int, RoleTypeBill]
+
+
+class CosponsorshipNetwork:
+    """
+    Weighted co-sponsorship network of a legislative period.
+
+    Attributes:
+        leg_period (LegPeriod): Legislative period of the bills.
+        node_ids (List[int]): Congresista of each row and column of the adjacency.
+        adjacency (sp.csr_matrix): Symmetric weighted adjacency matrix.
+        signers (Dict[str, Dict[int, float]]): Weight of each signer of each
+            bill already in the network.
+        loaded_through (Optional[datetime]): Latest loaded_at of the signatures
+            read into the network, None before the first update.
+    """
+
+    def __init__(self, leg_period: LegPeriod):
+        self.leg_period = LegPeriod(leg_period)
+        self.node_ids: List[int] = []
+        self.node_index: Dict[int, int] = {}
+        self.adjacency = sp.csr_matrix((0, 0), dtype=np.float64)
+        self.signers: Dict[str, Dict[int, float]] = {}
+        self.loaded_through: Optional[datetime] = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def _add_nodes(self, person_ids: Iterable[int]):
+        new_ids = sorted(set(person_ids) - self.node_index.keys())
+        for person_id in new_ids:
+            self.node_index[person_id] = len(self.node_ids)
+            self.node_ids.append(person_id)
+        if new_ids:
+            self.adjacency.resize((self.n_nodes, self.n_nodes))
+
+    def _incidence(self, bills: Dict[str, Dict[int, float]]) -> sp.csr_matrix:
+        rows, cols, weights = [], [], []
+        for i, signers in enumerate(bills.values()):
+            for person_id, weight in signers.items():
+                rows.append(i)
+                cols.append(self.node_index[person_id])
+                weights.append(weight)
+        return sp.csr_matrix((weights, (rows, cols)), shape=(len(bills), self.n_nodes))
+
+    def _links(self, bills: Dict[str, Dict[int, float]]) -> sp.csr_matrix:
+        incidence = self._incidence(bills)
+        links = (incidence.T @ incidence).tocsr()
+        links.setdiag(0)
+        links.eliminate_zeros()
+        return links
+
+    def add_signatures(self, signatures: Iterable[Signature]) -> int:
+        """
+        Adds the signatures of new bills. A bill that is already in the network
+        replaces its previous signers. Returns the number of bills added or
+        replaced.
+        """
+        bills: Dict[str, Dict[int, float]] = {}
+        for bill_id, person_id, role in signatures:
+            weights = bills.setdefault(bill_id, {})
+            weights[person_id] = max(
+                weights.get(person_id, 0.0), ROLE_WEIGHTS[RoleTypeBill(role)]
+            )
+        if not bills:
+            return 0
+
+        replaced = {
+            bill_id: self.signers[bill_id]
+            for bill_id in bills
+            if bill_id in self.signers
+        }
+        self._add_nodes(
+            person_id for signers in bills.values() for person_id in signers
+        )
+        delta = self._links(bills)
+        if replaced:
+            delta = delta - self._links(replaced)
+        self.adjacency = (self.adjacency + delta).tocsr()
+        self.adjacency.eliminate_zeros()
+        self.signers.update(bills)
+        return len(bills)
+
+    def degree(self, weighted: bool = True) -> np.ndarray:
+        """
+        Weighted degree (strength) of each node, or its number of neighbours.
+        """
+        if weighted:
+            return np.asarray(self.adjacency.sum(axis=1)).ravel()
+        return np.diff(self.adjacency.indptr)
+
+    def eigenvector_centrality(
+        self, tol: float = 1e-8, max_iter: int = 1000
+    ) -> np.ndarray:
+        """
+        Eigenvector centrality by power iteration, scaled to a maximum of 1.
+        Iterates on A + I, which has the same leading eigenvector as A but
+        also converges on bipartite-like graphs.
+        """
+        if self.n_nodes == 0:
+            return np.zeros(0)
+        centrality = np.full(self.n_nodes, 1.0 / self.n_nodes)
+        for _ in range(max_iter):
+            updated = self.adjacency @ centrality + centrality
+            updated /= np.linalg.norm(updated)
+            if np.abs(updated - centrality).sum() < self.n_nodes * tol:
+                centrality = updated
+                break
+            centrality = updated
+        else:
+            logger.warning(
+                f"Eigenvector centrality didn't converge in {max_iter} iterations"
+            )
+        return centrality / centrality.max() if centrality.max() > 0 else centrality
+
+    def communities(self, seed: int = 0, max_iter: int = 100) -> np.ndarray:
+        """
+        Community of each node by weighted label propagation: every node takes
+        the label with the largest total link weight among its neighbours
+        until no label changes. Labels are renumbered from 0 by size.
+        """
+        labels = np.arange(self.n_nodes)
+        rng = np.random.default_rng(seed)
+        indptr, indices, weights = (
+            self.adjacency.indptr,
+            self.adjacency.indices,
+            self.adjacency.data,
+        )
+        for _ in range(max_iter):
+            changed = False
+            for node in rng.permutation(self.n_nodes):
+                start, end = indptr[node], indptr[node + 1]
+                if start == end:
+                    continue
+                totals = np.bincount(
+                    labels[indices[start:end]], weights=weights[start:end]
+                )
+                best = np.flatnonzero(totals == totals.max())
+                if labels[node] not in best:
+                    labels[node] = rng.choice(best)
+                    changed = True
+            if not changed:
+                break
+        _, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        rank = np.empty_like(sizes)
+        rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+        return rank[inverse]
+
+    def nodes_frame(self) -> pl.DataFrame:
+        """
+        One row per congresista with their degree, centrality and community.
+        """
+        return pl.DataFrame(
+            {
+                "leg_period": [self.leg_period.value] * self.n_nodes,
+                "person_id": self.node_ids,
+                "degree": self.degree(weighted=False),
+                "strength": self.degree(),
+                "eigenvector_centrality": self.eigenvector_centrality(),
+                "community": self.communities(),
+            }
+        )
+
+    def edges_frame(self) -> pl.DataFrame:
+        """
+        One row per linked pair of congresistas (source < target).
+        """
+        upper = sp.triu(self.adjacency, k=1).tocoo()
+        node_ids = np.asarray(self.node_ids, dtype=np.int64)
+        return pl.DataFrame(
+            {
+                "source": node_ids[upper.row],
+                "target": node_ids[upper.col],
+                "weight": upper.data,
+            }
+        )
+
+    def save(self, root: Path = NETWORK_DIR):
+        root.mkdir(parents=True, exist_ok=True)
+        npz_path, json_path = network_paths(self.leg_period, root)
+        sp.save_npz(npz_path, self.adjacency)
+        loaded_through = (
+            self.loaded_through.isoformat() if self.loaded_through else None
+        )
+        json_path.write_text(
+            json.dumps(
+                {
+                    "leg_period": self.leg_period.value,
+                    "node_ids": self.node_ids,
+                    "signers": self.signers,
+                    "loaded_through": loaded_through,
+                }
+            ),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(
+        cls, leg_period: LegPeriod, root: Path = NETWORK_DIR
+    ) -> "CosponsorshipNetwork":
+        npz_path, json_path = network_paths(leg_period, root)
+        meta = json.loads(json_path.read_text(encoding="utf-8"))
+        network = cls(meta["leg_period"])
+        network.node_ids = meta["node_ids"]
+        network.node_index = {
+            person_id: i for i, person_id in enumerate(network.node_ids)
+        }
+        network.signers = {
+            bill_id: {int(person_id): weight for person_id, weight in signers.items()}
+            for bill_id, signers in meta["signers"].items()
+        }
+        if meta.get("loaded_through"):
+            network.loaded_through = datetime.fromisoformat(meta["loaded_through"])
+        network.adjacency = sp.load_npz(npz_path).tocsr()
+        return network
+
+
+def network_paths(leg_period: LegPeriod, root: Path = NETWORK_DIR) -> Tuple[Path, Path]:
+    slug = period_slug(leg_period)
+    return root / f"cosponsorship_{slug}.npz", root / f"cosponsorship_{slug}.json"
+
+
+def get_signatures(
+    conn: Connection, leg_period: LegPeriod, since: Optional[datetime] = None
+) -> List[Signature]:
+    """
+    Returns the (bill_id, person_id, role_type) of the bills of a period. With
+    `since`, only of the bills with a signature loaded or changed at or after
+    it, with all their signatures.
+    """
+    query = (
+        select(
+            BILLS_CONGRESISTAS.c.bill_id,
+            BILLS_CONGRESISTAS.c.person_id,
+            BILLS_CONGRESISTAS.c.role_type,
+        )
+        .join(BILLS, BILLS_CONGRESISTAS.c.bill_id == BILLS.c.id)
+        .where(BILLS.c.leg_period == LegPeriod(leg_period))
+    )
+    if since is not None:
+        changed = select(BILLS_CONGRESISTAS.c.bill_id).where(
+            BILLS_CONGRESISTAS.c.loaded_at >= since
+        )
+        query = query.where(BILLS_CONGRESISTAS.c.bill_id.in_(changed))
+    return [tuple(row) for row in conn.execute(query)]
+
+
+def get_loaded_through(conn: Connection, leg_period: LegPeriod) -> Optional[datetime]:
+    """
+    Returns the latest loaded_at of the signatures of a period.
+    """
+    query = (
+        select(func.max(BILLS_CONGRESISTAS.c.loaded_at))
+        .join(BILLS, BILLS_CONGRESISTAS.c.bill_id == BILLS.c.id)
+        .where(BILLS.c.leg_period == LegPeriod(leg_period))
+    )
+    return conn.execute(query).scalar()
+
+
+def update_network(
+    conn: Connection, leg_period: LegPeriod, root: Path = NETWORK_DIR
+) -> CosponsorshipNetwork:
+    """
+    Adds the bills of a period loaded or changed since the last update to its
+    saved network, replacing the signers of the bills already in it, saves the
+    network and exports its nodes and edges to Parquet.
+    """
+    npz_path, json_path = network_paths(leg_period, root)
+    if npz_path.exists() and json_path.exists():
+        network = CosponsorshipNetwork.load(leg_period, root)
+    else:
+        network = CosponsorshipNetwork(leg_period)
+    # Read before the signatures: rows loaded in between are read again next time
+    loaded_through = get_loaded_through(conn, leg_period)
+    n_bills = network.add_signatures(
+        get_signatures(conn, leg_period, since=network.loaded_through)
+    )
+    network.loaded_through = loaded_through or network.loaded_through
+    network.save(root)
+
+    slug = period_slug(leg_period)
+    network.nodes_frame().write_parquet(
+        root / f"nodes_{slug}.parquet", compression="zstd"
+    )
+    network.edges_frame().write_parquet(
+        root / f"edges_{slug}.parquet", compression="zstd"
+    )
+    logger.info(
+        f"Added or updated {n_bills} bills in the co-sponsorship network of {network.leg_period.value}"
+    )
+    return network
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the co-sponsorship networks")
+    parser.add_argument(
+        "--period",
+        type=LegPeriod,
+        default=LegPeriod.PERIODO_2021_2026,
+        help="legislative period, e.g. 'Parlamentario 2021 - 2026'",
+    )
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        update_network(conn, args.period)
@@ -0,0 +1,271 @@
+"""
+Columnar Parquet export of the database for analytics.
+
+Each table is written under `<root>/<table>/` as Parquet files partitioned by
+legislative period and by legislature or year (see PARTITIONS), and a small
+`catalog.json` records the files, partition values and row counts. Analyses
+then scan the files lazily with polars, reading only the partitions and
+columns they need, instead of running joins over the row store.
+
+The partition columns are kept inside the files as well, so the scans don't
+depend on hive-style directory names.
+"""
+
+import json
+import re
+import shutil
+from datetime import datetime
+from enum import Enum as PyEnum
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import polars as pl
+from loguru import logger
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Engine,
+    Enum,
+    Integer,
+    Select,
+    String,
+    extract,
+    select,
+)
+
+from estecon.backend.config import directories
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import get_engine
+
+EXPORT_DIR = directories.PROCESSED_DATA / "parquet"
+CATALOG_FILE = "catalog.json"
+CHUNK_SIZE = 250_000
+
+# Partition columns of each table. Tables that are not listed are small and are
+# written as a single file.
+PARTITIONS = {
+    "bills": ["leg_period", "legislature"],
+    "vote_events": ["leg_period", "year"],
+    "votes": ["leg_period", "year"],
+    "vote_counts": ["leg_period", "year"],
+    "attendance": ["leg_period", "year"],
+}
+
+# Tables keyed by a vote event get the period and year of their event
+EVENT_KEYS = {
+    "votes": "vote_event_id",
+    "vote_counts": "vote_event_id",
+    "attendance": "event_id",
+}
+
+POLARS_TYPES = [
+    (Enum, pl.Utf8),
+    (Boolean, pl.Boolean),
+    (Integer, pl.Int64),
+    (DateTime, pl.Datetime("us")),
+    (String, pl.Utf8),
+]
+
+
+def polars_dtype(column) -> pl.DataType:
+    """
+    Maps a SQLAlchemy column type into a polars dtype.
+    """
+    for sa_type, pl_type in POLARS_TYPES:
+        if isinstance(column.type, sa_type):
+            return pl_type
+    return pl.Utf8
+
+
+def export_query(table_name: str) -> Select:
+    """
+    Builds the query that exports a table, adding the partition columns that
+    live in the vote_events table.
+    """
+    table = Base.metadata.tables[table_name]
+    events = Base.metadata.tables["vote_events"]
+    if table_name == "vote_events":
+        return select(table, extract("year", table.c.date).label("year"))
+    if table_name in EVENT_KEYS:
+        return select(
+            table, events.c.leg_period, extract("year", events.c.date).label("year")
+        ).join(events, table.c[EVENT_KEYS[table_name]] == events.c.id)
+    return select(table)
+
+
+def export_schema(table_name: str) -> Dict[str, pl.DataType]:
+    """
+    Returns the polars schema of an exported table.
+    """
+    table = Base.metadata.tables[table_name]
+    schema = {col.name: polars_dtype(col) for col in table.columns}
+    if table_name in PARTITIONS:
+        schema.setdefault("leg_period", pl.Utf8)
+        if "year" in PARTITIONS[table_name]:
+            schema["year"] = pl.Int32
+    return schema
+
+
+def _plain(value):
+    return value.value if isinstance(value, PyEnum) else value
+
+
+def partition_dir(values: Dict[str, object]) -> str:
+    """
+    Directory name of a partition, e.g. "leg_period=Parlamentario_2021_-_2026/year=2024".
+    """
+    return "/".join(
+        f"{col}={re.sub(r'[^\w.-]+', '_', str(value))}" for col, value in values.items()
+    )
+
+
+def export_table(
+    engine: Engine, table_name: str, root: Path, chunk_size: int = CHUNK_SIZE
+) -> dict:
+    """
+    Exports one table, streaming it in chunks so memory use is bounded by the
+    chunk size. Returns the catalog entry of the table.
+    """
+    table_dir = root / table_name
+    if table_dir.exists():
+        shutil.rmtree(table_dir)
+    table_dir.mkdir(parents=True)
+
+    schema = export_schema(table_name)
+    partition_by = PARTITIONS.get(table_name, [])
+    partitions: Dict[str, dict] = {}
+    n_rows = 0
+
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(
+            export_query(table_name)
+        )
+        columns = list(result.keys())
+        for chunk_number, chunk in enumerate(result.partitions()):
+            df = pl.DataFrame(
+                {
+                    col: [_plain(row[i]) for row in chunk]
+                    for i, col in enumerate(columns)
+                },
+                schema={col: schema[col] for col in columns},
+            )
+            n_rows += df.height
+            groups = (
+                df.partition_by(partition_by, as_dict=True)
+                if partition_by
+                else {(): df}
+            )
+            for key, part in groups.items():
+                values = dict(zip(partition_by, key))
+                rel_dir = partition_dir(values)
+                path = table_dir / rel_dir / f"part-{chunk_number:05d}.parquet"
+                path.parent.mkdir(parents=True, exist_ok=True)
+                part.write_parquet(path, compression="zstd", statistics=True)
+
+                entry = partitions.setdefault(
+                    rel_dir, {"values": values, "files": [], "rows": 0}
+                )
+                entry["files"].append(path.relative_to(root).as_posix())
+                entry["rows"] += part.height
+
+    logger.info(
+        f"Exported {n_rows} rows of {table_name} into {len(partitions)} partitions"
+    )
+    return {
+        "partition_by": partition_by,
+        "rows": n_rows,
+        "schema": {col: str(dtype) for col, dtype in schema.items()},
+        "partitions": list(partitions.values()),
+    }
+
+
+def export_parquet(
+    engine: Optional[Engine] = None,
+    root: Path = EXPORT_DIR,
+    tables: Optional[Iterable[str]] = None,
+) -> dict:
+    """
+    Exports the given tables (all of them by default) and writes the catalog.
+    """
+    engine = engine or get_engine()
+    root.mkdir(parents=True, exist_ok=True)
+    catalog = load_catalog(root) if (root / CATALOG_FILE).exists() else {"tables": {}}
+
+    for table_name in tables or [table.name for table in Base.metadata.sorted_tables]:
+        catalog["tables"][table_name] = export_table(engine, table_name, root)
+    catalog["exported_at"] = datetime.now().isoformat(timespec="seconds")
+
+    (root / CATALOG_FILE).write_text(
+        json.dumps(catalog, indent=2, ensure_ascii=False), encoding="utf-8"
+    )
+    return catalog
+
+
+def load_catalog(root: Path = EXPORT_DIR) -> dict:
+    """
+    Reads the catalog of an export.
+    """
+    return json.loads((root / CATALOG_FILE).read_text(encoding="utf-8"))
+
+
+def scan_table(
+    table_name: str,
+    root: Path = EXPORT_DIR,
+    columns: Optional[Sequence[str]] = None,
+    **partition_values: Union[object, List[object]],
+) -> pl.LazyFrame:
+    """
+    Lazily scans an exported table.
+
+    Keyword arguments filter on partition columns (a value or a list of values)
+    and prune whole files through the catalog before anything is read. Further
+    `.filter()` and `.select()` calls on the returned LazyFrame are pushed down
+    into the Parquet reader.
+
+    Example:
+        scan_table("votes", leg_period=LegPeriod.PERIODO_2021_2026, year=[2024, 2025],
+                   columns=["vote_event_id", "voter_id", "option"])
+    """
+    entry = load_catalog(root)["tables"][table_name]
+    wanted = {
+        col: {
+            _plain(v)
+            for v in (value if isinstance(value, (list, tuple, set)) else [value])
+        }
+        for col, value in partition_values.items()
+    }
+    unknown = set(wanted) - set(entry["partition_by"])
+    if unknown:
+        raise ValueError(f"{sorted(unknown)} are not partition columns of {table_name}")
+
+    files = [
+        root / path
+        for partition in entry["partitions"]
+        if all(partition["values"][col] in values for col, values in wanted.items())
+        for path in partition["files"]
+    ]
+    if not files:
+        lazy = pl.LazyFrame(schema=export_schema(table_name))
+    else:
+        lazy = pl.scan_parquet(files, hive_partitioning=False)
+    return lazy.select(columns) if columns else lazy
+
+
+def scan_votes(root: Path = EXPORT_DIR, **partition_values) -> pl.LazyFrame:
+    """
+    Votes joined with their event and bancada, e.g. for all the votes of one
+    congresista over a period:
+
+        scan_votes(leg_period=LegPeriod.PERIODO_2021_2026).filter(pl.col("voter_id") == 1112)
+    """
+    votes = scan_table("votes", root, **partition_values)
+    events = scan_table(
+        "vote_events",
+        root,
+        columns=["id", "bill_id", "date", "org_id"],
+        **partition_values,
+    )
+    bancadas = scan_table("bancadas", root, columns=["bancada_id", "bancada_name"])
+    return votes.join(events, left_on="vote_event_id", right_on="id", how="left").join(
+        bancadas, on="bancada_id", how="left"
+    )
@@ -0,0 +1,437 @@
+"""
+Congresista × vote event matrices for roll-call analyses.
+
+The votes of a legislative period are compiled into a dense int8 matrix, one
+row per congresista and one column per vote event, holding the codes in
+VOTE_OPTION_CODES (NO_VOTE_CODE where a congresista didn't take part in an
+event). Each matrix is saved as a `.npy` file plus a `.json` file with the ids
+of its rows and columns.
+
+Matrices are stored in Fortran (column major) order, so every vote event is a
+contiguous block of bytes: new events are appended at the end of the file and
+only the shape in the header is rewritten. The `.json` file is replaced last,
+so it is what commits an append: columns beyond the ones it lists were left by
+an interrupted append and are truncated when the matrix is opened. Reopening
+a matrix memory-maps it, so analytics jobs start without reading it and
+processes share its pages.
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import Connection, select
+
+from estecon.backend import NO_VOTE_CODE, VOTE_OPTION_CODES, LegPeriod
+from estecon.backend.config import directories
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import chunked, get_engine
+
+MATRIX_DIR = directories.PROCESSED_DATA / "vote_matrix"
+VOTES = Base.metadata.tables["votes"]
+VOTE_EVENTS = Base.metadata.tables["vote_events"]
+
+
+class VoteMatrix:
+    """
+    Votes of a legislative period as a congresista × vote event matrix.
+
+    Attributes:
+        leg_period (LegPeriod): Legislative period of the vote events.
+        matrix (np.ndarray): int8 matrix of vote codes, possibly memory-mapped.
+        voter_ids (List[int]): Congresista of each row, sorted.
+        event_ids (List[str]): Vote event of each column. Columns are sorted by
+            date when the matrix is built, later events are appended in the
+            order they are loaded.
+        event_dates (List[str]): ISO date of each column's vote event.
+    """
+
+    def __init__(
+        self,
+        leg_period: LegPeriod,
+        matrix: np.ndarray,
+        voter_ids: List[int],
+        event_ids: List[str],
+        event_dates: List[str],
+    ):
+        self.leg_period = LegPeriod(leg_period)
+        self.matrix = matrix
+        self.voter_ids = voter_ids
+        self.event_ids = event_ids
+        self.event_dates = event_dates
+        self.voter_index = {voter_id: i for i, voter_id in enumerate(voter_ids)}
+        self.event_index = {event_id: j for j, event_id in enumerate(event_ids)}
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape
+
+    def voter_votes(self, voter_id: int) -> np.ndarray:
+        """
+        Codes of a congresista's votes, one per vote event.
+        """
+        return self.matrix[self.voter_index[voter_id]]
+
+    def event_votes(self, event_id: str) -> np.ndarray:
+        """
+        Codes of the votes of a vote event, one per congresista.
+        """
+        return self.matrix[:, self.event_index[event_id]]
+
+    def metadata(self) -> dict:
+        return {
+            "leg_period": self.leg_period.value,
+            "voter_ids": self.voter_ids,
+            "event_ids": self.event_ids,
+            "event_dates": self.event_dates,
+            "codes": {option.value: code for option, code in VOTE_OPTION_CODES.items()},
+            "no_vote_code": NO_VOTE_CODE,
+        }
+
+
+def period_slug(leg_period: LegPeriod) -> str:
+    """
+    File name friendly label of a period, e.g. "parlamentario_2021_2026".
+    """
+    return re.sub(r"\W+", "_", LegPeriod(leg_period).value).strip("_").lower()
+
+
+def matrix_paths(leg_period: LegPeriod, root: Path = MATRIX_DIR) -> Tuple[Path, Path]:
+    """
+    Paths of the .npy and .json files of a period's matrix.
+    """
+    slug = period_slug(leg_period)
+    return root / f"votes_{slug}.npy", root / f"votes_{slug}.json"
+
+
+def get_period_events(
+    conn: Connection, leg_period: LegPeriod
+) -> List[Tuple[str, datetime]]:
+    """
+    Returns the (id, date) of the vote events of a period, sorted by date.
+    """
+    query = (
+        select(VOTE_EVENTS.c.id, VOTE_EVENTS.c.date)
+        .where(VOTE_EVENTS.c.leg_period == LegPeriod(leg_period))
+        .order_by(VOTE_EVENTS.c.date, VOTE_EVENTS.c.id)
+    )
+    return [(event_id, date) for event_id, date in conn.execute(query)]
+
+
+def get_event_votes(
+    conn: Connection, event_ids: Sequence[str]
+) -> List[Tuple[int, str, int]]:
+    """
+    Returns the (voter_id, vote_event_id, code) of every vote of the given events.
+    """
+    votes = []
+    for chunk in chunked(list(event_ids)):
+        query = select(VOTES.c.voter_id, VOTES.c.vote_event_id, VOTES.c.option).where(
+            VOTES.c.vote_event_id.in_(chunk)
+        )
+        votes.extend(
+            (voter_id, event_id, VOTE_OPTION_CODES[option])
+            for voter_id, event_id, option in conn.execute(query)
+        )
+    return votes
+
+
+def fill_matrix(
+    matrix: np.ndarray,
+    votes: Iterable[Tuple[int, str, int]],
+    voter_index: Dict[int, int],
+    event_index: Dict[str, int],
+):
+    """
+    Writes vote codes into a matrix, in place.
+    """
+    votes = list(votes)
+    if not votes:
+        return
+    voter_ids, event_ids, codes = zip(*votes)
+    rows = np.fromiter(
+        (voter_index[v] for v in voter_ids), dtype=np.intp, count=len(votes)
+    )
+    cols = np.fromiter(
+        (event_index[e] for e in event_ids), dtype=np.intp, count=len(votes)
+    )
+    matrix[rows, cols] = np.asarray(codes, dtype=np.int8)
+
+
+def build_vote_matrix(conn: Connection, leg_period: LegPeriod) -> VoteMatrix:
+    """
+    Compiles the votes of a period into a VoteMatrix held in memory.
+    """
+    events = get_period_events(conn, leg_period)
+    event_ids = [event_id for event_id, _ in events]
+    votes = get_event_votes(conn, event_ids)
+    voter_ids = sorted({voter_id for voter_id, _, _ in votes})
+
+    vote_matrix = VoteMatrix(
+        leg_period,
+        np.full(
+            (len(voter_ids), len(event_ids)), NO_VOTE_CODE, dtype=np.int8, order="F"
+        ),
+        voter_ids,
+        event_ids,
+        [date.date().isoformat() for _, date in events],
+    )
+    fill_matrix(
+        vote_matrix.matrix, votes, vote_matrix.voter_index, vote_matrix.event_index
+    )
+    return vote_matrix
+
+
+def _write_json(path: Path, data: dict):
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_npy_header(f) -> Tuple[Tuple[int, int], Tuple[int, ...], bool, np.dtype, int]:
+    """
+    Reads the header of an open .npy file. Returns its format version, the
+    shape, whether it's in Fortran order, the dtype and the offset of the data.
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    return version, shape, fortran_order, dtype, f.tell()
+
+
+def _npy_header(
+    version: Tuple[int, int], shape: Tuple[int, ...], dtype: np.dtype
+) -> bytes:
+    header = io.BytesIO()
+    header_info = {
+        "shape": shape,
+        "fortran_order": True,
+        "descr": np.lib.format.dtype_to_descr(dtype),
+    }
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(header, header_info)
+    else:
+        np.lib.format.write_array_header_2_0(header, header_info)
+    return header.getvalue()
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def truncate_npy_columns(path: Path, n_columns: int) -> bool:
+    """
+    Cuts a Fortran ordered 2D .npy file down to its first `n_columns` columns,
+    dropping what an interrupted append left after them. Returns whether the
+    file had to be changed.
+    """
+    with open(path, "r+b") as f:
+        version, shape, fortran_order, dtype, data_offset = _read_npy_header(f)
+        size = data_offset + shape[0] * n_columns * dtype.itemsize
+        if shape[1:] == (n_columns,) and os.fstat(f.fileno()).st_size == size:
+            return False
+        if not fortran_order or len(shape) != 2 or shape[1] < n_columns:
+            raise ValueError(
+                f"Can't truncate {path} ({shape} {dtype}, fortran_order={fortran_order}) "
+                f"to {n_columns} columns"
+            )
+        header = _npy_header(version, (shape[0], n_columns), dtype)
+        if len(header) == data_offset:
+            f.seek(0)
+            f.write(header)
+            f.truncate(size)
+            _sync(f)
+            return True
+
+    old = np.load(path, mmap_mode="r")
+    tmp_path = path.with_suffix(".npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asfortranarray(old[:, :n_columns]))
+        _sync(f)
+    del old
+    os.replace(tmp_path, path)
+    return True
+
+
+def save_vote_matrix(vote_matrix: VoteMatrix, root: Path = MATRIX_DIR) -> Path:
+    """
+    Saves a matrix and its id maps. Returns the path of the .npy file.
+
+    The old id maps are removed first, so that an interrupted save leaves no
+    matrix at all rather than a matrix labelled with the ids of another one.
+    """
+    npy_path, json_path = matrix_paths(vote_matrix.leg_period, root)
+    root.mkdir(parents=True, exist_ok=True)
+    json_path.unlink(missing_ok=True)
+    tmp_path = npy_path.with_suffix(".npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asfortranarray(vote_matrix.matrix, dtype=np.int8))
+        _sync(f)
+    os.replace(tmp_path, npy_path)
+    _write_json(json_path, vote_matrix.metadata())
+    return npy_path
+
+
+def open_vote_matrix(
+    leg_period: LegPeriod, root: Path = MATRIX_DIR, mmap_mode: Optional[str] = "r"
+) -> VoteMatrix:
+    """
+    Opens a saved matrix, memory-mapped (read only) by default.
+    """
+    npy_path, json_path = matrix_paths(leg_period, root)
+    meta = json.loads(json_path.read_text(encoding="utf-8"))
+    if truncate_npy_columns(npy_path, len(meta["event_ids"])):
+        logger.warning(f"Dropped the columns of an interrupted append from {npy_path}")
+    matrix = np.load(npy_path, mmap_mode=mmap_mode)
+    if matrix.shape != (len(meta["voter_ids"]), len(meta["event_ids"])):
+        raise ValueError(
+            f"{npy_path} has shape {matrix.shape}, which doesn't match its id maps in {json_path}"
+        )
+    return VoteMatrix(
+        meta["leg_period"],
+        matrix,
+        meta["voter_ids"],
+        meta["event_ids"],
+        meta["event_dates"],
+    )
+
+
+def append_npy_columns(path: Path, columns: np.ndarray):
+    """
+    Appends columns to a Fortran ordered 2D .npy file in place: the new data is
+    written at the end of the file and only the shape in the header changes.
+    Falls back to rewriting the file if the new header doesn't fit in the old one.
+    Both are synced to disk before returning.
+    """
+    with open(path, "r+b") as f:
+        version, shape, fortran_order, dtype, data_offset = _read_npy_header(f)
+        if (
+            not fortran_order
+            or len(shape) != 2
+            or shape[0] != columns.shape[0]
+            or dtype != columns.dtype
+        ):
+            raise ValueError(
+                f"Can't append {columns.shape} {columns.dtype} columns to {path} "
+                f"({shape} {dtype}, fortran_order={fortran_order})"
+            )
+
+        header = _npy_header(version, (shape[0], shape[1] + columns.shape[1]), dtype)
+        if len(header) == data_offset:
+            # Data first, so an interrupted append leaves the old matrix readable
+            f.seek(data_offset + shape[0] * shape[1] * dtype.itemsize)
+            f.write(columns.tobytes(order="F"))
+            f.truncate()
+            _sync(f)
+            f.seek(0)
+            f.write(header)
+            _sync(f)
+            return
+
+    old = np.load(path)
+    tmp_path = path.with_suffix(".npy.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asfortranarray(np.concatenate([old, columns], axis=1)))
+        _sync(f)
+    os.replace(tmp_path, path)
+
+
+def update_vote_matrix(
+    conn: Connection, leg_period: LegPeriod, root: Path = MATRIX_DIR
+) -> VoteMatrix:
+    """
+    Brings the saved matrix of a period up to date with the database and
+    returns it memory-mapped.
+
+    Vote events that aren't in the matrix yet are appended as new columns. If
+    they bring congresistas that aren't rows of the matrix (e.g. a substitute),
+    or there is no saved matrix, the whole matrix is rebuilt.
+    """
+    npy_path, json_path = matrix_paths(leg_period, root)
+    if not npy_path.exists() or not json_path.exists():
+        logger.info(f"Building the vote matrix of {LegPeriod(leg_period).value}")
+        save_vote_matrix(build_vote_matrix(conn, leg_period), root)
+        return open_vote_matrix(leg_period, root)
+
+    current = open_vote_matrix(leg_period, root)
+    new_events = [
+        (event_id, date)
+        for event_id, date in get_period_events(conn, leg_period)
+        if event_id not in current.event_index
+    ]
+    if not new_events:
+        return current
+
+    new_event_ids = [event_id for event_id, _ in new_events]
+    votes = get_event_votes(conn, new_event_ids)
+    if any(voter_id not in current.voter_index for voter_id, _, _ in votes):
+        logger.info(
+            f"New congresistas voted in {LegPeriod(leg_period).value}, rebuilding its vote matrix"
+        )
+        del current
+        save_vote_matrix(build_vote_matrix(conn, leg_period), root)
+        return open_vote_matrix(leg_period, root)
+
+    columns = np.full(
+        (len(current.voter_ids), len(new_events)),
+        NO_VOTE_CODE,
+        dtype=np.int8,
+        order="F",
+    )
+    fill_matrix(
+        columns,
+        votes,
+        current.voter_index,
+        {event_id: j for j, event_id in enumerate(new_event_ids)},
+    )
+    meta = current.metadata()
+    meta["event_ids"] += new_event_ids
+    meta["event_dates"] += [date.date().isoformat() for _, date in new_events]
+    del current
+
+    # The metadata goes last: until it's replaced, opening the matrix drops the
+    # appended columns
+    append_npy_columns(npy_path, columns)
+    _write_json(json_path, meta)
+    logger.info(
+        f"Appended {len(new_events)} vote events to the vote matrix of {LegPeriod(leg_period).value}"
+    )
+    return open_vote_matrix(leg_period, root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the vote matrices")
+    parser.add_argument(
+        "--period",
+        type=LegPeriod,
+        action="append",
+        help="legislative period, e.g. 'Parlamentario 2021 - 2026' (all by default)",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the matrices from scratch"
+    )
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        for period in args.period or list(LegPeriod):
+            if args.rebuild:
+                vote_matrix = build_vote_matrix(conn, period)
+                save_vote_matrix(vote_matrix)
+            else:
+                vote_matrix = update_vote_matrix(conn, period)
+            logger.info(
+                f"{period.value}: {vote_matrix.shape[0]} congresistas × {vote_matrix.shape[1]} vote events"
+            )
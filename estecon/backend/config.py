@@ -13,12 +13,14 @@ class Directories:
         RAW_DATA (Path): The directory containing raw data.
         PROCESSED_DATA (Path): The directory containing processed data.
         LOGS (Path): The directory containing logs.
+        OCR_CACHE (Path): The directory with the OCR text of the scraped PDFs.
     """
     ROOT_DIR = Path(__file__).resolve().parent
     DATA = ROOT_DIR / "data"
     RAW_DATA = DATA / "raw"
     PROCESSED_DATA = DATA / "processed"
     LOGS = ROOT_DIR / "logs"
+    OCR_CACHE = ROOT_DIR.parent / "data" / "ocr_cache"
 
     def __init__(self):
         for dir in [self.DATA, self.RAW_DATA, self.PROCESSED_DATA, self.LOGS]:
@@ -41,6 +43,27 @@ class Settings(BaseSettings):
     """
     # This should change depending on where the DB will be stored
     DB_URL: str = os.getenv("DB_URL", f"sqlite:///{directories.RAW_DATA.as_posix()}/openperu.db")
+    # Connection pool of the shared engine (see database/session.py)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: bool = False
+    # Use WAL journaling on SQLite so readers don't block the loaders
+    SQLITE_WAL: bool = True
+    # Result cache of the read queries (see database/queries.py)
+    QUERY_CACHE_SIZE: int = 4096
+    QUERY_CACHE_TTL: float = 300.0
+    # Memory the rendered PDF pages waiting for OCR can take, over all the
+    # renderers (see scrapers/memory_governor.py), and their resolution
+    OCR_MEMORY_BUDGET_MB: int = 2048
+    OCR_DPI: int = 300
+    # Hot path metrics (see metrics.py), written as a Prometheus textfile, or
+    # as JSON if the path ends in .json, every METRICS_INTERVAL seconds
+    METRICS_ENABLED: bool = False
+    METRICS_PATH: str = (directories.LOGS / "estecon.prom").as_posix()
+    METRICS_INTERVAL: float = 15.0
     # Uncomment this 
     # AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID")
     # AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY")
@@ -1,15 +1,43 @@
-import os
-from eralchemy import render_er
-from sqlalchemy import create_engine
+import argparse
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import Engine
 from estecon.backend.database.models import Base
-from estecon.backend.config import settings
+from estecon.backend.database.session import get_engine
 
-connect_args = {"check_same_thread": False} if os.getenv("ENV") == "dev" else {}
-engine = create_engine(
-    settings.DB_URL,
-    connect_args=connect_args,
-)
-Base.metadata.create_all(engine)
+SCHEMA_GRAPH = Path(__file__).resolve().parent / "schema_graph.png"
 
 
-render_er(Base, 'estecon/backend/database/schema_graph.png')
\ No newline at end of file
+def create_schema(engine: Optional[Engine] = None):
+    """
+    Creates the tables of the data model that don't exist yet.
+    """
+    Base.metadata.create_all(engine or get_engine())
+
+
+def render_erd(output: Path = SCHEMA_GRAPH):
+    """
+    Renders the entity relationship diagram of the data model.
+    """
+    from eralchemy import render_er
+
+    render_er(Base, str(output))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the database schema and/or render its ERD"
+    )
+    parser.add_argument(
+        "--create", action="store_true", help="create the tables in settings.DB_URL"
+    )
+    parser.add_argument(
+        "--render", action="store_true", help="render the ERD to --output"
+    )
+    parser.add_argument("--output", type=Path, default=SCHEMA_GRAPH)
+    args = parser.parse_args()
+
+    if args.create:
+        create_schema()
+    if args.render:
+        render_erd(args.output)
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from sqlalchemy import (Column, Integer, String, Enum, Boolean, DateTime, 
                         ForeignKey, UniqueConstraint, PrimaryKeyConstraint,
                         Index)
@@ -8,6 +10,19 @@ from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+
+def utcnow() -> datetime:
+    """
+    Current UTC time, naive as the DateTime columns store it.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# congresistas, organizations and committees are keyed by more than one column,
+# so the columns pointing at them (voter_id, person_id, org_id, committee_id...)
+# are plain columns: PostgreSQL only accepts foreign keys to unique columns.
+
+
 class Vote(Base):
     '''
     Represents a vote in a parliament session.
@@ -21,7 +36,7 @@ class Vote(Base):
     __tablename__ = 'votes'
 
     vote_event_id = Column(String, ForeignKey('vote_events.id'), primary_key=True)
-    voter_id = Column(Integer, ForeignKey('congresistas.id'), nullable=False)
+    voter_id = Column(Integer, primary_key=True)
     option = Column(Enum(VoteOption, name = "option"), nullable=False)
     bancada_id = Column(Integer, ForeignKey('bancadas.bancada_id'), nullable=False)
 
@@ -42,7 +57,7 @@ class VoteEvent(Base):
     __tablename__ = 'vote_events'
 
     id = Column(String, primary_key=True)
-    org_id = Column(Integer, ForeignKey('organizations.org_id'), nullable=False)
+    org_id = Column(Integer, nullable=False)
     leg_period = Column(Enum(LegPeriod, name = "leg_period"), nullable=False)
     bill_id = Column(String, ForeignKey('bills.id'), nullable=False)
     date = Column(DateTime, nullable=False)
@@ -63,7 +78,7 @@ class VoteCounts(Base):
     '''
     __tablename__ = 'vote_counts'
 
-    org_id = Column(Integer, ForeignKey('organizations.org_id'), nullable=False)
+    org_id = Column(Integer, nullable=False)
     vote_event_id = Column(String, ForeignKey('vote_events.id'), nullable=False)
     option = Column(Enum(VoteOption, name = "option"), nullable=False)
     bancada_id =  Column(Integer, ForeignKey('bancadas.bancada_id'), nullable=False)
@@ -86,9 +101,9 @@ class Attendance(Base):
     '''
     __tablename__ = 'attendance'
 
-    org_id = Column(Integer, ForeignKey('organizations.org_id'), nullable=False)
+    org_id = Column(Integer, nullable=False)
     event_id = Column(String, ForeignKey('vote_events.id'), primary_key=True)
-    attendee_id = Column(Integer, ForeignKey('congresistas.id'), nullable=False)
+    attendee_id = Column(Integer, primary_key=True)
     status = Column(Enum(AttendanceStatus, name='attendance_status'), nullable=False)
 
     __table_args__ = (UniqueConstraint('org_id', 'event_id', 'attendee_id', name='uq_attendance'),
@@ -126,7 +141,7 @@ class Bill(Base):
     complete_text = Column(String, nullable=False)
     status = Column(String, nullable=False)
     proponent = Column(Enum(Proponents, name = "proponent"), nullable=False)
-    author_id = Column(Integer, ForeignKey('congresistas.id'), nullable=True)
+    author_id = Column(Integer, nullable=True)
     bancada_id = Column(Integer, ForeignKey('bancadas.bancada_id'), nullable=True)
     bill_approved = Column(Boolean, nullable=False)
 
@@ -143,12 +158,14 @@ class BillCongresistas(Base):
         bill_id (str): A unique identifier for the bill.
         person_id (str): A unique identifier for the person.
         role_type (str): The type of role that the person has in the bill (e.g. author, coauthor, adherente, etc) 
+        loaded_at (datetime): When the row was last inserted or changed, in UTC.
     '''
     __tablename__ = "bills_congresistas"
     
     bill_id = Column(String, ForeignKey('bills.id'), nullable = False)
-    person_id = Column(Integer, ForeignKey('congresistas.id'), nullable = False)
+    person_id = Column(Integer, nullable=False)
     role_type = Column(Enum(RoleTypeBill, name="role_type"), nullable = False)
+    loaded_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow)
 
     __table_args__ = (PrimaryKeyConstraint('bill_id', 'person_id'),
                       Index('ix_billcongresistas_person_id', 'person_id'))
@@ -174,7 +191,11 @@ class BillStep(Base):
     step_detail = Column(String, nullable=False)
     step_url = Column(String, nullable=False)
 
-    __table_args__ = (Index('ix_billstep_bill_id', 'bill_id'),)
+    __table_args__ = (
+        UniqueConstraint("bill_id", "step_date", "step_detail", name="uq_bill_step"),
+        Index("ix_billstep_bill_id", "bill_id"),
+    )
+
 
 class BillCommittees(Base):
     '''
@@ -187,7 +208,7 @@ class BillCommittees(Base):
     __tablename__ = "bill_committees"
 
     bill_id = Column(String, ForeignKey('bills.id'), nullable=False)
-    committee_id = Column(Integer, ForeignKey('committees.id'), nullable=False)
+    committee_id = Column(Integer, nullable=False)
 
     __table_args__ = (PrimaryKeyConstraint('bill_id', 'committee_id'),
                       UniqueConstraint('bill_id', 'committee_id', name='bill_committee_uniq'),
@@ -207,8 +228,10 @@ class Committee(Base):
     __tablename__ = 'committees'
 
     leg_period = Column(Enum(LegPeriod, name = "leg_period"), primary_key=True, nullable=False)
-    leg_year = Column(Enum(LegislativeYear, name = "leg_period"), primary_key=True, nullable=False)
-    org_id = Column(Integer, ForeignKey('organizations.org_id'), nullable=False)
+    leg_year = Column(
+        Enum(LegislativeYear, name="leg_year"), primary_key=True, nullable=False
+    )
+    org_id = Column(Integer, nullable=False)
     id = Column(Integer, primary_key=True, nullable=False)
     name = Column(String, nullable=False)
 
@@ -257,6 +280,9 @@ class Party(Base):
     party_id = Column(Integer, primary_key = True)
     party_name= Column(String, nullable = False)
 
+    __table_args__ = (UniqueConstraint("leg_period", "party_name", name="party_uniq"),)
+
+
 class Bancada(Base):
     '''
     Represent a Bancada in the peruvian government
@@ -268,10 +294,15 @@ class Bancada(Base):
     '''
     __tablename__ = "bancadas"
 
-    leg_year = Column(Enum(LegislativeYear, name = "leg_period"), nullable=False)
+    leg_year = Column(Enum(LegislativeYear, name="leg_year"), nullable=False)
     bancada_id = Column(Integer, primary_key = True)
     bancada_name= Column(String, nullable = False)
 
+    __table_args__ = (
+        UniqueConstraint("leg_year", "bancada_name", name="bancada_uniq"),
+    )
+
+
 class Organization(Base):
     '''
     Represents a legislative organization, such as a parliament or congress.
@@ -311,8 +342,8 @@ class Membership(Base):
 
     id = Column(Integer, primary_key = True)
     role = Column(Enum(RoleOrganization, name = "role"), nullable = False)
-    person_id = Column(Integer, ForeignKey('congresistas.id'), nullable = False)
-    org_id = Column(Integer, ForeignKey('organizations.org_id'), nullable = False)
+    person_id = Column(Integer, nullable=False)
+    org_id = Column(Integer, nullable=False)
     start_date = Column(DateTime, nullable = False)
     end_date = Column(DateTime, nullable = True)
 
@@ -332,5 +363,27 @@ class BancadaMembership(Base):
 
     id = Column(Integer, primary_key = True)
     leg_year = Column(Enum(LegislativeYear, name = 'leg_year'), nullable = False)
-    person_id = Column(Integer, ForeignKey('congresistas.id'), nullable = False)
+    person_id = Column(Integer, nullable=False)
     bancada_id = Column(Integer, ForeignKey('bancadas.bancada_id'), nullable = False)
+
+
+class IngestHash(Base):
+    """
+    Content hash of the last version of a row written by the upsert loader. Used
+    to skip rows that haven't changed between re-ingestions.
+
+    Attributes:
+        table_name (str): Name of the table the row belongs to.
+        row_key (str): Natural key of the row, joined with "|".
+        row_hash (str): Hash of the non-key columns of the row.
+    """
+
+    __tablename__ = "ingest_hashes"
+
+    table_name = Column(String, nullable=False)
+    row_key = Column(String, nullable=False)
+    row_hash = Column(String, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("table_name", "row_key", name="pk_ingest_hashes"),
+    )
@@ -0,0 +1,302 @@
+"""
+Read queries used by the frontend and the notebooks.
+
+The few questions asked over and over (a bill's timeline, a congresista's votes,
+the breakdown of a vote event, the bills signed by a congresista) are prebuilt
+statements with bound parameters, so SQLAlchemy compiles each of them once, and
+every one of them is served by an index of the data model. Results are kept in
+an LRU cache with a TTL whose entries are tagged by entity, and the loaders
+invalidate the tags of the entities they write. Results read while a load was
+committing are not cached, see `ResultCache.set`.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Engine, bindparam, select
+
+from estecon.backend.config import settings
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import get_engine
+
+BILLS = Base.metadata.tables["bills"]
+BILL_STEPS = Base.metadata.tables["bill_steps"]
+BILLS_CONGRESISTAS = Base.metadata.tables["bills_congresistas"]
+VOTES = Base.metadata.tables["votes"]
+VOTE_EVENTS = Base.metadata.tables["vote_events"]
+VOTE_COUNTS = Base.metadata.tables["vote_counts"]
+
+Tag = Tuple[str, Hashable]
+
+# ix_billstep_bill_id
+BILL_TIMELINE = (
+    select(BILL_STEPS)
+    .where(BILL_STEPS.c.bill_id == bindparam("bill_id"))
+    .order_by(BILL_STEPS.c.step_date, BILL_STEPS.c.id)
+)
+
+# ix_vote_voter_id, then the vote_events primary key
+CONGRESISTA_VOTES = (
+    select(
+        VOTES.c.vote_event_id,
+        VOTES.c.option,
+        VOTES.c.bancada_id,
+        VOTE_EVENTS.c.bill_id,
+        VOTE_EVENTS.c.date,
+        VOTE_EVENTS.c.leg_period,
+    )
+    .join(VOTE_EVENTS, VOTES.c.vote_event_id == VOTE_EVENTS.c.id)
+    .where(VOTES.c.voter_id == bindparam("voter_id"))
+    .order_by(VOTE_EVENTS.c.date)
+)
+
+# ix_votecounts_vote_event_id
+VOTE_EVENT_BREAKDOWN = (
+    select(VOTE_COUNTS.c.bancada_id, VOTE_COUNTS.c.option, VOTE_COUNTS.c.count)
+    .where(VOTE_COUNTS.c.vote_event_id == bindparam("vote_event_id"))
+    .order_by(VOTE_COUNTS.c.bancada_id, VOTE_COUNTS.c.option)
+)
+
+# ix_billcongresistas_person_id, then the bills primary key
+BILLS_BY_AUTHOR = (
+    select(
+        BILLS.c.id,
+        BILLS.c.title,
+        BILLS.c.presentation_date,
+        BILLS.c.status,
+        BILLS_CONGRESISTAS.c.role_type,
+    )
+    .join(BILLS, BILLS_CONGRESISTAS.c.bill_id == BILLS.c.id)
+    .where(BILLS_CONGRESISTAS.c.person_id == bindparam("person_id"))
+    .order_by(BILLS.c.presentation_date.desc())
+)
+
+# Entity tags touched by the rows written to each table: (tag name, column)
+TABLE_TAGS = {
+    "bills": [("bill", "id"), ("author", "author_id")],
+    "bill_steps": [("bill", "bill_id")],
+    "bills_congresistas": [("author", "person_id")],
+    "votes": [("congresista", "voter_id"), ("vote_event", "vote_event_id")],
+    "vote_counts": [("vote_event", "vote_event_id")],
+    "vote_events": [("vote_event", "id")],
+}
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a time to live, whose entries are tagged by the
+    entities they depend on so they can be invalidated by entity key.
+
+    Every invalidation bumps a generation counter and records it for each of
+    its tags. Readers take the generation before querying and pass it to
+    `set`, which refuses results whose tags were invalidated in the meantime,
+    since they may have been read before the write committed.
+
+    Attributes:
+        maxsize (int): Maximum number of cached results.
+        ttl (float): Seconds a result stays valid.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.QUERY_CACHE_SIZE,
+        ttl: float = settings.QUERY_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._tags: Dict[Tag, Set[Hashable]] = {}
+        # Generation of the last invalidation of each tag
+        self._generation = 0
+        self._invalidated: Dict[Tag, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, object]:
+        """
+        Returns (True, value) on a hit and (False, None) on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self._clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def generation(self) -> int:
+        """
+        Current generation, to pass to `set` for a result about to be read.
+        """
+        with self._lock:
+            return self._generation
+
+    def set(
+        self,
+        key: Hashable,
+        value: object,
+        tags: Iterable[Tag] = (),
+        generation: Optional[int] = None,
+    ) -> bool:
+        """
+        Caches a result. If `generation` is given and any of the tags was
+        invalidated after it, the result may be stale and is not cached.
+        Returns whether the result was cached.
+        """
+        tags = tuple(tags)
+        with self._lock:
+            if generation is not None and any(
+                self._invalidated.get(tag, 0) > generation for tag in tags
+            ):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, tags: Iterable[Tag]) -> int:
+        """
+        Drops every result tagged with any of the given tags. Returns the number
+        of results dropped.
+        """
+        dropped = 0
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self._generation
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        dropped += 1
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+result_cache = ResultCache()
+
+
+def tags_for_rows(table_name: str, rows: Iterable[dict]) -> Set[Tag]:
+    """
+    Returns the entity tags affected by writing the given rows into a table.
+    """
+    columns = TABLE_TAGS.get(table_name, [])
+    return {
+        (tag, row[col])
+        for row in rows
+        for tag, col in columns
+        if row.get(col) is not None
+    }
+
+
+class QueryService:
+    """
+    Cached read queries over the data model.
+
+    Attributes:
+        engine (Engine): Engine of the database to read from.
+        cache (ResultCache): Cache of the results, shared with the loaders by default.
+    """
+
+    def __init__(
+        self, engine: Optional[Engine] = None, cache: Optional[ResultCache] = None
+    ):
+        self.engine = engine or get_engine()
+        self.cache = cache if cache is not None else result_cache
+        self._db_key = str(self.engine.url)
+
+    def _fetch(
+        self,
+        name: str,
+        statement,
+        params: dict,
+        tags: List[Tag],
+        row_tags: Iterable[Tuple[str, str]] = (),
+    ) -> List[dict]:
+        """
+        Runs a statement through the cache. The result is tagged with `tags`
+        plus, for every row, the (tag name, column) pairs of `row_tags`, for
+        results that also depend on the rows of other entities.
+        """
+        key = (name, self._db_key, tuple(sorted(params.items())))
+        hit, value = self.cache.get(key)
+        if hit:
+            return list(value)
+        generation = self.cache.generation()
+        with self.engine.connect() as conn:
+            rows = tuple(
+                dict(row) for row in conn.execute(statement, params).mappings()
+            )
+        tags = set(tags) | {(tag, row[col]) for row in rows for tag, col in row_tags}
+        self.cache.set(key, rows, tags, generation)
+        return list(rows)
+
+    def bill_timeline(self, bill_id: str) -> List[dict]:
+        """
+        Steps of a bill in chronological order.
+        """
+        return self._fetch(
+            "bill_timeline", BILL_TIMELINE, {"bill_id": bill_id}, [("bill", bill_id)]
+        )
+
+    def congresista_votes(self, voter_id: int) -> List[dict]:
+        """
+        Every vote of a congresista, with the bill and date of the vote event.
+        """
+        return self._fetch(
+            "congresista_votes",
+            CONGRESISTA_VOTES,
+            {"voter_id": voter_id},
+            [("congresista", voter_id)],
+            row_tags=[("vote_event", "vote_event_id")],
+        )
+
+    def vote_event_breakdown(self, vote_event_id: str) -> List[dict]:
+        """
+        Number of votes per bancada and option of a vote event.
+        """
+        return self._fetch(
+            "vote_event_breakdown",
+            VOTE_EVENT_BREAKDOWN,
+            {"vote_event_id": vote_event_id},
+            [("vote_event", vote_event_id)],
+        )
+
+    def bills_by_author(self, person_id: int) -> List[dict]:
+        """
+        Bills signed by a congresista, newest first, with the role they signed with.
+        """
+        return self._fetch(
+            "bills_by_author",
+            BILLS_BY_AUTHOR,
+            {"person_id": person_id},
+            [("author", person_id)],
+            row_tags=[("bill", "id")],
+        )
@@ -0,0 +1,126 @@
+"""
+Persistent ids of parties and bancadas.
+
+Parties are identified by (leg_period, party_name) and bancadas by
+(leg_year, bancada_name), both unique in the data model. A registry hands out
+the id of a name, creating its row the first time it's seen: the database
+allocates the id, and `INSERT ... ON CONFLICT DO NOTHING` on the unique key
+means concurrent scrapes asking for the same new name end up with the same row.
+Ids don't depend on scrape order and survive restarts, so a single period can
+be scraped again without rebuilding everything. Known ids are cached in memory.
+"""
+
+import threading
+from enum import Enum
+from typing import Dict, Hashable, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Engine, Table, inspect, select
+
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import dialect_insert, get_engine
+
+
+class IdRegistry:
+    """
+    Read-through cache of the ids of a table keyed by (scope, name).
+
+    Attributes:
+        table (Table): Table holding the ids.
+        scope_column (str): Column scoping the names, e.g. the legislative period.
+        name_column (str): Column with the names.
+        engine (Optional[Engine]): Engine of the database, the shared one if None.
+    """
+
+    def __init__(
+        self,
+        table: Table,
+        scope_column: str,
+        name_column: str,
+        engine: Optional[Engine] = None,
+    ):
+        self.table = table
+        self.scope_column = table.c[scope_column]
+        self.name_column = table.c[name_column]
+        self.id_column = list(table.primary_key.columns)[0]
+        self.engine = engine
+        self._ids: Dict[Tuple[Hashable, str], int] = {}
+        self._lock = threading.Lock()
+        self._table_created = False
+
+    def _get_engine(self) -> Engine:
+        return self.engine or get_engine()
+
+    def get_id(self, scope: Enum, name: str) -> int:
+        """
+        Returns the id of a name, creating its row if it's new.
+        """
+        scope = self.scope_column.type.enum_class(scope)
+        key = (scope, name)
+        if key in self._ids:
+            return self._ids[key]
+        with self._lock:
+            if key not in self._ids:
+                self._ids[key] = self._get_or_create(scope, name)
+            return self._ids[key]
+
+    def _get_or_create(self, scope: Enum, name: str) -> int:
+        with self._get_engine().begin() as conn:
+            if not self._table_created:
+                Base.metadata.create_all(conn, tables=[self.table])
+                self._table_created = True
+            insert = (
+                dialect_insert(conn, self.table)
+                .values({self.scope_column.name: scope, self.name_column.name: name})
+                .on_conflict_do_nothing(
+                    index_elements=[self.scope_column, self.name_column]
+                )
+            )
+            created = conn.execute(insert).rowcount > 0
+            id_ = conn.execute(
+                select(self.id_column).where(
+                    self.scope_column == scope, self.name_column == name
+                )
+            ).scalar_one()
+        if created:
+            logger.info(
+                f"New {self.table.name} entry: {name} ({scope.value}) with ID {id_}"
+            )
+        return id_
+
+    def preload(self, scope: Optional[Enum] = None) -> int:
+        """
+        Loads the known ids, of a single scope if given, into the cache.
+        Returns the number of ids loaded.
+        """
+        query = select(self.scope_column, self.name_column, self.id_column)
+        if scope is not None:
+            query = query.where(
+                self.scope_column == self.scope_column.type.enum_class(scope)
+            )
+        with self._get_engine().connect() as conn:
+            rows = (
+                conn.execute(query).all()
+                if inspect(conn).has_table(self.table.name)
+                else []
+            )
+        with self._lock:
+            self._ids.update({(row_scope, name): id_ for row_scope, name, id_ in rows})
+        return len(rows)
+
+    def clear(self):
+        """
+        Forgets the cached ids, e.g. after pointing the registry at another
+        database.
+        """
+        with self._lock:
+            self._ids.clear()
+            self._table_created = False
+
+
+party_registry = IdRegistry(
+    Base.metadata.tables["partidos"], "leg_period", "party_name"
+)
+bancada_registry = IdRegistry(
+    Base.metadata.tables["bancadas"], "leg_year", "bancada_name"
+)
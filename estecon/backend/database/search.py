@@ -0,0 +1,276 @@
+"""
+Full-text search over bills on SQLite FTS5.
+
+Every bill is indexed as a few documents: the bill itself (title, summary and
+complete text), its steps (the details of every step) and the text extracted by
+OCR from the files linked in its steps. The unicode61 tokenizer folds accents
+and case, so "educacion" matches "Educación". Documents are kept in
+`bill_search_docs`, whose rowids are the rowids of the `bill_search` FTS5 table,
+so the documents of a bill can be replaced by rowid when it's loaded again
+instead of scanning the FTS table.
+
+The loaders reindex the bills they write in the same transaction. Other
+dialects don't get an index (PostgreSQL has its own full-text search).
+"""
+
+import argparse
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from loguru import logger
+from sqlalchemy import Connection, Engine, bindparam, text
+
+from estecon.backend.config import directories
+from estecon.backend.database.session import chunked, get_engine
+from estecon.backend.scrapers.scrape_utils import url_to_cache_file
+
+OCR_CACHE_DIR = directories.OCR_CACHE
+
+FTS_TABLE = "bill_search"
+DOCS_TABLE = "bill_search_docs"
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+# bm25 weights of the title, summary and body columns
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+SNIPPET_TOKENS = 16
+MAX_SNIPPETS = 3
+
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {DOCS_TABLE} (
+        rowid INTEGER PRIMARY KEY,
+        bill_id TEXT NOT NULL,
+        source TEXT NOT NULL,
+        ref TEXT NOT NULL DEFAULT ''
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{DOCS_TABLE}_bill_id ON {DOCS_TABLE} (bill_id)",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, summary, body, tokenize = '{TOKENIZER}', prefix = '2 3'
+    )""",
+]
+
+
+def _ids_statement(sql: str):
+    return text(sql).bindparams(bindparam("ids", expanding=True))
+
+
+DELETE_FTS_DOCS = _ids_statement(
+    f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT rowid FROM {DOCS_TABLE} WHERE bill_id IN :ids)"
+)
+DELETE_DOCS = _ids_statement(f"DELETE FROM {DOCS_TABLE} WHERE bill_id IN :ids")
+SELECT_BILLS = _ids_statement(
+    "SELECT id, title, summary, complete_text FROM bills WHERE id IN :ids"
+)
+SELECT_STEPS = _ids_statement(
+    "SELECT bill_id, step_detail, step_url FROM bill_steps WHERE bill_id IN :ids ORDER BY step_date, id"
+)
+SELECT_TITLES = _ids_statement("SELECT id, title FROM bills WHERE id IN :ids")
+INSERT_DOC = text(
+    f"INSERT INTO {DOCS_TABLE} (bill_id, source, ref) VALUES (:bill_id, :source, :ref)"
+)
+INSERT_FTS_DOC = text(
+    f"INSERT INTO {FTS_TABLE} (rowid, title, summary, body) "
+    f"VALUES (:rowid, :title, :summary, :body)"
+)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def supports_search(conn: Connection) -> bool:
+    return conn.dialect.name == "sqlite"
+
+
+def create_search_index(conn: Connection):
+    """
+    Creates the search tables if they don't exist yet.
+    """
+    for statement in SCHEMA:
+        conn.exec_driver_sql(statement)
+
+
+def read_ocr_text(url: str, ocr_dir: Path = OCR_CACHE_DIR) -> Optional[str]:
+    """
+    Returns the cached OCR text of a file, or None if it was never extracted.
+    """
+    if not url:
+        return None
+    path = url_to_cache_file(url, ocr_dir)
+    return path.read_text(encoding="utf-8") if path.exists() else None
+
+
+def bill_documents(
+    bill: dict, steps: Sequence[dict], ocr_dir: Path = OCR_CACHE_DIR
+) -> List[dict]:
+    """
+    Builds the search documents of a bill from its row and its step rows.
+    """
+    docs = [
+        {
+            "source": "bill",
+            "ref": "",
+            "title": bill["title"],
+            "summary": bill["summary"],
+            "body": bill["complete_text"],
+        }
+    ]
+    if steps:
+        docs.append(
+            {
+                "source": "steps",
+                "ref": "",
+                "title": "",
+                "summary": "",
+                "body": "\n".join(step["step_detail"] for step in steps),
+            }
+        )
+    for url in dict.fromkeys(step["step_url"] for step in steps if step["step_url"]):
+        ocr_text = read_ocr_text(url, ocr_dir)
+        if ocr_text:
+            docs.append(
+                {
+                    "source": "document",
+                    "ref": url,
+                    "title": "",
+                    "summary": "",
+                    "body": ocr_text,
+                }
+            )
+    return docs
+
+
+def index_bills(
+    conn: Connection, bill_ids: Iterable[str], ocr_dir: Path = OCR_CACHE_DIR
+) -> int:
+    """
+    (Re)indexes the given bills from what's stored in the database, replacing
+    their previous documents. Returns the number of documents written.
+    """
+    if not supports_search(conn):
+        return 0
+    create_search_index(conn)
+    n_docs = 0
+    for chunk in chunked(sorted(set(bill_ids))):
+        params = {"ids": chunk}
+        conn.execute(DELETE_FTS_DOCS, params)
+        conn.execute(DELETE_DOCS, params)
+
+        bills = conn.execute(SELECT_BILLS, params).mappings().all()
+        steps: Dict[str, List[dict]] = {}
+        for step in conn.execute(SELECT_STEPS, params).mappings():
+            steps.setdefault(step["bill_id"], []).append(step)
+
+        for bill in bills:
+            for doc in bill_documents(bill, steps.get(bill["id"], []), ocr_dir):
+                rowid = conn.execute(
+                    INSERT_DOC,
+                    {"bill_id": bill["id"], "source": doc["source"], "ref": doc["ref"]},
+                ).lastrowid
+                conn.execute(INSERT_FTS_DOC, dict(doc, rowid=rowid))
+                n_docs += 1
+    return n_docs
+
+
+def rebuild_search_index(conn: Connection, ocr_dir: Path = OCR_CACHE_DIR) -> int:
+    """
+    Drops and rebuilds the whole index, e.g. after new files went through OCR.
+    """
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {DOCS_TABLE}")
+    create_search_index(conn)
+    bill_ids = conn.execute(text("SELECT id FROM bills")).scalars().all()
+    n_docs = index_bills(conn, bill_ids, ocr_dir)
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return n_docs
+
+
+def to_match_query(query: str, prefix: bool = True) -> str:
+    """
+    Turns free text into an FTS5 query that matches documents containing all
+    of its words. The last word is matched as a prefix when `prefix` is set,
+    so partial input still finds results.
+    """
+    tokens = TOKEN_PATTERN.findall(query)
+    terms = [f'"{token}"' for token in tokens]
+    if prefix and terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_bills(
+    query: str, limit: int = 20, engine: Optional[Engine] = None, raw: bool = False
+) -> List[dict]:
+    """
+    Searches the bills matching a query, best first.
+
+    Args:
+        query (str): Words to look for, or an FTS5 query if `raw` is set.
+        limit (int): Maximum number of bills returned.
+        engine (Engine): Engine of the database, the shared one by default.
+        raw (bool): Pass the query to FTS5 as is (phrases, OR, NEAR, etc).
+
+    Returns:
+        One dictionary per bill with its id, title, bm25 rank (lower is better)
+        and the snippets of its best matching documents.
+    """
+    match = query if raw else to_match_query(query)
+    if not match:
+        return []
+
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    statement = text(f"""
+        SELECT d.bill_id, d.source, d.ref,
+               bm25({FTS_TABLE}, {weights}) AS rank,
+               snippet({FTS_TABLE}, -1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet
+        FROM {FTS_TABLE} JOIN {DOCS_TABLE} d ON d.rowid = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :match
+        ORDER BY rank
+    """)
+
+    results: Dict[str, dict] = {}
+    with (engine or get_engine()).connect() as conn:
+        if not supports_search(conn):
+            raise NotImplementedError(
+                f"Full-text search is not supported for dialect {conn.dialect.name}"
+            )
+        for row in conn.execute(statement, {"match": match}).mappings():
+            result = results.get(row["bill_id"])
+            if result is None:
+                if len(results) >= limit:
+                    break
+                result = results[row["bill_id"]] = {
+                    "bill_id": row["bill_id"],
+                    "rank": row["rank"],
+                    "snippets": [],
+                }
+            if len(result["snippets"]) < MAX_SNIPPETS:
+                result["snippets"].append(
+                    {"source": row["source"], "ref": row["ref"], "text": row["snippet"]}
+                )
+
+        if results:
+            for bill_id, title in conn.execute(SELECT_TITLES, {"ids": list(results)}):
+                results[bill_id]["title"] = title
+    return list(results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search bills or rebuild the search index"
+    )
+    parser.add_argument("query", nargs="?", help="words to search for")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the index from the database"
+    )
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with get_engine().begin() as conn:
+            logger.info(f"Indexed {rebuild_search_index(conn)} documents")
+    if args.query:
+        for result in search_bills(args.query, limit=args.limit):
+            print(
+                f"{result['bill_id']}  {result['rank']:.2f}  {result.get('title', '')}"
+            )
+            for snippet in result["snippets"]:
+                print(f"    [{snippet['source']}] {snippet['text']}")
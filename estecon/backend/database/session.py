@@ -0,0 +1,175 @@
+"""
+Shared database engine and sessions.
+
+The engine is created lazily, the first time it's requested, from the values in
+`Settings`, and reused by the loaders, the query service and the scripts.
+Nothing here touches the database at import time: creating the schema and
+rendering the ERD are explicit commands (see database/erd.py).
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+
+from sqlalchemy import Connection, Engine, Table, create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from estecon.backend.config import settings
+
+# Pragmas applied to SQLite connections before a bulk load. WAL lets readers
+# keep working while we write, and NORMAL sync is still safe under WAL.
+SQLITE_BULK_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -262144,  # 256 MB, negative values are KiB
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,
+}
+
+# Values bound at a time in IN (...) lists, under SQLite's limit of bound
+# parameters
+IN_LIST_CHUNK = 500
+
+# INSERT constructs with ON CONFLICT support
+INSERT_BUILDERS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+_engine: Optional[Engine] = None
+_sessionmaker: Optional[sessionmaker] = None
+
+
+def chunked(items: Sequence, size: int = IN_LIST_CHUNK) -> Iterator[Sequence]:
+    """
+    Yields consecutive slices of at most `size` items, e.g. the values of an
+    IN (...) list.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def create_db_engine(db_url: Optional[str] = None, **kwargs) -> Engine:
+    """
+    Creates an engine configured from the settings.
+
+    SQLite connections can be shared across threads (the pipeline runs loaders
+    in worker threads) and use WAL journaling when SQLITE_WAL is set. In-memory
+    SQLite databases keep SQLAlchemy's default single connection pool.
+    """
+    url = make_url(db_url or settings.DB_URL)
+    options = {"echo": settings.DB_ECHO, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database and url.database != ":memory:":
+            options.update(
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+            )
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    options.update(kwargs)
+
+    engine = create_engine(url, **options)
+    if url.get_backend_name() == "sqlite" and settings.SQLITE_WAL:
+        event.listen(engine, "connect", _set_sqlite_wal)
+    return engine
+
+
+def _set_sqlite_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+
+def get_engine() -> Engine:
+    """
+    Returns the shared engine, creating it on first use.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine()
+    return _engine
+
+
+def get_sessionmaker() -> sessionmaker:
+    """
+    Returns the session factory bound to the shared engine.
+    """
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = sessionmaker(bind=get_engine(), expire_on_commit=False)
+    return _sessionmaker
+
+
+def dispose_engine():
+    """
+    Closes the pooled connections and forgets the shared engine, e.g. after
+    changing settings.DB_URL or in a forked worker process.
+    """
+    global _engine, _sessionmaker
+    if _engine is not None:
+        _engine.dispose()
+    _engine = None
+    _sessionmaker = None
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Provides an ORM session that commits on success and rolls back on errors.
+    """
+    session = get_sessionmaker()()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def apply_sqlite_pragmas(
+    conn: Connection, pragmas: Dict[str, object] = SQLITE_BULK_PRAGMAS
+):
+    """
+    Tunes a SQLite connection for bulk writes. Does nothing on other dialects.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    for pragma, value in pragmas.items():
+        conn.exec_driver_sql(f"PRAGMA {pragma}={value}")
+    conn.commit()
+
+
+def dialect_insert(conn: Connection, table: Table):
+    """
+    Returns the dialect specific insert() of a table, which supports
+    `on_conflict_do_update` and `on_conflict_do_nothing`.
+    """
+    if conn.dialect.name not in INSERT_BUILDERS:
+        raise NotImplementedError(
+            f"Upserts are not supported for dialect {conn.dialect.name}"
+        )
+    return INSERT_BUILDERS[conn.dialect.name](table)
+
+
+@contextmanager
+def bulk_connection(engine: Optional[Engine] = None) -> Iterator[Connection]:
+    """
+    Provides a connection tuned for bulk writes, inside a single transaction
+    that commits on success and rolls back on errors.
+    """
+    with (engine or get_engine()).connect() as conn:
+        apply_sqlite_pragmas(conn)
+        with conn.begin():
+            yield conn
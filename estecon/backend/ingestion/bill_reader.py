@@ -0,0 +1,251 @@
+"""
+Streaming, parallel reader of the bill corpus: the bill store the scrapers
+write (bill_store.BILL_STORE_DIR) or a directory of bill jsons (data/bill_jsons).
+
+Bills are parsed in chunks by a pool of worker processes (or threads) and
+yielded as the chunks complete, with at most a few chunks per worker in flight,
+so memory stays constant however large the corpus is. The id range filter is
+applied to the file names or the store index before anything is read; the year
+filter is applied in the workers, which can also convert each bill (e.g. with
+`bill_json_to_rows`) so that work is spread over the cores too.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from estecon.backend.ingestion.bill_store import (
+    BILL_STORE_DIR,
+    BillStore,
+    is_bill_store,
+)
+
+BILL_JSONS = Path(__file__).resolve().parents[3] / "data" / "bill_jsons"
+CHUNK_SIZE = 32
+# Chunks submitted per worker before waiting for results
+PENDING_PER_WORKER = 2
+
+Transform = Callable[[dict], Any]
+
+
+def bill_key(bill_id: str) -> Tuple[int, int]:
+    """
+    Sort key of a bill id like "2021_10300": (period start year, number), so
+    "2021_9999" comes before "2021_10300".
+    """
+    year, number = bill_id.split("_")
+    return int(year), int(number)
+
+
+def default_source() -> Path:
+    """
+    Where the loaders read bills from by default: the bill store once the
+    scrapers have written to it, the bill jsons otherwise.
+    """
+    return BILL_STORE_DIR if is_bill_store(BILL_STORE_DIR) else BILL_JSONS
+
+
+def _in_range(
+    bill_id: str, id_range: Optional[Tuple[Optional[str], Optional[str]]]
+) -> bool:
+    if id_range is None:
+        return True
+    start, end = (bill_key(bound) if bound else None for bound in id_range)
+    return (start is None or bill_key(bill_id) >= start) and (
+        end is None or bill_key(bill_id) <= end
+    )
+
+
+def list_bill_paths(
+    path: Union[Path, str] = BILL_JSONS,
+    id_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+) -> List[Path]:
+    """
+    Returns the bill json files of a directory in bill id order, keeping the
+    ids within `id_range` (both ends included, either may be None).
+    """
+    paths = sorted(Path(path).glob("*.json"), key=lambda p: bill_key(p.stem))
+    return [p for p in paths if _in_range(p.stem, id_range)]
+
+
+def list_store_ids(
+    path: Union[Path, str] = BILL_STORE_DIR,
+    id_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+) -> List[str]:
+    """
+    Returns the ids of the bills of a bill store in bill id order, keeping the
+    ids within `id_range` (both ends included, either may be None).
+    """
+    with BillStore(path, read_only=True) as store:
+        ids = store.ids()
+    return sorted(
+        (bill_id for bill_id in ids if _in_range(bill_id, id_range)), key=bill_key
+    )
+
+
+def _keep(
+    bills: Iterable[dict], years: Optional[Set[int]], transform: Optional[Transform]
+) -> List[Any]:
+    return [
+        transform(bill) if transform else bill
+        for bill in bills
+        if years is None or int(bill["presentation_date"][:4]) in years
+    ]
+
+
+def read_chunk(
+    paths: List[Path],
+    years: Optional[Set[int]] = None,
+    transform: Optional[Transform] = None,
+) -> List[Any]:
+    """
+    Parses a chunk of bill json files, dropping the bills presented outside
+    `years`. Runs in the workers, so `transform` must be picklable (a module
+    level function) when using processes.
+    """
+
+    def load(path: Path) -> dict:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    return _keep((load(path) for path in paths), years, transform)
+
+
+def read_store_chunk(
+    root: Path,
+    bill_ids: List[str],
+    years: Optional[Set[int]] = None,
+    transform: Optional[Transform] = None,
+) -> List[Any]:
+    """
+    Reads a chunk of bills from a bill store, in the order of `bill_ids`, like
+    `read_chunk` does with bill json files.
+    """
+    with BillStore(root, read_only=True) as store:
+        found = store.get_many(bill_ids)
+    return _keep(
+        (found[bill_id] for bill_id in bill_ids if bill_id in found), years, transform
+    )
+
+
+def iter_bills(
+    path: Optional[Union[Path, str]] = None,
+    workers: Optional[int] = None,
+    use_threads: bool = False,
+    ordered: bool = True,
+    years: Optional[Iterable[int]] = None,
+    id_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+    transform: Optional[Transform] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Any]:
+    """
+    Yields the bills of a bill store or a directory of bill jsons, parsed in
+    parallel.
+
+    Args:
+        path: Directory of the bill store or of the bill jsons, by default
+            `default_source()`.
+        workers: Number of workers, by default one per core. With 1 the files
+            are read in the calling thread.
+        use_threads: Use a thread pool instead of processes. Only worth it when
+            reading is bound by I/O, e.g. on a network file system.
+        ordered: Yield the bills in id order. Otherwise they come as soon as
+            their chunk is parsed.
+        years: Only yield the bills presented in these years.
+        id_range: Only read the bills with ids in (first, last), both included.
+        transform: Function applied to every bill in the workers.
+        chunk_size: Bills parsed per task.
+    """
+    path = Path(path) if path is not None else default_source()
+    years = set(years) if years is not None else None
+    if is_bill_store(path):
+        ids = list_store_ids(path, id_range)
+        tasks = [
+            (read_store_chunk, path, ids[i : i + chunk_size], years, transform)
+            for i in range(0, len(ids), chunk_size)
+        ]
+    else:
+        paths = list_bill_paths(path, id_range)
+        tasks = [
+            (read_chunk, paths[i : i + chunk_size], years, transform)
+            for i in range(0, len(paths), chunk_size)
+        ]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(tasks) <= 1:
+        for read, *task_args in tasks:
+            yield from read(*task_args)
+        return
+
+    pool_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        yield from _iter_results(pool, tasks, workers * PENDING_PER_WORKER, ordered)
+
+
+def _iter_results(
+    pool: Executor, tasks: List[tuple], max_pending: int, ordered: bool
+) -> Iterator[Any]:
+    remaining = iter(tasks)
+    pending: deque[Future] = deque()
+
+    def submit(n: int):
+        if n <= 0:
+            return
+        for task in remaining:
+            pending.append(pool.submit(*task))
+            n -= 1
+            if n == 0:
+                break
+
+    submit(max_pending)
+    while pending:
+        if ordered:
+            done = [pending.popleft()]
+        else:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            done = [future for future in pending if future in finished]
+            for future in done:
+                pending.remove(future)
+        submit(len(done))
+        for future in done:
+            yield from future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Read the bill store or bill jsons in parallel"
+    )
+    parser.add_argument(
+        "--path", type=Path, default=None, help="bill store or bill jsons directory"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--threads", action="store_true", help="use threads instead of processes"
+    )
+    parser.add_argument(
+        "--year", type=int, action="append", help="presentation year, can be repeated"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n_bills = sum(
+        1
+        for _ in iter_bills(
+            args.path, args.workers, args.threads, ordered=False, years=args.year
+        )
+    )
+    logger.info(f"Read {n_bills} bills in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,466 @@
+"""
+Append-only store of scraped bills.
+
+Instead of one pretty-printed JSON file per bill (data/bill_jsons), bills are
+appended as JSON lines to a few zstd-compressed segment files. Lines are
+compressed in blocks of `block_size` bills, each block a separate zstd frame,
+so a bill can be read back by decompressing only its block. A SQLite index maps
+every bill id to the (segment, offset, length, line) of its latest version.
+
+Writing a bill again appends the new version and repoints the index, leaving
+the old one as garbage in its segment; `compact` rewrites the live bills into
+new segments and removes the old ones. It also regroups bills written one at a
+time (as the scraper does) into full blocks, which compress much better.
+
+Several processes can write to the same store (e.g. `estecon bills` and
+`estecon refresh`): every write, and compaction as a whole, holds an exclusive
+lock on the store's lock file, so appends never interleave in a segment.
+Readers don't take the lock, but a compaction removes the segments that
+readers opened before it point at, so don't compact while other processes
+read the store. Within a process, a store can be shared by threads (e.g. the
+stages of `pipeline`), which take turns on its index connection.
+
+The loaders read the store directly (see `bill_reader.iter_bills`). The
+one-file-per-bill layout is still available through `export_json_dir` and
+`import_json_dir`.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import zstandard
+from loguru import logger
+from pydantic import BaseModel
+
+from estecon.backend.config import directories
+from estecon.backend.database.session import chunked
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+
+    fcntl = None
+
+BILL_STORE_DIR = directories.DATA / "bill_store"
+INDEX_FILE = "index.db"
+LOCK_FILE = "write.lock"
+BLOCK_SIZE = 64
+SEGMENT_SIZE = 64 * 1024 * 1024
+COMPRESSION_LEVEL = 10
+
+# Location of a bill: (segment, offset of its block, length of its block, line in the block)
+Location = Tuple[str, int, int, int]
+
+
+def _fsync_dir(path: Path):
+    # Makes renames in a directory durable. Not possible (nor needed) on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _to_dict(bill: Union[dict, BaseModel]) -> dict:
+    return bill.model_dump(mode="json") if isinstance(bill, BaseModel) else bill
+
+
+def is_bill_store(path: Union[Path, str]) -> bool:
+    """
+    Whether a directory holds a bill store (rather than bill jsons).
+    """
+    return (Path(path) / INDEX_FILE).exists()
+
+
+class BillStore:
+    """
+    Bills stored in zstd-compressed JSONL segments with a SQLite index.
+
+    Attributes:
+        root (Path): Directory of the segments and the index.
+        block_size (int): Bills per compressed block.
+        segment_size (int): Size in bytes after which a new segment is started.
+        read_only (bool): Open an existing store for reading only, e.g. from
+            the workers of `bill_reader.iter_bills`.
+    """
+
+    def __init__(
+        self,
+        root: Path = BILL_STORE_DIR,
+        block_size: int = BLOCK_SIZE,
+        segment_size: int = SEGMENT_SIZE,
+        level: int = COMPRESSION_LEVEL,
+        read_only: bool = False,
+    ):
+        self.root = Path(root)
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._lock_file = None
+        # Reentrant: compaction reads the index while holding the write lock
+        self._lock = threading.RLock()
+        if read_only:
+            self._index = sqlite3.connect(
+                f"{(self.root / INDEX_FILE).resolve().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.root / LOCK_FILE, "a+b")
+        self._index = sqlite3.connect(self.root / INDEX_FILE, check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS bills ("
+            "id TEXT PRIMARY KEY, segment TEXT NOT NULL, offset INTEGER NOT NULL, "
+            "length INTEGER NOT NULL, line INTEGER NOT NULL)"
+        )
+        self._index.commit()
+
+    def close(self):
+        self._index.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._index.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _write_lock(self):
+        # Exclusive between threads, processes and stores opened on the same
+        # root, blocks until the other writer is done
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            else:
+                self._lock_file.seek(0)
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                else:
+                    self._lock_file.seek(0)
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._execute("SELECT count(*) FROM bills")[0][0]
+
+    def __contains__(self, bill_id: str) -> bool:
+        return bool(self._execute("SELECT 1 FROM bills WHERE id = ?", (bill_id,)))
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self._execute("SELECT id FROM bills ORDER BY id")]
+
+    def segments(self) -> List[Path]:
+        return sorted(self.root.glob("segment-*.jsonl.zst"))
+
+    def _active_segment(self) -> Path:
+        segments = self.segments()
+        if segments and segments[-1].stat().st_size < self.segment_size:
+            return segments[-1]
+        number = (
+            int(segments[-1].name.split("-")[1].split(".")[0]) + 1 if segments else 1
+        )
+        return self.root / f"segment-{number:06d}.jsonl.zst"
+
+    def _write_blocks(self, bills: List[dict]) -> List[Tuple[str, Location]]:
+        locations = []
+        for start in range(0, len(bills), self.block_size):
+            block = bills[start : start + self.block_size]
+            frame = self._compressor.compress(
+                "".join(
+                    json.dumps(bill, ensure_ascii=False) + "\n" for bill in block
+                ).encode("utf-8")
+            )
+            segment = self._active_segment()
+            with open(segment, "ab") as f:
+                offset = f.tell()
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+            locations += [
+                (bill["id"], (segment.name, offset, len(frame), line))
+                for line, bill in enumerate(block)
+            ]
+        return locations
+
+    def put_many(self, bills: Iterable[Union[dict, BaseModel]]) -> int:
+        """
+        Appends bills (dictionaries with an "id", or Bill models) and points the
+        index at them. A bill repeated in the batch keeps its last version.
+        Returns the number of bills written.
+        """
+        latest = {}
+        for bill in bills:
+            bill = _to_dict(bill)
+            latest[bill["id"]] = bill
+        if not latest:
+            return 0
+        with self._write_lock():
+            locations = self._write_blocks(list(latest.values()))
+            with self._index:
+                self._index.executemany(
+                    "INSERT OR REPLACE INTO bills (id, segment, offset, length, line) VALUES (?, ?, ?, ?, ?)",
+                    [(bill_id, *location) for bill_id, location in locations],
+                )
+        return len(locations)
+
+    def put(self, bill: Union[dict, BaseModel]):
+        self.put_many([bill])
+
+    def delete(self, bill_id: str) -> bool:
+        """
+        Removes a bill from the index. Its data goes away on the next compaction.
+        """
+        with self._write_lock(), self._index:
+            return (
+                self._index.execute(
+                    "DELETE FROM bills WHERE id = ?", (bill_id,)
+                ).rowcount
+                > 0
+            )
+
+    def _read_block(self, segment: str, offset: int, length: int) -> List[str]:
+        with open(self.root / segment, "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+        # json.dumps escapes newlines, while splitlines() would also split on
+        # separators like U+2028 that can appear unescaped inside the strings
+        return self._decompressor.decompress(frame).decode("utf-8").split("\n")
+
+    def get(self, bill_id: str) -> Optional[dict]:
+        """
+        Returns a bill, or None if it isn't in the store.
+        """
+        return self.get_many([bill_id]).get(bill_id)
+
+    def get_many(self, bill_ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Returns the bills found among the given ids, decompressing every
+        block once.
+        """
+        blocks: Dict[Tuple[str, int, int], List[Tuple[int, str]]] = defaultdict(list)
+        bill_ids = list(dict.fromkeys(bill_ids))
+        for chunk in chunked(bill_ids):
+            query = (
+                f"SELECT id, segment, offset, length, line FROM bills "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})"
+            )
+            for bill_id, segment, offset, length, line in self._execute(
+                query, tuple(chunk)
+            ):
+                blocks[(segment, offset, length)].append((line, bill_id))
+
+        bills = {}
+        for (segment, offset, length), lines in blocks.items():
+            block = self._read_block(segment, offset, length)
+            for line, bill_id in lines:
+                bills[bill_id] = json.loads(block[line])
+        return bills
+
+    def iter_bills(self) -> Iterator[dict]:
+        """
+        Yields every bill in storage order, reading each block once. Drop-in
+        replacement for load_to_db.iter_bill_jsons.
+        """
+        current_block, block = None, None
+        rows = self._execute(
+            "SELECT segment, offset, length, line FROM bills ORDER BY segment, offset, line"
+        )
+        for segment, offset, length, line in rows:
+            if (segment, offset) != current_block:
+                current_block, block = (
+                    (segment, offset),
+                    self._read_block(segment, offset, length),
+                )
+            yield json.loads(block[line])
+
+    def compact(self) -> dict:
+        """
+        Rewrites the live bills into new segments and removes the old ones.
+        Returns the number of bills kept and the bytes before and after.
+
+        Crash-safe: the new segments are written under temporary names, synced
+        and renamed into place, then the index is repointed in one transaction,
+        and only then are the old segments removed. A crash at any point leaves
+        either the old or the new segments referenced by the index, plus at
+        worst some unreferenced files that the next compaction removes.
+        """
+        with self._write_lock():
+            return self._compact()
+
+    def _compact(self) -> dict:
+        for leftover in self.root.glob("segment-*.jsonl.zst.tmp"):
+            leftover.unlink()
+        old_segments = self.segments()
+        size_before = sum(segment.stat().st_size for segment in old_segments)
+        next_number = (
+            int(old_segments[-1].name.split("-")[1].split(".")[0]) + 1
+            if old_segments
+            else 1
+        )
+
+        locations = self._rewrite_live_bills(next_number)
+        with self._index:
+            self._index.executemany(
+                "UPDATE bills SET segment = ?, offset = ?, length = ?, line = ? WHERE id = ?",
+                [(*location, bill_id) for bill_id, location in locations.items()],
+            )
+        self._index.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        for segment in old_segments:
+            segment.unlink()
+        size_after = sum(segment.stat().st_size for segment in self.segments())
+        logger.info(
+            f"Compacted {len(locations)} bills: {size_before} -> {size_after} bytes"
+        )
+        return {
+            "bills": len(locations),
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+        }
+
+    def _rewrite_live_bills(self, first_number: int) -> Dict[str, Location]:
+        # Writes the live bills in full blocks to new segments numbered from
+        # first_number, each renamed into place once synced
+        locations: Dict[str, Location] = {}
+        number, f = first_number - 1, None
+
+        def finish():
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            os.replace(f.name, self.root / segment)
+
+        bills = self.iter_bills()
+        while block := list(islice(bills, self.block_size)):
+            if f is None or f.tell() >= self.segment_size:
+                if f is not None:
+                    finish()
+                number += 1
+                segment = f"segment-{number:06d}.jsonl.zst"
+                f = open(self.root / f"{segment}.tmp", "wb")
+            frame = self._compressor.compress(
+                "".join(
+                    json.dumps(bill, ensure_ascii=False) + "\n" for bill in block
+                ).encode("utf-8")
+            )
+            offset = f.tell()
+            f.write(frame)
+            for line, bill in enumerate(block):
+                locations[bill["id"]] = (segment, offset, len(frame), line)
+        if f is not None:
+            finish()
+            _fsync_dir(self.root)
+        return locations
+
+    def rebuild_index(self) -> int:
+        """
+        Rebuilds the index by reading every segment in order, for when the index
+        is lost. Later versions of a bill win, and deleted bills come back.
+        """
+        with self._write_lock():
+            return self._rebuild_index()
+
+    def _rebuild_index(self) -> int:
+        locations: Dict[str, Location] = {}
+        for segment in self.segments():
+            data = memoryview(segment.read_bytes())
+            offset = 0
+            while offset < len(data):
+                decompressor = self._decompressor.decompressobj()
+                block = decompressor.decompress(data[offset:])
+                length = len(data) - offset - len(decompressor.unused_data)
+                for line, text in enumerate(block.decode("utf-8").split("\n")[:-1]):
+                    locations[json.loads(text)["id"]] = (
+                        segment.name,
+                        offset,
+                        length,
+                        line,
+                    )
+                offset += length
+        with self._index:
+            self._index.execute("DELETE FROM bills")
+            self._index.executemany(
+                "INSERT INTO bills (id, segment, offset, length, line) VALUES (?, ?, ?, ?, ?)",
+                [(bill_id, *location) for bill_id, location in locations.items()],
+            )
+        return len(locations)
+
+    def import_json_dir(self, path: Path) -> int:
+        """
+        Imports a directory of one JSON file per bill, like data/bill_jsons.
+        """
+        batch, n_bills = [], 0
+        for json_path in sorted(Path(path).glob("*.json")):
+            with open(json_path, encoding="utf-8") as f:
+                batch.append(json.load(f))
+            if len(batch) >= self.block_size * 16:
+                n_bills += self.put_many(batch)
+                batch = []
+        return n_bills + self.put_many(batch)
+
+    def export_json_dir(self, path: Path) -> int:
+        """
+        Writes every bill to `<path>/<id>.json`, the layout of data/bill_jsons.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        n_bills = 0
+        for bill in self.iter_bills():
+            with open(path / f"{bill['id']}.json", "w", encoding="utf-8") as f:
+                json.dump(bill, f, ensure_ascii=False, indent=2)
+            n_bills += 1
+        return n_bills
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the bill store")
+    parser.add_argument("--root", type=Path, default=BILL_STORE_DIR)
+    parser.add_argument(
+        "--import-json", type=Path, help="import a directory of bill jsons"
+    )
+    parser.add_argument(
+        "--export-json", type=Path, help="export the bills as one json file each"
+    )
+    parser.add_argument(
+        "--compact", action="store_true", help="drop old versions of the bills"
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="rebuild the index from the segments",
+    )
+    args = parser.parse_args()
+
+    with BillStore(args.root) as store:
+        if args.rebuild_index:
+            logger.info(f"Indexed {store.rebuild_index()} bills")
+        if args.import_json:
+            logger.info(f"Imported {store.import_json_dir(args.import_json)} bills")
+        if args.compact:
+            store.compact()
+        if args.export_json:
+            logger.info(f"Exported {store.export_json_dir(args.export_json)} bills")
+        logger.info(f"{len(store)} bills in {len(store.segments())} segments")
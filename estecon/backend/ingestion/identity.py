@@ -0,0 +1,461 @@
+"""
+Identity resolution of congresistas across periods and sources.
+
+The same person shows up under different keys: (id, leg_period) in the
+congresistas table, a signer id with a DNI in the bill jsons, and only an OCR'd
+name in the vote PDFs. The index merges those keys into clusters with a
+union-find, and every cluster gets a stable person id.
+
+Keys seen in the same record always belong together, except names. Across
+records, DNIs and personal websites are strong keys: records sharing one are
+merged. Names are fuzzy keys and never merge anything when observed, since
+namesakes are common and congresistas carry no DNI. `link_names` merges the
+records carrying the same or a similar name (compared token by token with
+Jaro-Winkler, only against the names sharing one of their rarer tokens, so
+the work grows with the size of the blocks instead of with all pairs), but
+only if they can be the same person: no different DNIs, no two congresistas
+of the same period and no two different websites. A name carried by records
+that can't all be the same person is ambiguous and stays unlinked.
+
+Two clusters with different DNIs, or with congresistas of the same period,
+are never merged. Once built, resolving a key is a dictionary lookup.
+"""
+
+import argparse
+import json
+import re
+import unicodedata
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from jellyfish import jaro_winkler_similarity
+from loguru import logger
+from sqlalchemy import Connection, select
+
+from estecon.backend import LegPeriod
+from estecon.backend.config import directories
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import get_engine
+from estecon.backend.ingestion.bill_reader import iter_bills
+
+IDENTITY_FILE = directories.PROCESSED_DATA / "identity" / "identity_index.json"
+CONGRESISTAS = Base.metadata.tables["congresistas"]
+
+NAME_SIMILARITY = 0.93
+# Tokens shared by more names than this (common surnames) aren't used as blocks
+MAX_BLOCK_SIZE = 200
+MIN_TOKEN_LENGTH = 3
+NAME_PARTICLES = {"de", "del", "la", "las", "los", "y", "da", "van", "von"}
+# Websites that don't identify anybody
+GENERIC_WEBSITES = {"", "congreso.gob.pe", "leyes.congreso.gob.pe"}
+
+# ("congresista", "<leg_period>:<id>"), ("signer", "<id>"), ("dni", ...),
+# ("website", ...) or ("name", <normalized name>)
+Key = Tuple[str, str]
+
+
+def normalize_name(name: str) -> str:
+    """
+    Lower case name without accents, punctuation or particles, with its tokens
+    sorted, so "Pérez Díaz, Juan" and "JUAN PEREZ DIAZ" are the same.
+    """
+    name = (
+        unicodedata.normalize("NFKD", name or "")
+        .encode("ascii", "ignore")
+        .decode("ascii")
+        .lower()
+    )
+    tokens = [t for t in re.split(r"[^a-z]+", name) if t and t not in NAME_PARTICLES]
+    return " ".join(sorted(tokens))
+
+
+def name_similarity(a: str, b: str) -> float:
+    """
+    Similarity of two normalized names: every token is matched to its most
+    similar token of the other name (Jaro-Winkler) and the scores are averaged,
+    taking the worse of both directions. Unlike comparing the whole strings,
+    a typo in the first letter of a token doesn't change the token order.
+    """
+    tokens_a, tokens_b = a.split(), b.split()
+    if not tokens_a or not tokens_b:
+        return 0.0
+
+    def directed(source: List[str], target: List[str]) -> float:
+        return sum(
+            max(jaro_winkler_similarity(s, t) for t in target) for s in source
+        ) / len(source)
+
+    return min(directed(tokens_a, tokens_b), directed(tokens_b, tokens_a))
+
+
+def normalize_website(url: str) -> str:
+    url = (url or "").strip().lower()
+    url = re.sub(r"^https?://", "", url)
+    return re.sub(r"^www\.", "", url).rstrip("/")
+
+
+def congresista_key(congresista_id: int, leg_period: LegPeriod) -> Key:
+    return ("congresista", f"{LegPeriod(leg_period).value}:{congresista_id}")
+
+
+class IdentityIndex:
+    """
+    Union-find over the keys of congresistas, with a stable person id per cluster.
+
+    Attributes:
+        parent (Dict[Key, Key]): Parent of every key, roots point to themselves.
+        person_ids (Dict[Key, int]): Person id of every root.
+        dnis (Dict[Key, Set[str]]): DNIs of every root's cluster.
+        periods (Dict[Key, Set[str]]): Legislative periods of the congresistas
+            of every root's cluster.
+        websites (Dict[Key, Set[str]]): Websites of every root's cluster.
+        names (Dict[str, Set[Key]]): First key of every record each normalized
+            name was observed with, the name itself for records with no other
+            key.
+    """
+
+    def __init__(
+        self,
+        name_similarity: float = NAME_SIMILARITY,
+        max_block_size: int = MAX_BLOCK_SIZE,
+    ):
+        self.name_similarity = name_similarity
+        self.max_block_size = max_block_size
+        self.parent: Dict[Key, Key] = {}
+        self.person_ids: Dict[Key, int] = {}
+        self.dnis: Dict[Key, Set[str]] = {}
+        self.periods: Dict[Key, Set[str]] = {}
+        self.websites: Dict[Key, Set[str]] = {}
+        self.names: Dict[str, Set[Key]] = defaultdict(set)
+        self.next_person_id = 1
+        self._lookup: Optional[Dict[Key, int]] = None
+        self._blocks: Optional[Dict[str, List[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self.person_ids)
+
+    def _add_key(self, key: Key) -> Key:
+        if key not in self.parent:
+            self.parent[key] = key
+            self.person_ids[key] = self.next_person_id
+            self.next_person_id += 1
+            self.dnis[key] = {key[1]} if key[0] == "dni" else set()
+            self.periods[key] = (
+                {key[1].rsplit(":", 1)[0]} if key[0] == "congresista" else set()
+            )
+            self.websites[key] = {key[1]} if key[0] == "website" else set()
+            self._lookup = self._blocks = None
+        return key
+
+    def _conflict(
+        self, root_a: Key, root_b: Key, websites: bool = False
+    ) -> Optional[str]:
+        """
+        Why two clusters can't be the same person, if they can't.
+        """
+        if (
+            self.dnis[root_a]
+            and self.dnis[root_b]
+            and not self.dnis[root_a] & self.dnis[root_b]
+        ):
+            return "different DNIs"
+        if self.periods[root_a] & self.periods[root_b]:
+            return "congresistas of the same period"
+        if (
+            websites
+            and self.websites[root_a]
+            and self.websites[root_b]
+            and not self.websites[root_a] & self.websites[root_b]
+        ):
+            return "different websites"
+        return None
+
+    def find(self, key: Key) -> Key:
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def union(self, a: Key, b: Key, websites: bool = False) -> bool:
+        """
+        Merges the clusters of two keys, unless they have different DNIs or
+        congresistas of the same period (or, with `websites`, different
+        websites). The merged cluster keeps the smaller person id. Returns
+        whether they are now in the same cluster.
+        """
+        root_a, root_b = self.find(self._add_key(a)), self.find(self._add_key(b))
+        if root_a == root_b:
+            return True
+        if self._conflict(root_a, root_b, websites):
+            return False
+        if self.person_ids[root_a] > self.person_ids[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.dnis[root_a] |= self.dnis.pop(root_b)
+        self.periods[root_a] |= self.periods.pop(root_b)
+        self.websites[root_a] |= self.websites.pop(root_b)
+        del self.person_ids[root_b]
+        self._lookup = None
+        return True
+
+    def observe(
+        self,
+        congresista_id: Optional[int] = None,
+        leg_period: Optional[LegPeriod] = None,
+        signer_id: Optional[int] = None,
+        dni: Optional[str] = None,
+        name: Optional[str] = None,
+        website: Optional[str] = None,
+    ) -> int:
+        """
+        Records the keys of one record (a congresista, a bill signer or a name
+        read from a vote PDF) as the same person. Returns its person id.
+
+        The name is only noted: it is linked to the other keys by `link_names`.
+        """
+        keys = []
+        if congresista_id is not None and leg_period is not None:
+            keys.append(congresista_key(congresista_id, leg_period))
+        if signer_id is not None:
+            keys.append(("signer", str(signer_id)))
+        if dni:
+            keys.append(("dni", dni.strip()))
+        if normalize_website(website) not in GENERIC_WEBSITES:
+            keys.append(("website", normalize_website(website)))
+        name = normalize_name(name)
+        if name:
+            if not keys:
+                keys.append(("name", name))
+            if name not in self.names:
+                self._blocks = None
+            self.names[name].add(keys[0])
+        if not keys:
+            raise ValueError("A record needs at least one key")
+        for key in keys[1:]:
+            if not self.union(keys[0], key):
+                reason = self._conflict(self.find(keys[0]), self.find(key))
+                logger.warning(f"Keys {keys[0]} and {key} have {reason}, not merged")
+        return self.person_ids[self.find(self._add_key(keys[0]))]
+
+    def _name_blocks(self) -> Dict[str, List[str]]:
+        """
+        Names by token, the blocking key. Rebuilt only after new keys are added.
+        """
+        if self._blocks is None:
+            blocks = defaultdict(list)
+            for name in self.names:
+                for token in set(name.split()):
+                    if len(token) >= MIN_TOKEN_LENGTH:
+                        blocks[token].append(name)
+            self._blocks = dict(blocks)
+        return self._blocks
+
+    def _merge(self, a: Key, b: Key) -> bool:
+        # Whether linking two records by name merged two clusters
+        if self.find(a) == self.find(b):
+            return False
+        return self.union(a, b, websites=True)
+
+    def _name_roots(self, name: str) -> Set[Key]:
+        return {self.find(key) for key in self.names.get(name, ())}
+
+    def link_names(self) -> int:
+        """
+        Merges the records carrying the same name, unless they can't all be the
+        same person (the name is then ambiguous and left alone), and those with
+        similar names within each block. Returns the number of merges.
+        """
+        merges, ambiguous = 0, set()
+        for name in self.names:
+            roots = self._name_roots(name)
+            if any(
+                self._conflict(a, b, websites=True) for a, b in combinations(roots, 2)
+            ):
+                ambiguous.add(name)
+                continue
+            first, *others = roots
+            for root in others:
+                merges += self._merge(first, root)
+        if ambiguous:
+            logger.info(
+                f"{len(ambiguous)} names are carried by different people, not linked"
+            )
+
+        compared = set()
+        for token, names in self._name_blocks().items():
+            if len(names) > self.max_block_size:
+                continue
+            for i, a in enumerate(names):
+                for b in names[i + 1 :]:
+                    pair = (a, b) if a < b else (b, a)
+                    if pair in compared or a in ambiguous or b in ambiguous:
+                        continue
+                    compared.add(pair)
+                    key_a, key_b = next(iter(self.names[a])), next(iter(self.names[b]))
+                    if self.find(key_a) == self.find(key_b):
+                        continue
+                    if name_similarity(a, b) >= self.name_similarity:
+                        merges += self._merge(key_a, key_b)
+        logger.info(f"Linked {merges} names over {len(compared)} compared pairs")
+        return merges
+
+    def lookup(self) -> Dict[Key, int]:
+        """
+        Person id of every key, rebuilt only after the index changes.
+        """
+        if self._lookup is None:
+            self._lookup = {key: self.person_ids[self.find(key)] for key in self.parent}
+        return self._lookup
+
+    def resolve(self, key: Key) -> Optional[int]:
+        return self.lookup().get(key)
+
+    def resolve_congresista(
+        self, congresista_id: int, leg_period: LegPeriod
+    ) -> Optional[int]:
+        return self.resolve(congresista_key(congresista_id, leg_period))
+
+    def resolve_name(
+        self, name: str, leg_period: Optional[LegPeriod] = None
+    ) -> Optional[int]:
+        """
+        Person id of a name, e.g. read from a vote PDF: the exact normalized
+        name if known, else the most similar name in its blocks. None if the
+        name is unknown, or carried by several people none of which (or more
+        than one of which) was a congresista in `leg_period`.
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return None
+        if normalized not in self.names:
+            candidates = set()
+            blocks = self._name_blocks()
+            for token in set(normalized.split()):
+                if len(blocks.get(token, ())) <= self.max_block_size:
+                    candidates.update(blocks.get(token, ()))
+            scored = [
+                (name_similarity(normalized, other), other) for other in candidates
+            ]
+            score, normalized = max(scored, default=(0.0, None))
+            if score < self.name_similarity:
+                return None
+        roots = self._name_roots(normalized)
+        if len(roots) > 1 and leg_period is not None:
+            period = LegPeriod(leg_period).value
+            roots = {root for root in roots if period in self.periods[root]}
+        return self.person_ids[roots.pop()] if len(roots) == 1 else None
+
+    def save(self, path: Path = IDENTITY_FILE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        clusters = defaultdict(list)
+        for key, person_id in self.lookup().items():
+            clusters[person_id].append(list(key))
+        path.write_text(
+            json.dumps(
+                {
+                    "next_person_id": self.next_person_id,
+                    "clusters": {str(pid): keys for pid, keys in clusters.items()},
+                    "names": {
+                        name: sorted(list(key) for key in keys)
+                        for name, keys in self.names.items()
+                    },
+                },
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path = IDENTITY_FILE, **kwargs) -> "IdentityIndex":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(**kwargs)
+        for person_id, keys in data["clusters"].items():
+            keys = [tuple(key) for key in keys]
+            root = index._add_key(keys[0])
+            index.person_ids[root] = int(person_id)
+            for key in keys[1:]:
+                index._add_key(key)
+                del index.person_ids[key]
+                index.parent[key] = root
+                index.dnis[root] |= index.dnis.pop(key)
+                index.periods[root] |= index.periods.pop(key)
+                index.websites[root] |= index.websites.pop(key)
+        for name, keys in data.get("names", {}).items():
+            index.names[name] = {tuple(key) for key in keys}
+        index.next_person_id = data["next_person_id"]
+        return index
+
+
+def observe_congresistas(index: IdentityIndex, conn: Connection) -> int:
+    rows = conn.execute(
+        select(
+            CONGRESISTAS.c.id,
+            CONGRESISTAS.c.leg_period,
+            CONGRESISTAS.c.nombre,
+            CONGRESISTAS.c.website,
+        )
+    ).all()
+    for congresista_id, leg_period, nombre, website in rows:
+        index.observe(
+            congresista_id=congresista_id,
+            leg_period=leg_period,
+            name=nombre,
+            website=website,
+        )
+    return len(rows)
+
+
+def observe_signers(index: IdentityIndex, bills: Iterable[dict]) -> int:
+    n_signers = 0
+    for bill in bills:
+        for signer in (
+            [bill.get("lead_author") or {}]
+            + bill.get("coauthors", [])
+            + bill.get("adherents", [])
+        ):
+            if signer.get("id") is not None:
+                index.observe(
+                    signer_id=signer["id"],
+                    dni=signer.get("dni"),
+                    name=signer.get("name"),
+                )
+                n_signers += 1
+    return n_signers
+
+
+def build_identity_index(
+    conn: Connection, bill_jsons: Optional[Path] = None, path: Path = IDENTITY_FILE
+) -> IdentityIndex:
+    """
+    Updates the saved index (if any) with the congresistas of the database and
+    the signers of the bills (of the bill store or bill jsons directory
+    `bill_jsons`, see `bill_reader.iter_bills`), links similar names and saves it.
+    """
+    index = IdentityIndex.load(path) if path.exists() else IdentityIndex()
+    n_congresistas = observe_congresistas(index, conn)
+    n_signers = observe_signers(index, iter_bills(bill_jsons, ordered=False))
+    index.link_names()
+    index.save(path)
+    logger.info(
+        f"{len(index)} people from {n_congresistas} congresistas and {n_signers} signatures"
+    )
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the congresista identity index")
+    parser.add_argument(
+        "--bill-jsons",
+        type=Path,
+        default=None,
+        help="bill store or bill jsons directory",
+    )
+    parser.add_argument("--output", type=Path, default=IDENTITY_FILE)
+    args = parser.parse_args()
+
+    with get_engine().connect() as conn:
+        build_identity_index(conn, args.bill_jsons, args.output)
@@ -0,0 +1,353 @@
+"""
+Bulk loader that moves scraped records into the database.
+
+Records are grouped by destination table and written with Core `insert()`
+executemany calls inside a single transaction, instead of flushing ORM objects
+one by one. On SQLite the connection is tuned for bulk writes and, for initial
+loads, secondary indexes are dropped before inserting and rebuilt at the end.
+"""
+
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from loguru import logger
+from pydantic import BaseModel
+from sqlalchemy import Connection, Engine, Table, insert
+
+from estecon.backend import (
+    BillStepType,
+    LegPeriod,
+    Legislature,
+    Proponents,
+    RoleTypeBill,
+)
+from estecon.backend.database.erd import create_schema
+from estecon.backend.database.models import Base
+from estecon.backend.database.queries import result_cache, tags_for_rows
+from estecon.backend.database.search import index_bills
+from estecon.backend.database.session import bulk_connection, get_engine
+from estecon.backend.ingestion.bill_reader import BILL_JSONS, iter_bills
+from estecon.backend.metrics import LOAD_SECONDS, ROWS_LOADED
+from estecon.backend.ingestion.vote_counts import (
+    apply_vote_count_deltas,
+    get_existing_votes,
+    vote_count_deltas,
+)
+from estecon.backend.scrapers import schema
+
+BATCH_SIZE = 20_000
+
+# Destination table of each pydantic schema model
+SCHEMA_TABLES = {
+    schema.Vote: "votes",
+    schema.Attendance: "attendance",
+    schema.VoteEvent: "vote_events",
+    schema.VoteCount: "vote_counts",
+    schema.BillStep: "bill_steps",
+    schema.Committee: "committees",
+    schema.Bill: "bills",
+    schema.BillCongresistas: "bills_congresistas",
+    schema.BillCommittees: "bill_committees",
+    schema.Congresista: "congresistas",
+    schema.Party: "partidos",
+    schema.Bancada: "bancadas",
+    schema.Organization: "organizations",
+    schema.Membership: "memberships",
+    schema.BancadaMembership: "bancada_memberships",
+}
+
+LEGISLATURE_ORDINALS = {"primera": "I", "segunda": "II"}
+
+Row = Dict[str, object]
+
+
+def record_to_rows(record: BaseModel) -> Iterator[tuple[str, Row]]:
+    """
+    Converts a schema object into (table name, row) pairs. Only the attributes
+    that are columns of the destination table are kept, and nested votes and
+    attendance of a VoteEvent are emitted as rows of their own tables.
+    """
+    table_name = SCHEMA_TABLES[type(record)]
+    table = Base.metadata.tables[table_name]
+    yield (
+        table_name,
+        {
+            col: getattr(record, col)
+            for col in table.columns.keys()
+            if col in type(record).model_fields
+        },
+    )
+
+    if isinstance(record, schema.VoteEvent):
+        for vote in record.votes or []:
+            yield from record_to_rows(vote)
+        for att in record.attendance or []:
+            yield from record_to_rows(att)
+
+
+def parse_leg_period(legislative_session: str) -> LegPeriod:
+    """
+    Maps the "2021-2026" session label used in the bill jsons to a LegPeriod.
+    """
+    start, end = legislative_session.split("-")
+    return LegPeriod(f"Parlamentario {start.strip()} - {end.strip()}")
+
+
+def parse_legislature(legislature: str) -> Optional[Legislature]:
+    """
+    Maps labels like "Primera Legislatura Ordinaria 2024" to a Legislature.
+    Returns None if the label can't be mapped.
+    """
+    match = re.match(r"(\w+) Legislatura Ordinaria (\d{4})", legislature or "")
+    if not match or match.group(1).lower() not in LEGISLATURE_ORDINALS:
+        return None
+    label = f"{match.group(2)}-{LEGISLATURE_ORDINALS[match.group(1).lower()]}"
+    try:
+        return Legislature(label)
+    except ValueError:
+        return None
+
+
+def get_step_type(step: dict, position: int) -> BillStepType:
+    """
+    Classifies a scraped bill step into a BillStepType.
+    """
+    details = (step.get("details") or "").lower()
+    if step.get("vote_id"):
+        return BillStepType.VOTE
+    if position == 0:
+        return BillStepType.PRESENTED
+    if "publicada" in details or "publicación" in details:
+        return BillStepType.PUBLISHED
+    if step.get("committee"):
+        return BillStepType.ASSIGNED
+    return BillStepType.OTHER
+
+
+def bill_json_to_rows(data: dict) -> Dict[str, List[Row]]:
+    """
+    Converts a bill dictionary, as saved in data/bill_jsons, into rows for the
+    bills, bills_congresistas, bill_committees and bill_steps tables.
+
+    Returns an empty dictionary if the bill can't be mapped to the data model.
+    """
+    legislature = parse_legislature(data.get("legislature"))
+    if legislature is None:
+        logger.warning(
+            f"Skipping bill {data.get('id')}: unknown legislature {data.get('legislature')!r}"
+        )
+        return {}
+
+    lead_author = data.get("lead_author") or {}
+    bill_id = data["id"]
+    rows = {
+        "bills": [
+            {
+                "id": bill_id,
+                "leg_period": parse_leg_period(data["legislative_session"]),
+                "legislature": legislature,
+                "presentation_date": datetime.fromisoformat(data["presentation_date"]),
+                "title": data.get("title") or "",
+                "summary": data.get("summary") or "",
+                "observations": data.get("observations") or "",
+                "complete_text": data.get("complete_text") or "",
+                "status": data.get("status") or "",
+                "proponent": Proponents(data["proponent"]),
+                "author_id": lead_author.get("id"),
+                "bancada_id": None,
+                "bill_approved": bool(data.get("bill_complete")),
+            }
+        ],
+        "bills_congresistas": [],
+        "bill_committees": [],
+        "bill_steps": [],
+    }
+
+    signers = [(lead_author, RoleTypeBill.AUTHOR)]
+    signers += [(author, RoleTypeBill.COAUTHOR) for author in data.get("coauthors", [])]
+    signers += [
+        (author, RoleTypeBill.ADHERENTE) for author in data.get("adherents", [])
+    ]
+    seen = set()
+    for signer, role in signers:
+        person_id = signer.get("id")
+        if person_id is None or person_id in seen:
+            continue
+        seen.add(person_id)
+        rows["bills_congresistas"].append(
+            {"bill_id": bill_id, "person_id": person_id, "role_type": role}
+        )
+
+    committee_ids = {committee["id"] for committee in data.get("committees", [])}
+    rows["bill_committees"] = [
+        {"bill_id": bill_id, "committee_id": cid} for cid in sorted(committee_ids)
+    ]
+
+    for i, step in enumerate(data.get("steps", [])):
+        rows["bill_steps"].append(
+            {
+                "bill_id": bill_id,
+                "step_type": get_step_type(step, i),
+                "step_date": datetime.fromisoformat(step["date"]),
+                "step_detail": step.get("details") or "",
+                "step_url": step.get("url")
+                or step.get("vote_url")
+                or step.get("nonvote_url")
+                or "",
+            }
+        )
+    return rows
+
+
+def iter_bill_jsons(path: Union[Path, str] = BILL_JSONS) -> Iterator[dict]:
+    """
+    Yields the bill dictionaries saved in a directory of bill jsons.
+    """
+    for json_path in sorted(Path(path).glob("*.json")):
+        with open(json_path, encoding="utf-8") as f:
+            yield json.load(f)
+
+
+class BulkLoader:
+    """
+    Writes streams of rows into the database with batched executemany inserts.
+
+    Rows are buffered per table and flushed in foreign key order every time
+    `batch_size` rows are buffered, so parents are written before children
+    even when PostgreSQL enforces the constraints. Everything passed to one
+    `load_*` call is committed in a single transaction, together with the
+    vote_counts deltas of the votes written and, on SQLite, the full-text
+    index of the bills written. Missing tables are created once, when the loader
+    is built, not on every load.
+
+    Attributes:
+        engine (Engine): Engine of the destination database.
+        batch_size (int): Number of buffered rows that triggers a flush.
+        initial_load (bool): Drop secondary indexes before loading and rebuild
+            them afterwards. Only worth it when the tables start (almost) empty.
+    """
+
+    # Whether written rows may replace existing ones (upserts), in which case
+    # the old votes are read back to correct vote_counts
+    replaces_rows = False
+
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        batch_size: int = BATCH_SIZE,
+        initial_load: bool = False,
+    ):
+        self.engine = engine or get_engine()
+        self.batch_size = batch_size
+        self.initial_load = initial_load
+        create_schema(self.engine)
+
+    def load_records(self, records: Iterable[BaseModel]) -> Dict[str, int]:
+        """
+        Loads a stream of schema objects (Vote, VoteEvent, Bill, etc).
+        """
+        return self.load_rows(
+            pair for record in records for pair in record_to_rows(record)
+        )
+
+    def load_bill_jsons(self, bills: Iterable[dict]) -> Dict[str, int]:
+        """
+        Loads a stream of bill dictionaries, e.g. from `iter_bill_jsons`.
+        """
+        return self.load_bill_rows(bill_json_to_rows(data) for data in bills)
+
+    def load_bill_rows(self, bills: Iterable[Dict[str, List[Row]]]) -> Dict[str, int]:
+        """
+        Loads a stream of bills already converted by `bill_json_to_rows`, e.g.
+        by the workers of `bill_reader.iter_bills`.
+        """
+        return self.load_rows(
+            (table_name, row)
+            for bill_rows in bills
+            for table_name, table_rows in bill_rows.items()
+            for row in table_rows
+        )
+
+    def load_rows(self, rows: Iterable[tuple[str, Row]]) -> Dict[str, int]:
+        """
+        Loads (table name, row) pairs and returns the number of rows written
+        per table.
+        """
+        buffers: Dict[str, List[Row]] = {}
+        written: Dict[str, int] = {}
+        tags = set()
+        buffered = 0
+
+        with (
+            LOAD_SECONDS.time(loader=type(self).__name__),
+            bulk_connection(self.engine) as conn,
+        ):
+            if self.initial_load:
+                self._drop_indexes(conn)
+
+            for table_name, row in rows:
+                buffers.setdefault(table_name, []).append(row)
+                buffered += 1
+                if buffered >= self.batch_size:
+                    self._flush(conn, buffers, written, tags)
+                    buffered = 0
+            self._flush(conn, buffers, written, tags)
+
+            if self.initial_load:
+                self._create_indexes(conn)
+            index_bills(conn, (key for tag, key in tags if tag == "bill"))
+
+        # Only once committed, so readers that fetch again see the new rows. Readers
+        # that fetched the old rows before this point can't cache them anymore,
+        # their generation is older than the invalidation
+        result_cache.invalidate(tags)
+        logger.info(f"Loaded rows: {written}")
+        return written
+
+    def _flush(
+        self,
+        conn: Connection,
+        buffers: Dict[str, List[Row]],
+        written: Dict[str, int],
+        tags: set,
+    ):
+        for table in Base.metadata.sorted_tables:
+            table_rows = buffers.get(table.name)
+            if not table_rows:
+                continue
+            old_votes = []
+            if table.name == "votes" and self.replaces_rows:
+                old_votes = get_existing_votes(conn, table_rows)
+            changed = self._insert(conn, table, table_rows)
+            if table.name == "votes":
+                apply_vote_count_deltas(conn, vote_count_deltas(table_rows, old_votes))
+            written[table.name] = written.get(table.name, 0) + len(changed)
+            ROWS_LOADED.inc(len(changed), table=table.name)
+            # Rows skipped as unchanged neither invalidate results nor reindex bills
+            tags |= tags_for_rows(table.name, changed)
+            table_rows.clear()
+
+    def _insert(self, conn: Connection, table: Table, rows: List[Row]) -> List[Row]:
+        """
+        Writes rows into a table. Returns the rows actually inserted or changed.
+        """
+        conn.execute(insert(table), rows)
+        return rows
+
+    def _drop_indexes(self, conn: Connection):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(conn, checkfirst=True)
+
+    def _create_indexes(self, conn: Connection):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+if __name__ == "__main__":
+    loader = BulkLoader(initial_load=True)
+    loader.load_bill_rows(iter_bills(transform=bill_json_to_rows, ordered=False))
@@ -0,0 +1,213 @@
+"""
+Idempotent upserts keyed on the natural keys declared in the data model.
+
+Each table is upserted with `INSERT ... ON CONFLICT DO UPDATE` on the columns of
+its natural key constraint (see NATURAL_KEYS). A content hash of the non-key
+columns of every written row is kept in the `ingest_hashes` table, so rows that
+haven't changed since the last ingestion are filtered out before touching the
+destination table. Hash rows are deleted together with the data rows they
+describe (or when the row is rewritten outside of this module), so a deleted row
+that comes back is written again.
+"""
+
+import hashlib
+from datetime import date
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Connection, Table, delete, insert, select
+
+from estecon.backend.database.models import IngestHash
+from estecon.backend.database.session import chunked, dialect_insert
+from estecon.backend.ingestion.load_to_db import BulkLoader, Row
+
+# Name of the constraint holding the natural key of each table. Tables that are
+# not listed here are keyed on their primary key.
+NATURAL_KEYS = {
+    "votes": "uq_vote_event_voter",
+    "vote_counts": "pk_vote_counts",
+    "congresistas": "congresista_uniq",
+    "bill_committees": "bill_committee_uniq",
+    "bill_steps": "uq_bill_step",
+    "partidos": "party_uniq",
+    "bancadas": "bancada_uniq",
+}
+
+HASHES = IngestHash.__table__
+
+
+def get_natural_key(table: Table) -> List[str]:
+    """
+    Returns the names of the columns of the natural key of a table.
+    """
+    constraint_name = NATURAL_KEYS.get(table.name)
+    for constraint in table.constraints:
+        if constraint_name and constraint.name == constraint_name:
+            return [col.name for col in constraint.columns]
+    return [col.name for col in table.primary_key.columns]
+
+
+def get_update_columns(table: Table, columns: Iterable[str]) -> List[str]:
+    """
+    Returns the columns to update when a row conflicts on its natural key. The
+    primary key is left alone when it isn't the natural key, so surrogate ids
+    that other tables point to never change.
+    """
+    key_cols = get_natural_key(table)
+    fixed = set(key_cols) | {col.name for col in table.primary_key.columns}
+    return [col for col in columns if col not in fixed]
+
+
+def get_stamp_columns(table: Table) -> List[str]:
+    """
+    Returns the columns that are set on every insert and update, e.g. loaded_at,
+    and are therefore not part of the content of a row.
+    """
+    return [col.name for col in table.columns if col.onupdate is not None]
+
+
+def _normalize(value) -> str:
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, date):
+        return value.isoformat()
+    return value if isinstance(value, str) else repr(value)
+
+
+def row_key(row: Row, key_cols: Sequence[str]) -> str:
+    """
+    Serializes the natural key of a row.
+    """
+    return "|".join(_normalize(row[col]) for col in key_cols)
+
+
+def row_hash(row: Row, key_cols: Sequence[str]) -> str:
+    """
+    Hashes the non-key columns of a row.
+    """
+    payload = "\x1f".join(
+        f"{col}={_normalize(row[col])}" for col in sorted(row) if col not in key_cols
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def upsert_statement(
+    conn: Connection,
+    table: Table,
+    key_cols: Sequence[str],
+    update_cols: Optional[Sequence[str]] = None,
+):
+    """
+    Builds the dialect specific `INSERT ... ON CONFLICT` statement for a table.
+    By default every non-key column is updated on conflict. If there is nothing
+    to update, conflicting rows are ignored. Columns with an `onupdate` (e.g.
+    loaded_at) are refreshed on every update, from the default of the insert.
+    """
+    stmt = dialect_insert(conn, table)
+    if update_cols is None:
+        update_cols = [col.name for col in table.columns if col.name not in key_cols]
+    if not update_cols:
+        return stmt.on_conflict_do_nothing(index_elements=list(key_cols))
+    update_cols = list(update_cols) + [
+        col for col in get_stamp_columns(table) if col not in update_cols
+    ]
+    return stmt.on_conflict_do_update(
+        index_elements=list(key_cols),
+        set_={col: stmt.excluded[col] for col in update_cols},
+    )
+
+
+def get_stored_hashes(
+    conn: Connection, table_name: str, keys: Iterable[str]
+) -> Dict[str, str]:
+    """
+    Returns the stored content hash of each of the given row keys that exists.
+    """
+    keys = list(keys)
+    stored = {}
+    for chunk in chunked(keys):
+        result = conn.execute(
+            select(HASHES.c.row_key, HASHES.c.row_hash)
+            .where(HASHES.c.table_name == table_name)
+            .where(HASHES.c.row_key.in_(chunk))
+        )
+        stored.update((key, value) for key, value in result)
+    return stored
+
+
+def delete_hashes(conn: Connection, table: Table, rows: Optional[Iterable[Row]] = None):
+    """
+    Deletes the stored content hashes of the given rows (only their natural key
+    columns are needed), or of every row of the table. Called whenever rows are
+    deleted or rewritten without going through `upsert_rows`.
+    """
+    stmt = delete(HASHES).where(HASHES.c.table_name == table.name)
+    if rows is None:
+        conn.execute(stmt)
+        return
+    key_cols = get_natural_key(table)
+    keys = sorted({row_key(row, key_cols) for row in rows})
+    for chunk in chunked(keys):
+        conn.execute(stmt.where(HASHES.c.row_key.in_(chunk)))
+
+
+def filter_changed_rows(
+    conn: Connection, table: Table, rows: Iterable[Row]
+) -> tuple[List[Row], Dict[str, str]]:
+    """
+    Drops rows whose content hash matches the stored one, and duplicated keys
+    within the batch (the last row wins).
+
+    Returns the changed rows and their new hashes by row key.
+    """
+    key_cols = get_natural_key(table)
+    latest: Dict[str, Row] = {}
+    for row in rows:
+        latest[row_key(row, key_cols)] = row
+
+    stored = get_stored_hashes(conn, table.name, latest.keys())
+    changed, hashes = [], {}
+    for key, row in latest.items():
+        new_hash = row_hash(row, key_cols)
+        if stored.get(key) != new_hash:
+            changed.append(row)
+            hashes[key] = new_hash
+    return changed, hashes
+
+
+def upsert_rows(conn: Connection, table: Table, rows: List[Row]) -> List[Row]:
+    """
+    Upserts rows into a table, skipping rows that haven't changed. Returns the
+    rows written.
+    """
+    changed, hashes = filter_changed_rows(conn, table, rows)
+    if not changed:
+        return []
+
+    key_cols = get_natural_key(table)
+    update_cols = get_update_columns(table, changed[0])
+    conn.execute(upsert_statement(conn, table, key_cols, update_cols), changed)
+    conn.execute(
+        upsert_statement(conn, HASHES, ["table_name", "row_key"]),
+        [
+            {"table_name": table.name, "row_key": key, "row_hash": value}
+            for key, value in hashes.items()
+        ],
+    )
+    return changed
+
+
+class UpsertLoader(BulkLoader):
+    """
+    BulkLoader that upserts rows on their natural key instead of inserting them,
+    so the same data can be re-ingested weekly without delete-and-reload. Only
+    rows whose content changed are written.
+    """
+
+    replaces_rows = True
+
+    def _insert(self, conn: Connection, table: Table, rows: List[Row]) -> List[Row]:
+        if table.name == HASHES.name:
+            conn.execute(insert(table), rows)
+            return rows
+        return upsert_rows(conn, table, rows)
@@ -0,0 +1,225 @@
+"""
+Materialization of the vote_counts table (votes per event, option and bancada).
+
+The loaders keep vote_counts up to date incrementally: every batch of votes
+written also applies the resulting count deltas, in the same transaction, so
+readers never see votes without their counts. `check_vote_counts` compares the
+table with a fresh aggregation of votes and `rebuild_vote_counts` recomputes it
+from scratch.
+"""
+
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from loguru import logger
+from sqlalchemy import Connection, delete, func, insert, select, tuple_
+
+from estecon.backend.database.models import Base
+from estecon.backend.database.session import (
+    IN_LIST_CHUNK,
+    bulk_connection,
+    chunked,
+    dialect_insert,
+    get_engine,
+)
+
+VOTES = Base.metadata.tables["votes"]
+VOTE_EVENTS = Base.metadata.tables["vote_events"]
+VOTE_COUNTS = Base.metadata.tables["vote_counts"]
+
+
+def vote_count_deltas(
+    new_rows: Iterable[dict], old_rows: Iterable[dict] = ()
+) -> Counter:
+    """
+    Computes how the counts change when old_rows are replaced by new_rows.
+    Repeated (vote_event_id, voter_id) keys count once, the last row wins.
+    """
+    deltas: Counter = Counter()
+    for rows, sign in ((old_rows, -1), (new_rows, 1)):
+        latest = {(row["vote_event_id"], row["voter_id"]): row for row in rows}
+        for row in latest.values():
+            deltas[(row["vote_event_id"], row["option"], row["bancada_id"])] += sign
+    return Counter({key: delta for key, delta in deltas.items() if delta != 0})
+
+
+def get_existing_votes(conn: Connection, rows: Iterable[dict]) -> List[dict]:
+    """
+    Returns the stored version of the votes that the given rows will replace.
+    """
+    keys = {(row["vote_event_id"], row["voter_id"]) for row in rows}
+    event_ids = sorted({event_id for event_id, _ in keys})
+    existing = []
+    for chunk in chunked(event_ids):
+        result = conn.execute(
+            select(VOTES).where(VOTES.c.vote_event_id.in_(chunk))
+        ).mappings()
+        existing.extend(
+            dict(row)
+            for row in result
+            if (row["vote_event_id"], row["voter_id"]) in keys
+        )
+    return existing
+
+
+def get_event_orgs(conn: Connection, event_ids: Iterable[str]) -> Dict[str, int]:
+    """
+    Returns the org_id of each vote event.
+    """
+    orgs = {}
+    for chunk in chunked(sorted(set(event_ids))):
+        result = conn.execute(
+            select(VOTE_EVENTS.c.id, VOTE_EVENTS.c.org_id).where(
+                VOTE_EVENTS.c.id.in_(chunk)
+            )
+        )
+        orgs.update((event_id, org_id) for event_id, org_id in result)
+    return orgs
+
+
+def forget_vote_count_hashes(conn: Connection, rows: Optional[Iterable[dict]] = None):
+    """
+    Deletes the upsert content hashes of the given vote_counts rows, or of all
+    of them, since they no longer describe what is stored.
+    """
+    # Imported here, the upsert module builds on the loaders that import this one
+    from estecon.backend.ingestion.upsert import delete_hashes
+
+    delete_hashes(conn, VOTE_COUNTS, rows)
+
+
+def apply_vote_count_deltas(conn: Connection, deltas: Counter) -> int:
+    """
+    Adds count deltas to vote_counts, creating the rows that don't exist yet and
+    deleting the ones that drop to zero. Returns the number of rows touched.
+    """
+    if not deltas:
+        return 0
+
+    orgs = get_event_orgs(conn, (event_id for event_id, _, _ in deltas))
+    missing = {event_id for event_id, _, _ in deltas if event_id not in orgs}
+    if missing:
+        logger.warning(
+            f"Skipping vote counts of {len(missing)} unknown vote events, e.g. {sorted(missing)[:3]}"
+        )
+
+    rows = [
+        {
+            "org_id": orgs[event_id],
+            "vote_event_id": event_id,
+            "option": option,
+            "bancada_id": bancada_id,
+            "count": delta,
+        }
+        for (event_id, option, bancada_id), delta in deltas.items()
+        if event_id in orgs
+    ]
+    if not rows:
+        return 0
+
+    stmt = dialect_insert(conn, VOTE_COUNTS)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["vote_event_id", "option", "bancada_id"],
+        set_={"count": VOTE_COUNTS.c.count + stmt.excluded.count},
+    )
+    conn.execute(stmt, rows)
+    forget_vote_count_hashes(conn, rows)
+    # Only the keys that went down can have dropped to zero
+    decreased = [
+        (row["vote_event_id"], row["option"], row["bancada_id"])
+        for row in rows
+        if row["count"] < 0
+    ]
+    key = tuple_(
+        VOTE_COUNTS.c.vote_event_id, VOTE_COUNTS.c.option, VOTE_COUNTS.c.bancada_id
+    )
+    for chunk in chunked(decreased, IN_LIST_CHUNK // 3):
+        conn.execute(
+            delete(VOTE_COUNTS).where(key.in_(chunk)).where(VOTE_COUNTS.c.count <= 0)
+        )
+    return len(rows)
+
+
+def aggregate_votes_query(event_ids: Optional[Sequence[str]] = None):
+    """
+    Query that aggregates votes into (org_id, vote_event_id, option, bancada_id, count).
+    """
+    query = (
+        select(
+            VOTE_EVENTS.c.org_id,
+            VOTES.c.vote_event_id,
+            VOTES.c.option,
+            VOTES.c.bancada_id,
+            func.count().label("count"),
+        )
+        .join(VOTE_EVENTS, VOTES.c.vote_event_id == VOTE_EVENTS.c.id)
+        .group_by(
+            VOTE_EVENTS.c.org_id,
+            VOTES.c.vote_event_id,
+            VOTES.c.option,
+            VOTES.c.bancada_id,
+        )
+    )
+    if event_ids is not None:
+        query = query.where(VOTES.c.vote_event_id.in_(event_ids))
+    return query
+
+
+def check_vote_counts(conn: Connection) -> List[dict]:
+    """
+    Compares vote_counts with a fresh aggregation of the votes table. Returns
+    one dictionary per mismatching (vote_event_id, option, bancada_id) with the
+    expected and the stored count.
+    """
+    key_cols = ("vote_event_id", "option", "bancada_id")
+    expected = {
+        tuple(row[col] for col in key_cols): row["count"]
+        for row in conn.execute(aggregate_votes_query()).mappings()
+    }
+    stored = {
+        tuple(row[col] for col in key_cols): row["count"]
+        for row in conn.execute(select(VOTE_COUNTS)).mappings()
+    }
+
+    return [
+        dict(
+            zip(key_cols, key), expected=expected.get(key, 0), stored=stored.get(key, 0)
+        )
+        for key in sorted(expected.keys() | stored.keys(), key=str)
+        if expected.get(key, 0) != stored.get(key, 0)
+    ]
+
+
+def rebuild_vote_counts(
+    conn: Connection, event_ids: Optional[Sequence[str]] = None
+) -> int:
+    """
+    Recomputes vote_counts from the votes table, for all events or only the
+    given ones. Returns the number of rows written.
+    """
+    clear = delete(VOTE_COUNTS)
+    if event_ids is not None:
+        clear = clear.where(VOTE_COUNTS.c.vote_event_id.in_(event_ids))
+    conn.execute(clear)
+    forget_vote_count_hashes(conn)
+    columns = ["org_id", "vote_event_id", "option", "bancada_id", "count"]
+    return conn.execute(
+        insert(VOTE_COUNTS).from_select(columns, aggregate_votes_query(event_ids))
+    ).rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check or rebuild the vote_counts table"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="recompute vote_counts from votes"
+    )
+    args = parser.parse_args()
+
+    with bulk_connection(get_engine()) as conn:
+        if args.rebuild:
+            logger.info(f"Rebuilt vote_counts: {rebuild_vote_counts(conn)} rows")
+        mismatches = check_vote_counts(conn)
+        logger.info(f"{len(mismatches)} mismatching vote counts")
@@ -0,0 +1,355 @@
+"""
+Durable work queue with leases, for spreading OCR over processes and machines.
+
+Jobs live in a SQLite database (data/work_queue.db, which can sit on a
+filesystem shared by several machines as long as it supports locking). A
+worker claims a job by taking a lease on it for some seconds, renews the lease
+with heartbeats while it works, and completes or fails it. A job whose lease
+expires, because its worker crashed, can be claimed by another worker. Jobs
+are deduplicated on enqueue by a content hash, so finding the same PDF twice
+doesn't OCR it twice, while enqueueing a job that was given up retries it.
+There is no broker: adding workers is running `python -m estecon worker` in
+more places.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from estecon.backend.config import directories
+
+WORK_QUEUE_DB = directories.DATA / "work_queue.db"
+LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 1.0
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+
+@dataclass
+class QueuedJob:
+    id: int
+    kind: str
+    payload: Any
+    attempts: int
+    lease_owner: Optional[str]
+
+
+def content_hash(kind: str, payload: Any) -> str:
+    return hashlib.sha256(
+        f"{kind}:{json.dumps(payload, sort_keys=True)}".encode("utf-8")
+    ).hexdigest()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class WorkQueue:
+    """
+    SQLite queue of jobs with leased claims.
+
+    Attributes:
+        path (Path): SQLite database file.
+        max_attempts (int): Claims after which a failing job is given up.
+    """
+
+    def __init__(self, path: Path = WORK_QUEUE_DB, max_attempts: int = MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, content_hash TEXT NOT NULL UNIQUE, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, lease_owner TEXT, lease_expires REAL, "
+            "result TEXT, last_error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, kind, id)"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue(
+        self, kind: str, payload: Any, dedupe_key: Optional[str] = None
+    ) -> Tuple[int, bool]:
+        """
+        Adds a job unless one with the same content hash (of the kind and
+        payload, or `dedupe_key`) was already enqueued. A job with that hash
+        that failed `max_attempts` times is queued again instead, with its
+        attempts and error cleared. Returns its id and whether it was added or
+        queued again.
+        """
+        key = dedupe_key or content_hash(kind, payload)
+        now = time.time()
+        rows = self._execute(
+            "INSERT INTO jobs (kind, payload, content_hash, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (content_hash) DO UPDATE SET kind = excluded.kind, "
+            "payload = excluded.payload, status = excluded.status, attempts = 0, last_error = NULL, "
+            "lease_owner = NULL, lease_expires = NULL, updated_at = excluded.updated_at "
+            "WHERE jobs.status = ? RETURNING id",
+            (kind, json.dumps(payload), key, QUEUED, now, now, FAILED),
+        )
+        if rows:
+            return rows[0][0], True
+        return self._execute("SELECT id FROM jobs WHERE content_hash = ?", (key,))[0][
+            0
+        ], False
+
+    def enqueue_many(self, kind: str, payloads: Iterable[Any]) -> int:
+        return sum(self.enqueue(kind, payload)[1] for payload in payloads)
+
+    def claim(
+        self,
+        worker_id: str,
+        kinds: Optional[Iterable[str]] = None,
+        lease_seconds: float = LEASE_SECONDS,
+    ) -> Optional[QueuedJob]:
+        """
+        Leases the oldest job that is queued or whose lease expired. The select
+        and the update are a single statement, so two workers never get the
+        same job.
+        """
+        now = time.time()
+        # Jobs whose last lease expired on their last attempt are given up
+        self._execute(
+            "UPDATE jobs SET status = ?, last_error = 'lease expired', updated_at = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+            (FAILED, now, LEASED, now, self.max_attempts),
+        )
+        kind_filter, params = "", [QUEUED, LEASED, now, self.max_attempts]
+        if kinds is not None:
+            kinds = list(kinds)
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += kinds
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+            "updated_at = ? WHERE id = (SELECT id FROM jobs WHERE (status = ? OR (status = ? AND lease_expires < ?)) "
+            f"AND attempts < ?{kind_filter} ORDER BY id LIMIT 1) "
+            "RETURNING id, kind, payload, attempts, lease_owner",
+            [LEASED, worker_id, now + lease_seconds, now] + params,
+        )
+        if not rows:
+            return None
+        job_id, kind, payload, attempts, owner = rows[0]
+        return QueuedJob(job_id, kind, json.loads(payload), attempts, owner)
+
+    def heartbeat(self, job: QueuedJob, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """
+        Extends the lease of a job. Returns False if the worker lost it, e.g.
+        because it expired and someone else claimed the job.
+        """
+        now = time.time()
+        rows = self._execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ? "
+            "RETURNING id",
+            (now + lease_seconds, now, job.id, LEASED, job.lease_owner),
+        )
+        return bool(rows)
+
+    def complete(self, job: QueuedJob, result: Any = None) -> bool:
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ? RETURNING id",
+            (DONE, json.dumps(result), time.time(), job.id, LEASED, job.lease_owner),
+        )
+        return bool(rows)
+
+    def fail(self, job: QueuedJob, error: str) -> bool:
+        """
+        Puts a failed job back in the queue, or gives it up after
+        `max_attempts` claims.
+        """
+        status = FAILED if job.attempts >= self.max_attempts else QUEUED
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ? RETURNING id",
+            (status, error, time.time(), job.id, LEASED, job.lease_owner),
+        )
+        return bool(rows)
+
+    def result(self, job_id: int) -> Any:
+        rows = self._execute("SELECT result FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows and rows[0][0] is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._execute("SELECT status, count(*) FROM jobs GROUP BY status"))
+
+    def drained(self, kinds: Optional[Iterable[str]] = None) -> bool:
+        """
+        Whether no job is waiting or running.
+        """
+        sql = "SELECT count(*) FROM jobs WHERE (status = ? OR (status = ? AND attempts <= ?))"
+        params = [QUEUED, LEASED, self.max_attempts]
+        if kinds is not None:
+            kinds = list(kinds)
+            sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += kinds
+        return self._execute(sql, params)[0][0] == 0
+
+
+Handler = Callable[[Any], Any]
+
+
+class Worker:
+    """
+    Processes jobs of a queue until it drains, renewing the lease of the
+    current job from a heartbeat thread.
+
+    Attributes:
+        queue (WorkQueue): Queue to take jobs from.
+        handlers (Dict[str, Handler]): Function of each kind of job, called
+            with the payload. Its return value is stored as the result.
+        worker_id (str): Owner name of the leases.
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        handlers: Dict[str, Handler],
+        worker_id: Optional[str] = None,
+        lease_seconds: float = LEASE_SECONDS,
+        poll_seconds: float = POLL_SECONDS,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+
+    def run_one(self) -> Optional[bool]:
+        """
+        Claims and processes one job. Returns whether it succeeded, or None
+        if there was nothing to claim.
+        """
+        job = self.queue.claim(self.worker_id, self.handlers, self.lease_seconds)
+        if job is None:
+            return None
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = self.handlers[job.kind](job.payload)
+        except Exception as e:
+            logger.error(
+                f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {e}"
+            )
+            self.queue.fail(job, repr(e))
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+        if not self.queue.complete(job, result):
+            logger.warning(
+                f"Job {job.id} lost its lease before completing, its result was discarded"
+            )
+            return False
+        return True
+
+    def _heartbeat(self, job: QueuedJob, stop: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job, self.lease_seconds):
+                logger.warning(
+                    f"Worker {self.worker_id} lost the lease of job {job.id}"
+                )
+                return
+
+    def run(self) -> Dict[str, int]:
+        """
+        Processes jobs until the queue drains. Waits while other workers hold
+        leases, since their jobs come back if they crash.
+        """
+        done = {"succeeded": 0, "failed": 0}
+        while True:
+            outcome = self.run_one()
+            if outcome is None:
+                if self.queue.drained(self.handlers):
+                    break
+                time.sleep(self.poll_seconds)
+                continue
+            done["succeeded" if outcome else "failed"] += 1
+        logger.info(f"Worker {self.worker_id} finished: {done}")
+        return done
+
+
+def ocr_job(payload: dict) -> str:
+    """
+    OCRs a PDF into the shared OCR cache. Returns the path of the cached text.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import (
+        OCR_CACHE_DIR,
+        cached_get_file_text,
+    )
+    from estecon.backend.scrapers.scrape_utils import url_to_cache_file
+
+    cached_get_file_text(payload["url"])
+    return str(url_to_cache_file(payload["url"], OCR_CACHE_DIR))
+
+
+def vote_pdf_job(payload: dict) -> dict:
+    """
+    OCRs a vote PDF found by the bill scraper and checks it holds a vote.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import is_vote_file
+
+    text_path = ocr_job(payload)
+    return {
+        "id": payload["id"],
+        "text_path": text_path,
+        "is_vote": is_vote_file(Path(text_path).read_text(encoding="utf-8")),
+    }
+
+
+HANDLERS: Dict[str, Handler] = {
+    "ocr": ocr_job,
+    "vote_pdf": vote_pdf_job,
+}
+
+
+def run_worker(
+    path: Path = WORK_QUEUE_DB,
+    kinds: Optional[List[str]] = None,
+    lease_seconds: float = LEASE_SECONDS,
+    metrics_path: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Runs a worker with its own connection until the queue drains, e.g. in a
+    separate process. With `metrics_path`, the metrics of the worker are
+    written there, labeled with its id.
+    """
+    handlers = {kind: HANDLERS[kind] for kind in (kinds or HANDLERS)}
+    with WorkQueue(path) as queue:
+        worker = Worker(queue, handlers, lease_seconds=lease_seconds)
+        if metrics_path is None:
+            return worker.run()
+        from estecon.backend.metrics import start_exporter
+
+        with start_exporter(metrics_path, labels={"worker": worker.worker_id}):
+            return worker.run()
@@ -0,0 +1,265 @@
+"""
+Freshness-aware refresh planning.
+
+Every entity type has a target cadence, taken from tracker.md (congresistas
+yearly, bancadas monthly, committees every July, bills and votes weekly), and
+single records can override it. The schedule keeps, per entity type and
+record, when it was last refreshed and how long that took. A run is planned
+as the records that are due, most overdue first (never refreshed ones before
+anything else), cut at the estimated time that fits in the run's window, so
+a nightly run refreshes what is stale instead of recrawling everything.
+"""
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from estecon.backend.jobs.state import JOB_STATE_DB
+
+DAY = timedelta(days=1)
+
+
+@dataclass(frozen=True)
+class Cadence:
+    """
+    How often a record should be refreshed: every `every`, or, with `month`,
+    once a year after the first day of that month.
+    """
+
+    every: timedelta = 365 * DAY
+    month: Optional[int] = None
+
+    def due_at(self, last_refreshed: datetime) -> datetime:
+        if self.month is None:
+            return last_refreshed + self.every
+        year = (
+            last_refreshed.year
+            if last_refreshed.month < self.month
+            else last_refreshed.year + 1
+        )
+        return datetime(year, self.month, 1)
+
+
+WEEKLY = Cadence(7 * DAY)
+MONTHLY = Cadence(30 * DAY)
+YEARLY = Cadence(365 * DAY)
+EVERY_JULY = Cadence(month=7)
+
+# Update frequencies of tracker.md
+CADENCES: Dict[str, Cadence] = {
+    "congresistas": YEARLY,
+    "parties": YEARLY,
+    "membership": YEARLY,
+    "bancadas": MONTHLY,
+    "committees": EVERY_JULY,
+    "bills": WEEKLY,
+    "bill_steps": WEEKLY,
+    "vote_events": WEEKLY,
+    "votes": WEEKLY,
+    "events": WEEKLY,
+    "attendance": WEEKLY,
+}
+
+# Seconds per record assumed before a record of the type has been timed
+DEFAULT_SECONDS = 10.0
+
+
+@dataclass
+class PlannedRefresh:
+    entity: str
+    item_id: str
+    due_at: Optional[datetime]
+    overdue: timedelta
+    estimated_seconds: float
+
+
+class RefreshSchedule:
+    """
+    Last refresh, duration and cadence of every record, in SQLite.
+
+    Attributes:
+        path (Path): SQLite database file, shared with the job state.
+        cadences (Dict[str, Cadence]): Default cadence of every entity type.
+    """
+
+    def __init__(
+        self, path: Path = JOB_STATE_DB, cadences: Dict[str, Cadence] = CADENCES
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.cadences = cadences
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refresh_schedule ("
+            "entity TEXT NOT NULL, item_id TEXT NOT NULL, last_refreshed REAL, duration REAL, "
+            "cadence_seconds REAL, PRIMARY KEY (entity, item_id))"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def register(
+        self,
+        entity: str,
+        item_ids: Iterable[Hashable],
+        cadence: Optional[timedelta] = None,
+    ) -> int:
+        """
+        Adds records to the schedule, never refreshed, keeping the ones already
+        known. A cadence given here overrides the one of the entity type.
+        Returns the number of new records.
+        """
+        if entity not in self.cadences:
+            raise ValueError(f"No cadence for entity {entity!r}")
+        seconds = cadence.total_seconds() if cadence is not None else None
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO refresh_schedule (entity, item_id, cadence_seconds) VALUES (?, ?, ?) "
+                "ON CONFLICT (entity, item_id) DO NOTHING",
+                [(entity, str(item_id), seconds) for item_id in item_ids],
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def set_cadence(self, entity: str, item_id: Hashable, cadence: Optional[timedelta]):
+        """
+        Overrides the cadence of a single record, or goes back to the one of
+        its entity type with None.
+        """
+        self._execute(
+            "UPDATE refresh_schedule SET cadence_seconds = ? WHERE entity = ? AND item_id = ?",
+            (
+                cadence.total_seconds() if cadence is not None else None,
+                entity,
+                str(item_id),
+            ),
+        )
+
+    def mark_refreshed(
+        self,
+        entity: str,
+        item_id: Hashable,
+        duration: Optional[float] = None,
+        at: Optional[datetime] = None,
+    ):
+        """
+        Records a refresh of a record, and how many seconds it took.
+        """
+        timestamp = (at or datetime.now()).timestamp()
+        self._execute(
+            "INSERT INTO refresh_schedule (entity, item_id, last_refreshed, duration) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (entity, item_id) DO UPDATE SET last_refreshed = excluded.last_refreshed, "
+            "duration = coalesce(excluded.duration, duration)",
+            (entity, str(item_id), timestamp, duration),
+        )
+
+    def last_refreshed(self, entity: str, item_id: Hashable) -> Optional[datetime]:
+        rows = self._execute(
+            "SELECT last_refreshed FROM refresh_schedule WHERE entity = ? AND item_id = ?",
+            (entity, str(item_id)),
+        )
+        return (
+            datetime.fromtimestamp(rows[0][0])
+            if rows and rows[0][0] is not None
+            else None
+        )
+
+    def mean_durations(self) -> Dict[str, float]:
+        return dict(
+            self._execute(
+                "SELECT entity, avg(duration) FROM refresh_schedule "
+                "WHERE duration IS NOT NULL GROUP BY entity"
+            )
+        )
+
+    def plan(
+        self,
+        now: Optional[datetime] = None,
+        window: Optional[timedelta] = None,
+        entities: Optional[Iterable[str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[PlannedRefresh]:
+        """
+        Records due at `now`, most overdue first. With a window, the plan stops
+        when the estimated time of its records would exceed it, using the mean
+        duration of each entity type's past refreshes.
+        """
+        now = now or datetime.now()
+        durations = self.mean_durations()
+        entities = set(entities) if entities is not None else None
+        due = []
+        for entity, item_id, last_refreshed, duration, cadence_seconds in self._execute(
+            "SELECT entity, item_id, last_refreshed, duration, cadence_seconds FROM refresh_schedule"
+        ):
+            if entities is not None and entity not in entities:
+                continue
+            estimated = duration or durations.get(entity) or DEFAULT_SECONDS
+            if last_refreshed is None:
+                due.append(
+                    PlannedRefresh(entity, item_id, None, timedelta.max, estimated)
+                )
+                continue
+            cadence = (
+                Cadence(timedelta(seconds=cadence_seconds))
+                if cadence_seconds
+                else self.cadences[entity]
+            )
+            due_at = cadence.due_at(datetime.fromtimestamp(last_refreshed))
+            if due_at <= now:
+                due.append(
+                    PlannedRefresh(entity, item_id, due_at, now - due_at, estimated)
+                )
+
+        due.sort(key=lambda item: item.overdue, reverse=True)
+        plan, total = [], 0.0
+        for item in due:
+            if (
+                window is not None
+                and total + item.estimated_seconds > window.total_seconds()
+            ):
+                break
+            if limit is not None and len(plan) >= limit:
+                break
+            plan.append(item)
+            total += item.estimated_seconds
+        return plan
+
+
+class RefreshTimer:
+    """
+    Times the refresh of a record and records it in the schedule on success.
+    """
+
+    def __init__(self, schedule: RefreshSchedule, entity: str, item_id: Hashable):
+        self.schedule, self.entity, self.item_id = schedule, entity, item_id
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.schedule.mark_refreshed(
+                self.entity, self.item_id, time.perf_counter() - self.start
+            )
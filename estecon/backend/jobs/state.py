@@ -0,0 +1,225 @@
+"""
+Per-item job state of long crawls and batch runs.
+
+Every work item (a bill to scrape, a vote PDF found, a period of congresistas)
+has a row in a small SQLite database with its stage, status, number of
+attempts, last error and a pointer to its output (e.g. the bill id in the bill
+store or the url of a vote PDF). Rows are committed as soon as they change, so
+after a crash a resumed run skips the finished items and only retries the
+failed or interrupted ones.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from estecon.backend.config import directories
+
+JOB_STATE_DB = directories.DATA / "job_state.db"
+MAX_ATTEMPTS = 3
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+@dataclass
+class JobRecord:
+    job_type: str
+    item_id: str
+    stage: str
+    status: str
+    attempts: int
+    last_error: Optional[str]
+    output: Optional[str]
+    updated_at: float
+
+
+class JobState:
+    """
+    SQLite store of the state of every work item, keyed by (job_type, item_id).
+
+    Attributes:
+        path (Path): SQLite database file.
+        max_attempts (int): Attempts after which a failed or interrupted item
+            isn't retried.
+    """
+
+    def __init__(self, path: Path = JOB_STATE_DB, max_attempts: int = MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_type TEXT NOT NULL, item_id TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, output TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (job_type, item_id))"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def start(self, job_type: str, item_id: Hashable, stage: str = "start"):
+        """
+        Marks an item as running and counts an attempt.
+        """
+        self._execute(
+            "INSERT INTO jobs (job_type, item_id, stage, status, attempts, updated_at) VALUES (?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT (job_type, item_id) DO UPDATE SET stage = excluded.stage, status = excluded.status, "
+            "attempts = attempts + 1, updated_at = excluded.updated_at",
+            (job_type, str(item_id), stage, RUNNING, time.time()),
+        )
+
+    def advance(self, job_type: str, item_id: Hashable, stage: str):
+        """
+        Records the stage a running item has reached.
+        """
+        self._execute(
+            "UPDATE jobs SET stage = ?, updated_at = ? WHERE job_type = ? AND item_id = ?",
+            (stage, time.time(), job_type, str(item_id)),
+        )
+
+    def finish(
+        self,
+        job_type: str,
+        item_id: Hashable,
+        output: Optional[str] = None,
+        stage: str = "done",
+    ):
+        """
+        Marks an item as done, with a pointer to its output. Items that were
+        never started (e.g. discovered by another job) are recorded directly.
+        """
+        self._execute(
+            "INSERT INTO jobs (job_type, item_id, stage, status, attempts, output, updated_at) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (job_type, item_id) DO UPDATE SET stage = excluded.stage, status = excluded.status, "
+            "output = excluded.output, last_error = NULL, updated_at = excluded.updated_at",
+            (job_type, str(item_id), stage, DONE, output, time.time()),
+        )
+
+    def fail(self, job_type: str, item_id: Hashable, error: str):
+        self._execute(
+            "INSERT INTO jobs (job_type, item_id, stage, status, attempts, last_error, updated_at) "
+            "VALUES (?, ?, 'start', ?, 1, ?, ?) "
+            "ON CONFLICT (job_type, item_id) DO UPDATE SET status = excluded.status, "
+            "last_error = excluded.last_error, updated_at = excluded.updated_at",
+            (job_type, str(item_id), FAILED, str(error), time.time()),
+        )
+
+    @contextmanager
+    def track(
+        self, job_type: str, item_id: Hashable, stage: str = "start"
+    ) -> Iterator[None]:
+        """
+        Marks an item as running, then as done, or as failed if the block
+        raises (the exception is re-raised). Set the output with `finish`
+        inside the block to keep a pointer to it.
+        """
+        self.start(job_type, item_id, stage)
+        try:
+            yield
+        except BaseException as e:
+            self.fail(job_type, item_id, repr(e))
+            raise
+        if not self.is_done(job_type, item_id):
+            self.finish(job_type, item_id)
+
+    def get(self, job_type: str, item_id: Hashable) -> Optional[JobRecord]:
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE job_type = ? AND item_id = ?",
+            (job_type, str(item_id)),
+        )
+        return JobRecord(*rows[0]) if rows else None
+
+    def is_done(self, job_type: str, item_id: Hashable) -> bool:
+        record = self.get(job_type, item_id)
+        return record is not None and record.status == DONE
+
+    def pending(
+        self, job_type: str, item_ids: Iterable[Hashable]
+    ) -> Iterator[Hashable]:
+        """
+        Yields the items that still need work: never seen, or interrupted while
+        running or failed fewer than `max_attempts` times. Items left running
+        after their last attempt (e.g. one that crashes the process every time)
+        are marked as failed.
+        """
+        for item_id in item_ids:
+            record = self.get(job_type, item_id)
+            if record is None or record.status == PENDING:
+                yield item_id
+            elif (
+                record.status in (RUNNING, FAILED)
+                and record.attempts < self.max_attempts
+            ):
+                yield item_id
+            elif record.status == RUNNING:
+                self.fail(
+                    job_type,
+                    item_id,
+                    f"interrupted while running, {record.attempts} attempts",
+                )
+
+    def records(self, job_type: str, status: Optional[str] = None) -> List[JobRecord]:
+        sql, params = "SELECT * FROM jobs WHERE job_type = ?", (job_type,)
+        if status is not None:
+            sql, params = sql + " AND status = ?", params + (status,)
+        return [
+            JobRecord(*row)
+            for row in self._execute(sql + " ORDER BY updated_at", params)
+        ]
+
+    def outputs(self, job_type: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        (item_id, output) of the finished items of a job type.
+        """
+        return [
+            (record.item_id, record.output) for record in self.records(job_type, DONE)
+        ]
+
+    def counts(self, job_type: str) -> dict:
+        return dict(
+            self._execute(
+                "SELECT status, count(*) FROM jobs WHERE job_type = ? GROUP BY status",
+                (job_type,),
+            )
+        )
+
+    def reset(
+        self, job_type: str, item_ids: Optional[Iterable[Hashable]] = None
+    ) -> int:
+        """
+        Forgets the state of a job type, or of some of its items, so the next
+        run does them again.
+        """
+        with self._lock:
+            if item_ids is None:
+                return self._conn.execute(
+                    "DELETE FROM jobs WHERE job_type = ?", (job_type,)
+                ).rowcount
+            return sum(
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE job_type = ? AND item_id = ?",
+                    (job_type, str(item_id)),
+                ).rowcount
+                for item_id in item_ids
+            )
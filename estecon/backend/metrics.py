@@ -0,0 +1,415 @@
+"""
+Lightweight metrics of the ingest hot paths.
+
+Counters, gauges and histograms live in a process-wide registry and are
+written as a Prometheus textfile (for node_exporter's textfile collector) or
+as a JSON snapshot, once or periodically from a background thread. Metrics
+are disabled by default (METRICS_ENABLED): every update then returns after
+checking a single attribute, and `time()` hands out a shared no-op context
+manager, so the instrumented code costs nothing measurable.
+
+Every process has its own registry. Work done in the OCR process pool of the
+pipeline is seen through the stage timings of the main process. With several
+processes, `python -m estecon worker --metrics PATH` has each of them write
+its own file, PATH with `_{pid}` added to its name, whose samples are labelled
+with the id of the worker.
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from estecon.backend.config import settings
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds, from a cached read to OCR'ing a long PDF
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+_NULL_TIMER = nullcontext()
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for _, value in key
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped))
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, registry: "Registry", name: str, help: str):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, LabelKey, float]]:
+        raise NotImplementedError
+
+    def snapshot(self) -> List[dict]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonic count, e.g. bytes downloaded or OCR cache hits.
+    """
+
+    kind = "counter"
+
+    def __init__(self, registry: "Registry", name: str, help: str):
+        super().__init__(registry, name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield self.name, key, value
+
+    def snapshot(self):
+        return [
+            {"labels": dict(key), "value": value}
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, e.g. the depth of a queue.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. request latencies, in cumulative
+    buckets as Prometheus expects them.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "Registry",
+        name: str,
+        help: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count of every bucket (plus +Inf), sum and count
+        self._values: Dict[LabelKey, List] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """
+        Context manager observing the seconds its block takes.
+        """
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_key(labels))
+        return state[2] if state else 0
+
+    def sum(self, **labels) -> float:
+        state = self._values.get(_label_key(labels))
+        return state[1] if state else 0.0
+
+    def samples(self):
+        for key, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield (
+                    f"{self.name}_bucket",
+                    key + (("le", _format_value(bound)),),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, count
+
+    def snapshot(self):
+        return [
+            {
+                "labels": dict(key),
+                "count": count,
+                "sum": total,
+                "buckets": dict(
+                    zip([str(bound) for bound in self.buckets] + ["+Inf"], counts)
+                ),
+            }
+            for key, (counts, total, count) in list(self._values.items())
+        ]
+
+
+class Registry:
+    """
+    Metrics of a process, by name.
+
+    Attributes:
+        enabled (bool): Whether updates are recorded.
+        labels (Dict[str, str]): Labels added to every sample written, e.g.
+            to tell apart the files of several worker processes.
+    """
+
+    def __init__(self, enabled: bool = False, labels: Optional[Dict[str, str]] = None):
+        self.enabled = enabled
+        self.labels = labels or {}
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def reset(self):
+        """
+        Forgets the recorded values, keeping the metrics.
+        """
+        for metric in self._metrics.values():
+            with metric._lock:
+                metric._values.clear()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        const_key = _label_key(self.labels)
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(
+                    f"{name}{_format_labels(const_key + key)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "timestamp": time.time(),
+            "pid": os.getpid(),
+            "labels": self.labels,
+            "metrics": {
+                metric.name: {
+                    "type": metric.kind,
+                    "help": metric.help,
+                    "values": metric.snapshot(),
+                }
+                for metric in self._metrics.values()
+            },
+        }
+
+    def write(self, path: Union[Path, str]):
+        """
+        Writes the metrics to `path`, as JSON if it ends in .json and as a
+        Prometheus textfile otherwise. The file is replaced atomically, so
+        collectors never read half of it. `{pid}` in the path is replaced by
+        the process id, any other brace is kept as is.
+        """
+        path = Path(str(path).replace("{pid}", str(os.getpid())))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = (
+            json.dumps(self.snapshot(), indent=2)
+            if path.suffix == ".json"
+            else self.to_prometheus()
+        )
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+class Exporter:
+    """
+    Writes the metrics of a registry every `interval` seconds from a daemon
+    thread, and a last time when stopped.
+    """
+
+    def __init__(self, registry: Registry, path: Union[Path, str], interval: float):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-exporter", daemon=True
+        )
+
+    def start(self) -> "Exporter":
+        if not self._thread.is_alive():
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.registry.write(self.path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.registry.write(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+metrics = Registry(enabled=settings.METRICS_ENABLED)
+
+
+def start_exporter(
+    path: Optional[Union[Path, str]] = None,
+    interval: Optional[float] = None,
+    labels: Optional[Dict[str, str]] = None,
+) -> Exporter:
+    """
+    Enables the metrics of the process and writes them periodically, to
+    METRICS_PATH every METRICS_INTERVAL seconds by default.
+    """
+    metrics.enabled = True
+    if labels:
+        metrics.labels.update(labels)
+    return Exporter(
+        metrics, path or settings.METRICS_PATH, interval or settings.METRICS_INTERVAL
+    ).start()
+
+
+# Metrics of the ingest pipeline
+REQUEST_SECONDS = metrics.histogram(
+    "estecon_request_seconds", "Latency of the requests to the Congress sites"
+)
+DOWNLOAD_BYTES = metrics.counter(
+    "estecon_download_bytes_total", "Bytes downloaded from the Congress sites"
+)
+REQUEST_ERRORS = metrics.counter(
+    "estecon_request_errors_total", "Failed requests to the Congress sites"
+)
+RENDER_SECONDS = metrics.histogram(
+    "estecon_render_seconds", "Seconds to render a PDF page"
+)
+OCR_SECONDS = metrics.histogram(
+    "estecon_ocr_seconds", "Seconds to OCR a rendered PDF page"
+)
+OCR_PAGES = metrics.counter("estecon_ocr_pages_total", "PDF pages OCR'd")
+OCR_CACHE = metrics.counter(
+    "estecon_ocr_cache_total", "Lookups of the OCR cache, by result (hit or miss)"
+)
+PARSE_SECONDS = metrics.histogram(
+    "estecon_parse_seconds", "Seconds to parse a scraped page or expediente"
+)
+LOAD_SECONDS = metrics.histogram(
+    "estecon_load_seconds", "Seconds of a database load call"
+)
+ROWS_LOADED = metrics.counter(
+    "estecon_rows_loaded_total", "Rows written to the database, by table"
+)
+STAGE_SECONDS = metrics.histogram(
+    "estecon_stage_seconds", "Seconds a pipeline stage spends on an item"
+)
+QUEUE_DEPTH = metrics.gauge(
+    "estecon_queue_depth", "Items waiting in the input queue of a pipeline stage"
+)
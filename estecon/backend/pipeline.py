@@ -0,0 +1,587 @@
+"""
+Staged pipeline runner.
+
+A pipeline is a list of stages joined by bounded asyncio queues. Every stage
+has its own number of workers and runs its function on the event loop (async
+functions), in a thread pool (network and database work) or in a process pool
+(CPU work such as OCR). A stage whose output queue is full stops taking new
+items, so a slow stage holds back the ones before it instead of letting items
+pile up in memory, while network-bound and CPU-bound stages work at the same
+time on different items. A stage can also reserve an estimate of the memory
+of every item in a MemoryGovernor before running it, e.g. the pixmaps of the
+pages to OCR, so its workers only run as many items as fit in the budget.
+
+`bill_pipeline` wires the scrapers into the stages
+congresistas -> bills -> PDF fetch -> OCR -> parse -> vote parse -> load.
+The congresistas stage only runs when the pipeline is given periods, and the
+vote parse stage is off by default (see `parse_votes`).
+"""
+
+import asyncio
+import inspect
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from loguru import logger
+
+from estecon.backend.jobs.scheduler import RefreshSchedule, RefreshTimer
+from estecon.backend.jobs.state import JobState
+from estecon.backend.metrics import QUEUE_DEPTH, STAGE_SECONDS
+from estecon.backend.scrapers.memory_governor import MemoryGovernor
+
+STAGE_KINDS = ("async", "thread", "process")
+
+# Marks the end of the items in a queue
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    A step of a pipeline.
+
+    Attributes:
+        name (str): Name of the stage, used in logs and stats.
+        func (Callable): Function applied to every item. Returning None drops
+            the item.
+        concurrency (int): Number of items processed at the same time.
+        kind (str): "async" for coroutine functions, "thread" or "process" for
+            blocking functions run in an executor of `concurrency` workers.
+        fan_out (bool): `func` returns an iterable of items for the next stage.
+        queue_size (Optional[int]): Size of the input queue, by default twice
+            the concurrency.
+        memory (Optional[Callable]): Estimated bytes an item takes while it's
+            processed, reserved in `governor` before running `func`.
+        governor (Optional[MemoryGovernor]): Memory budget of the stage.
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    concurrency: int = 1
+    kind: str = "thread"
+    fan_out: bool = False
+    queue_size: Optional[int] = None
+    memory: Optional[Callable[[Any], int]] = None
+    governor: Optional[MemoryGovernor] = None
+
+    def __post_init__(self):
+        if self.kind not in STAGE_KINDS:
+            raise ValueError(
+                f"Unknown stage kind {self.kind!r}, expected one of {STAGE_KINDS}"
+            )
+        if self.kind == "async" and not inspect.iscoroutinefunction(self.func):
+            raise ValueError(
+                f"Stage {self.name} is async but {self.func} isn't a coroutine function"
+            )
+        if (self.memory is None) != (self.governor is None):
+            raise ValueError(
+                f"Stage {self.name} needs both a memory estimate and a governor, or neither"
+            )
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    failed: int = 0
+    emitted: int = 0
+    busy_seconds: float = 0.0
+
+
+@dataclass
+class PipelineResult:
+    stats: Dict[str, StageStats] = field(default_factory=dict)
+    outputs: List[Any] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+class Pipeline:
+    """
+    Runs items through stages joined by bounded queues.
+
+    Attributes:
+        stages (List[Stage]): Stages, in order.
+        collect (bool): Keep the outputs of the last stage in the result.
+        on_progress (Optional[Callable]): Called with the stage name and the
+            item every time a stage finishes an item, e.g. to record job state.
+        on_error (Optional[Callable]): Called with the stage name, the item and
+            the exception when a stage fails on an item.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        collect: bool = False,
+        on_progress: Optional[Callable[[str, Any], None]] = None,
+        on_error: Optional[Callable[[str, Any, Exception], None]] = None,
+    ):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.collect = collect
+        self.on_progress = on_progress
+        self.on_error = on_error
+
+    def run(self, items: Union[Iterable, AsyncIterable]) -> PipelineResult:
+        return asyncio.run(self.run_async(items))
+
+    async def run_async(self, items: Union[Iterable, AsyncIterable]) -> PipelineResult:
+        start = time.perf_counter()
+        result = PipelineResult(
+            stats={stage.name: StageStats() for stage in self.stages}
+        )
+        queues = [
+            asyncio.Queue(maxsize=stage.queue_size or 2 * stage.concurrency)
+            for stage in self.stages
+        ]
+        executors = {stage.name: self._executor(stage) for stage in self.stages}
+        try:
+            tasks = [
+                asyncio.create_task(
+                    self._feed(items, queues[0], self.stages[0].concurrency)
+                )
+            ]
+            for i, stage in enumerate(self.stages):
+                outbox = queues[i + 1] if i + 1 < len(queues) else None
+                next_concurrency = (
+                    self.stages[i + 1].concurrency if outbox is not None else 0
+                )
+                tasks.append(
+                    asyncio.create_task(
+                        self._run_stage(
+                            stage,
+                            executors[stage.name],
+                            queues[i],
+                            outbox,
+                            next_concurrency,
+                            result,
+                        )
+                    )
+                )
+            await asyncio.gather(*tasks)
+        finally:
+            for executor in executors.values():
+                if executor is not None:
+                    executor.shutdown(wait=True)
+        result.seconds = time.perf_counter() - start
+        for name, stats in result.stats.items():
+            logger.info(
+                f"Stage {name}: {stats.processed} processed, {stats.failed} failed, "
+                f"{stats.emitted} emitted, {stats.busy_seconds:.1f} s busy"
+            )
+        return result
+
+    @staticmethod
+    def _executor(stage: Stage) -> Optional[Executor]:
+        if stage.kind == "thread":
+            return ThreadPoolExecutor(
+                max_workers=stage.concurrency, thread_name_prefix=stage.name
+            )
+        if stage.kind == "process":
+            # The thread stages are already running, and forking a multi-threaded
+            # process can deadlock the children
+            return ProcessPoolExecutor(
+                max_workers=stage.concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return None
+
+    @staticmethod
+    async def _feed(
+        items: Union[Iterable, AsyncIterable], queue: asyncio.Queue, n_workers: int
+    ):
+        if isinstance(items, AsyncIterable):
+            async for item in items:
+                await queue.put(item)
+        else:
+            for item in items:
+                await queue.put(item)
+        for _ in range(n_workers):
+            await queue.put(_DONE)
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        executor: Optional[Executor],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        next_concurrency: int,
+        result: PipelineResult,
+    ):
+        await asyncio.gather(
+            *(
+                self._worker(stage, executor, inbox, outbox, result)
+                for _ in range(stage.concurrency)
+            )
+        )
+        for _ in range(next_concurrency):
+            await outbox.put(_DONE)
+
+    async def _worker(
+        self,
+        stage: Stage,
+        executor: Optional[Executor],
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        result: PipelineResult,
+    ):
+        stats = result.stats[stage.name]
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            QUEUE_DEPTH.set(inbox.qsize(), stage=stage.name)
+            reserved = 0
+            start = time.perf_counter()
+            try:
+                if stage.governor is not None:
+                    # Estimating opens the files and waiting for the budget
+                    # blocks, so both happen off the event loop
+                    reserved = await loop.run_in_executor(None, stage.memory, item)
+                    await loop.run_in_executor(None, stage.governor.acquire, reserved)
+                if stage.kind == "async":
+                    output = await stage.func(item)
+                else:
+                    output = await loop.run_in_executor(executor, stage.func, item)
+            except Exception as e:
+                stats.failed += 1
+                logger.error(f"Stage {stage.name} failed on {item!r}: {e}")
+                if self.on_error is not None:
+                    self.on_error(stage.name, item, e)
+                continue
+            finally:
+                if reserved:
+                    stage.governor.release(reserved)
+                elapsed = time.perf_counter() - start
+                stats.busy_seconds += elapsed
+                STAGE_SECONDS.observe(elapsed, stage=stage.name)
+            stats.processed += 1
+            if self.on_progress is not None:
+                self.on_progress(stage.name, item)
+
+            outputs = (
+                (output if stage.fan_out else [output]) if output is not None else []
+            )
+            for out in outputs:
+                stats.emitted += 1
+                if outbox is not None:
+                    await outbox.put(out)
+                elif self.collect:
+                    result.outputs.append(out)
+
+
+@dataclass
+class BillJob:
+    """
+    A bill on its way through `bill_pipeline`.
+    """
+
+    year: int
+    number: int
+    data: Optional[dict] = None
+    pdfs: Dict[str, bytes] = field(default_factory=dict)
+    bill: Optional[dict] = None
+    votes: List[Any] = field(default_factory=list)
+
+    @property
+    def bill_id(self) -> str:
+        return f"{self.year}_{self.number}"
+
+    def __repr__(self) -> str:
+        return f"BillJob({self.bill_id})"
+
+
+@dataclass
+class PeriodJob:
+    """
+    A legislative period of congresistas on its way through `bill_pipeline`,
+    with the value that selects it in the congresistas page.
+    """
+
+    periodo: str
+    valor: str
+
+
+def scrape_period(periodo: str, valor: str) -> Tuple[list, list]:
+    """
+    Congresistas and (deduplicated) parties of a period.
+    """
+    import httpx
+
+    from estecon.backend import URL
+    from estecon.backend.scrapers.scrape_congresistas import get_period_cong_party_list
+
+    async def scrape():
+        async with httpx.AsyncClient(verify=False) as client:
+            return await get_period_cong_party_list(
+                client, URL["congresistas"], periodo, valor
+            )
+
+    congresistas, partidos = asyncio.run(scrape())
+    return congresistas, list({party.party_id: party for party in partidos}.values())
+
+
+class CongresistaLoader:
+    """
+    First stage of `bill_pipeline` when it is given periods: scrapes and loads
+    the congresistas and parties of every PeriodJob, recording the period in
+    the job state, and passes the BillJobs on to the bills stage.
+    """
+
+    def __init__(
+        self,
+        state: JobState,
+        loader=None,
+        schedule: Optional[RefreshSchedule] = None,
+        scrape: Callable[[str, str], Tuple[list, list]] = scrape_period,
+    ):
+        from estecon.backend.ingestion.upsert import UpsertLoader
+
+        self.state = state
+        self.loader = loader or UpsertLoader()
+        self.schedule = schedule
+        self.scrape = scrape
+
+    def __call__(self, job: Union[PeriodJob, BillJob]) -> Optional[BillJob]:
+        if isinstance(job, BillJob):
+            return job
+        timer = (
+            RefreshTimer(self.schedule, "congresistas", job.periodo)
+            if self.schedule is not None
+            else nullcontext()
+        )
+        with self.state.track("congresistas", job.periodo), timer:
+            congresistas, partidos = self.scrape(job.periodo, job.valor)
+            self.loader.load_records([*partidos, *congresistas])
+        return None
+
+
+def fetch_bill(job: BillJob) -> BillJob:
+    """
+    Fetches the data of a bill. Raises LookupError if it doesn't exist or
+    couldn't be fetched, so the bill is recorded as failed.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import fetch_bill_data
+
+    job.data = fetch_bill_data(job.year, job.number)
+    if job.data is None:
+        raise LookupError(f"Bill {job.bill_id} not found")
+    return job
+
+
+def fetch_pdfs(job: BillJob) -> BillJob:
+    """
+    Downloads the files of the vote steps that aren't in the OCR cache yet.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import (
+        OCR_CACHE_DIR,
+        download_pdf,
+        vote_step_file_urls,
+    )
+    from estecon.backend.scrapers.scrape_utils import url_to_cache_file
+
+    for url in vote_step_file_urls(job.data):
+        if not url_to_cache_file(url, OCR_CACHE_DIR).exists():
+            job.pdfs[url] = download_pdf(url)
+    return job
+
+
+def ocr_pdfs_memory(job: BillJob) -> int:
+    """
+    Peak bytes of OCR'ing the files of a job, which are OCR'd page by page.
+    """
+    from estecon.backend.config import settings
+    from estecon.backend.scrapers.memory_governor import estimate_peak_bytes
+
+    return estimate_peak_bytes(job.pdfs.values(), settings.OCR_DPI)
+
+
+def ocr_pdfs(job: BillJob) -> BillJob:
+    """
+    OCRs the downloaded files into the OCR cache. Runs in a worker process.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import OCR_CACHE_DIR, ocr_pdf
+    from estecon.backend.scrapers.scrape_utils import (
+        save_ocr_txt_to_cache,
+        url_to_cache_file,
+    )
+
+    for url, content in job.pdfs.items():
+        save_ocr_txt_to_cache(ocr_pdf(content), url_to_cache_file(url, OCR_CACHE_DIR))
+    job.pdfs = {}
+    return job
+
+
+def parse_bill(job: BillJob) -> BillJob:
+    """
+    Builds the bill, classifying its files from the now warm OCR cache.
+    """
+    from estecon.backend.scrapers.scrape_project_bills import build_bill
+
+    job.bill = build_bill(job.data, job.year, job.number)
+    job.data = None
+    return job
+
+
+def parse_votes(job: BillJob) -> BillJob:
+    """
+    Reads the votes of the bill's vote PDFs from their OCR text in the cache.
+    `extract_votes.text_to_votes` doesn't build Vote records yet, which is why
+    `bill_pipeline` leaves this stage out unless asked for it.
+    """
+    from estecon.backend.scrapers.extract_votes import text_to_votes
+    from estecon.backend.scrapers.scrape_project_bills import OCR_CACHE_DIR
+    from estecon.backend.scrapers.scrape_utils import url_to_cache_file
+
+    for step in job.bill["steps"]:
+        if step.get("vote_url"):
+            cache_file = url_to_cache_file(step["vote_url"], OCR_CACHE_DIR)
+            if cache_file.exists():
+                text = cache_file.read_text(encoding="utf-8")
+                job.votes += text_to_votes(text, job.bill_id) or []
+    return job
+
+
+class BillSink:
+    """
+    Last stage of `bill_pipeline`: saves every bill to the bill store, loads it
+    and its parsed votes into the database and records it, and the urls of its
+    vote PDFs, as done in the job state.
+    """
+
+    def __init__(
+        self,
+        state: JobState,
+        store=None,
+        loader=None,
+        schedule: Optional[RefreshSchedule] = None,
+    ):
+        from estecon.backend.ingestion.bill_store import BillStore
+        from estecon.backend.ingestion.upsert import UpsertLoader
+
+        self.state = state
+        # An empty store is falsy
+        self.store = BillStore() if store is None else store
+        self.loader = loader or UpsertLoader()
+        self.schedule = schedule
+        self._last_done = time.perf_counter()
+
+    def __call__(self, job: BillJob) -> str:
+        self.store.put(job.bill)
+        self.loader.load_bill_jsons([job.bill])
+        if job.votes:
+            self.loader.load_records(job.votes)
+        for step in job.bill["steps"]:
+            if step.get("vote_id"):
+                self.state.finish(
+                    "vote_pdf", step["vote_id"], output=step.get("vote_url")
+                )
+        self.state.finish("bill", job.bill_id, output=job.bill_id)
+        if self.schedule is not None:
+            # The stages overlap, so the time between two finished bills is
+            # what a bill costs a run
+            now = time.perf_counter()
+            self.schedule.mark_refreshed(
+                "bills", job.bill_id, duration=now - self._last_done
+            )
+            self._last_done = now
+        return job.bill_id
+
+
+def bill_jobs(state: JobState, bill_ids: Iterable[str]) -> Iterator[BillJob]:
+    """
+    BillJob of every bill, given by ids like "2021_10300", that isn't done
+    yet, marked as started.
+    """
+    for bill_id in state.pending("bill", bill_ids):
+        state.start("bill", bill_id, "bills")
+        year, number = bill_id.split("_")
+        yield BillJob(int(year), int(number))
+
+
+def period_jobs(
+    state: JobState, periodos: Dict[str, str], only: Optional[Set[str]] = None
+) -> Iterator[PeriodJob]:
+    """
+    PeriodJob of every period, given as {periodo: valor}, that isn't done yet
+    and, if given, is in `only`.
+    """
+    for periodo in state.pending("congresistas", periodos):
+        if only is None or periodo in only:
+            yield PeriodJob(periodo, periodos[periodo])
+
+
+def bill_pipeline(
+    sink: Callable[[BillJob], Any],
+    state: Optional[JobState] = None,
+    fetch_concurrency: int = 2,
+    download_concurrency: int = 4,
+    ocr_concurrency: Optional[int] = None,
+    ocr_memory: Optional[MemoryGovernor] = None,
+    congresistas: Optional[Callable[[Any], Optional[BillJob]]] = None,
+    votes: bool = False,
+) -> Pipeline:
+    """
+    Pipeline of BillJob items. The Congress API is asked for few bills at a
+    time, while OCR gets one process per core, as long as the pages being
+    OCR'd fit in the memory budget (`ocr_memory`, OCR_MEMORY_BUDGET_MB by
+    default). With a job state, the stage reached by every bill and its
+    failures are recorded.
+
+    With a `congresistas` stage (a CongresistaLoader), the pipeline takes the
+    PeriodJobs before the BillJobs: the stage has a single worker, so every
+    period is loaded before the first bill goes on. With `votes`, the votes of
+    every bill are parsed from its vote PDFs before loading it.
+    """
+    if ocr_memory is None:
+        from estecon.backend.config import settings
+
+        ocr_memory = MemoryGovernor(settings.OCR_MEMORY_BUDGET_MB * 2**20)
+    on_progress = on_error = None
+    if state is not None:
+        # Periods are recorded by the congresistas stage itself
+        def on_progress(stage: str, job: BillJob):
+            if stage != "load" and isinstance(job, BillJob):
+                state.advance("bill", job.bill_id, stage)
+
+        def on_error(stage: str, job: BillJob, error: Exception):
+            if isinstance(job, BillJob):
+                state.fail("bill", job.bill_id, f"{stage}: {error!r}")
+
+    return Pipeline(
+        ([Stage("congresistas", congresistas)] if congresistas is not None else [])
+        + [
+            Stage("bills", fetch_bill, concurrency=fetch_concurrency),
+            Stage("fetch", fetch_pdfs, concurrency=download_concurrency),
+            Stage(
+                "ocr",
+                ocr_pdfs,
+                concurrency=ocr_concurrency or os.cpu_count() or 1,
+                kind="process",
+                memory=ocr_pdfs_memory,
+                governor=ocr_memory,
+            ),
+            Stage("parse", parse_bill),
+        ]
+        + ([Stage("votes", parse_votes)] if votes else [])
+        + [Stage("load", sink)],
+        on_progress=on_progress,
+        on_error=on_error,
+    )
@@ -8,7 +8,7 @@ from PIL import Image
 import numpy as np
 import cv2
 from jellyfish import jaro_winkler_similarity as jws
-from backend import PARTIES, VOTE_RESULTS
+from estecon.backend import PARTIES, VOTE_RESULTS
 import re
 
 TESSERACT_PATH = os.environ.get('TESSERACT_PATH')
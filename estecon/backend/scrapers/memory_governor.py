@@ -0,0 +1,116 @@
+"""
+Memory budget for rendering and OCR'ing PDF pages.
+
+A page rendered at 300 DPI takes width/72*300 x height/72*300 pixels times
+the channels of the pixmap, about 25 MB for an RGB letter page, and OCR makes
+a gray and a thresholded copy of it. The governor estimates those bytes from
+the page dimensions before rendering and only admits a page (or a PDF job, at
+its largest page) while the bytes reserved by everyone fit in the budget. A
+page gives its bytes back as soon as its OCR finishes, so as many pages are
+rendered at the same time as the budget allows and no more.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional
+
+from estecon.backend.config import settings
+
+POINTS_PER_INCH = 72
+# Gray, thresholded and PIL copies made by extract_text_from_page
+OCR_COPIES = 3
+
+
+def page_bytes(width: float, height: float, dpi: int = 300, channels: int = 3) -> int:
+    """
+    Bytes of the pixmap of a page of `width` x `height` points rendered at
+    `dpi`, plus the single channel copies made to OCR it.
+    """
+    pixels = math.ceil(width / POINTS_PER_INCH * dpi) * math.ceil(
+        height / POINTS_PER_INCH * dpi
+    )
+    return pixels * (channels + OCR_COPIES)
+
+
+def estimate_page_bytes(page, dpi: int = 300) -> int:
+    """
+    Bytes needed to render and OCR a PyMuPDF page.
+    """
+    return page_bytes(page.rect.width, page.rect.height, dpi)
+
+
+def estimate_pdf_bytes(content: bytes, dpi: int = 300) -> List[int]:
+    """
+    Bytes needed to render and OCR every page of a PDF, without rendering it.
+    """
+    import fitz
+
+    with fitz.open(stream=BytesIO(content), filetype="pdf") as pdf:
+        return [estimate_page_bytes(page, dpi) for page in pdf]
+
+
+def estimate_peak_bytes(contents: Iterable[bytes], dpi: int = 300) -> int:
+    """
+    Peak bytes of OCR'ing PDFs one after the other, page by page: their
+    largest page.
+    """
+    return max(
+        (max(estimate_pdf_bytes(content, dpi), default=0) for content in contents),
+        default=0,
+    )
+
+
+class MemoryGovernor:
+    """
+    Admits allocations while the reserved bytes fit in a budget.
+
+    An allocation larger than the whole budget is admitted when nothing else
+    is reserved, so it runs alone instead of waiting forever.
+
+    Attributes:
+        budget (int): Bytes that can be reserved at the same time.
+        in_use (int): Bytes reserved now.
+        peak (int): Most bytes reserved at the same time.
+    """
+
+    def __init__(self, budget: int):
+        if budget <= 0:
+            raise ValueError("The memory budget must be positive")
+        self.budget = budget
+        self.in_use = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, n_bytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + n_bytes <= self.budget
+
+    def acquire(self, n_bytes: int, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until `n_bytes` fit in the budget and reserves them. Returns
+        False if the timeout passed first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._fits(n_bytes), timeout):
+                return False
+            self.in_use += n_bytes
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def release(self, n_bytes: int):
+        with self._condition:
+            self.in_use -= n_bytes
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, n_bytes: int) -> Iterator[None]:
+        self.acquire(n_bytes)
+        try:
+            yield
+        finally:
+            self.release(n_bytes)
+
+
+# Budget of the pages OCR'd by this process
+governor = MemoryGovernor(settings.OCR_MEMORY_BUDGET_MB * 2**20)
@@ -1,10 +1,15 @@
-from pydantic import BaseModel, field_validator, ConfigDict
+from pydantic import BaseModel, field_validator, ConfigDict, TypeAdapter
 from estecon.backend import (VoteOption, AttendanceStatus, BillStepType, RoleTypeBill,
                      LegPeriod, Legislature, LegislativeYear, Proponents,
-                     TypeOrganization, RoleOrganization)
-from typing import List, Optional, Dict
+                     TypeOrganization, RoleOrganization, VOTE_OPTION_CODES,
+                     ATTENDANCE_STATUS_CODES)
+from typing import List, Optional, Dict, Iterable, Type, get_args
+from collections import Counter
+from enum import Enum
+from functools import lru_cache
 from datetime import datetime
 from pathlib import Path
+import numpy as np
 
 
 class PrintableModel(BaseModel):
@@ -74,10 +79,7 @@ class VoteEvent(PrintableModel):
         """
         if not self.votes:
             return {}
-        return {
-            option: sum(1 for vote in self.votes if vote.option == option)
-            for option in set(vote.option for vote in self.votes)
-        }
+        return dict(Counter(vote.option for vote in self.votes))
     
     def get_counts_by_bancada(self) -> Dict[int, Dict[VoteOption, int]]:
         """
@@ -104,6 +106,172 @@ class VoteEvent(PrintableModel):
             summary[att.status] = summary.get(att.status, 0) + 1
         return summary
 
+    def to_columns(self) -> "VoteColumns":
+        """
+        Returns the votes and attendance of the event as a VoteColumns.
+        """
+        return VoteColumns.from_records(
+            self.id, self.votes or [], self.attendance or []
+        )
+
+
+OPTIONS_BY_CODE = {code: option for option, code in VOTE_OPTION_CODES.items()}
+STATUSES_BY_CODE = {code: status for status, code in ATTENDANCE_STATUS_CODES.items()}
+
+
+def _count_codes(codes: np.ndarray, labels: Dict[int, object]) -> Dict[object, int]:
+    counts = np.bincount(codes, minlength=max(labels) + 1)
+    return {labels[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+
+class VoteColumns:
+    """
+    Columnar form of the votes and attendance of a vote event: parallel NumPy
+    arrays instead of one pydantic object per row, so whole periods fit in
+    memory and counts are computed with np.bincount in a single pass.
+
+    Attributes:
+        event_id (str): Unique identifier of the vote event.
+        voter_ids (np.ndarray): int64 id of each voter.
+        options (np.ndarray): int8 option of each vote, see VOTE_OPTION_CODES.
+        bancada_ids (np.ndarray): int64 bancada of each voter.
+        attendee_ids (np.ndarray): int64 id of each attendee.
+        statuses (np.ndarray): int8 status of each attendee, see ATTENDANCE_STATUS_CODES.
+        attendance_org_ids (np.ndarray): int64 org_id of each attendance row.
+    """
+
+    __slots__ = (
+        "event_id",
+        "voter_ids",
+        "options",
+        "bancada_ids",
+        "attendee_ids",
+        "statuses",
+        "attendance_org_ids",
+    )
+
+    def __init__(
+        self,
+        event_id: str,
+        voter_ids,
+        options,
+        bancada_ids,
+        attendee_ids=(),
+        statuses=(),
+        attendance_org_ids=(),
+    ):
+        self.event_id = event_id
+        self.voter_ids = np.asarray(voter_ids, dtype=np.int64)
+        self.options = np.asarray(options, dtype=np.int8)
+        self.bancada_ids = np.asarray(bancada_ids, dtype=np.int64)
+        self.attendee_ids = np.asarray(attendee_ids, dtype=np.int64)
+        self.statuses = np.asarray(statuses, dtype=np.int8)
+        self.attendance_org_ids = np.asarray(attendance_org_ids, dtype=np.int64)
+        if not len(self.voter_ids) == len(self.options) == len(self.bancada_ids):
+            raise ValueError(
+                "voter_ids, options and bancada_ids must have the same length"
+            )
+        if (
+            not len(self.attendee_ids)
+            == len(self.statuses)
+            == len(self.attendance_org_ids)
+        ):
+            raise ValueError(
+                "attendee_ids, statuses and attendance_org_ids must have the same length"
+            )
+
+    @classmethod
+    def from_records(
+        cls, event_id: str, votes: Iterable[Vote], attendance: Iterable[Attendance] = ()
+    ) -> "VoteColumns":
+        """
+        Builds the columns from Vote and Attendance objects.
+        """
+        votes, attendance = list(votes), list(attendance)
+        return cls(
+            event_id,
+            [vote.voter_id for vote in votes],
+            [VOTE_OPTION_CODES[vote.option] for vote in votes],
+            [vote.bancada_id for vote in votes],
+            [att.attendee_id for att in attendance],
+            [ATTENDANCE_STATUS_CODES[att.status] for att in attendance],
+            [att.org_id for att in attendance],
+        )
+
+    def to_votes(self) -> List[Vote]:
+        """
+        Returns the votes as Vote objects, in their original order.
+        """
+        return [
+            Vote.model_construct(
+                vote_event_id=self.event_id,
+                voter_id=voter_id,
+                option=OPTIONS_BY_CODE[code],
+                bancada_id=bancada_id,
+            )
+            for voter_id, code, bancada_id in zip(
+                self.voter_ids.tolist(),
+                self.options.tolist(),
+                self.bancada_ids.tolist(),
+            )
+        ]
+
+    def to_attendance(self) -> List[Attendance]:
+        """
+        Returns the attendance as Attendance objects, in their original order.
+        """
+        return [
+            Attendance.model_construct(
+                org_id=org_id,
+                event_id=self.event_id,
+                attendee_id=attendee_id,
+                status=STATUSES_BY_CODE[code],
+            )
+            for org_id, attendee_id, code in zip(
+                self.attendance_org_ids.tolist(),
+                self.attendee_ids.tolist(),
+                self.statuses.tolist(),
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self.voter_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__[1:])
+
+    def get_counts(self) -> Dict[VoteOption, int]:
+        """
+        Counts the number of votes per option.
+        """
+        return _count_codes(self.options, OPTIONS_BY_CODE)
+
+    def get_counts_by_bancada(self) -> Dict[int, Dict[VoteOption, int]]:
+        """
+        Returns vote counts grouped by bancada and option.
+        """
+        if not len(self):
+            return {}
+        bancadas, inverse = np.unique(self.bancada_ids, return_inverse=True)
+        n_codes = max(OPTIONS_BY_CODE) + 1
+        counts = np.bincount(
+            inverse * n_codes + self.options, minlength=len(bancadas) * n_codes
+        )
+        counts = counts.reshape(len(bancadas), n_codes)
+        return {
+            int(bancada_id): {
+                OPTIONS_BY_CODE[code]: int(row[code]) for code in np.flatnonzero(row)
+            }
+            for bancada_id, row in zip(bancadas, counts)
+        }
+
+    def get_attendance_summary(self) -> Dict[AttendanceStatus, int]:
+        """
+        Returns a summary count of attendance statuses.
+        """
+        return _count_codes(self.statuses, STATUSES_BY_CODE)
+
 
 class VoteCount(PrintableModel):
     '''
@@ -353,4 +521,83 @@ class BancadaMembership(PrintableModel):
     id: int
     leg_year: LegislativeYear
     person_id: int
-    bancada_id: int
\ No newline at end of file
+    bancada_id: int
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    Cached TypeAdapter that validates a list of `model` in a single call, so
+    pydantic builds the validator once instead of once per call site.
+    """
+    return TypeAdapter(List[model])
+
+
+@lru_cache(maxsize=None)
+def enum_fields(model: Type[BaseModel]) -> Dict[str, Type[Enum]]:
+    """
+    Fields of a model annotated with an Enum (or an Optional Enum).
+    """
+    fields = {}
+    for name, field in model.model_fields.items():
+        candidates = get_args(field.annotation) or (field.annotation,)
+        for candidate in candidates:
+            if isinstance(candidate, type) and issubclass(candidate, Enum):
+                fields[name] = candidate
+    return fields
+
+
+def has_python_validators(model: Type[BaseModel]) -> bool:
+    """
+    Whether a model declares field or model validators written in Python.
+    """
+    decorators = model.__pydantic_decorators__
+    return bool(decorators.field_validators or decorators.model_validators)
+
+
+def construct_many(model: Type[BaseModel], rows: Iterable[dict]) -> List[BaseModel]:
+    """
+    Builds models from already validated rows with `model_construct`, without
+    running validators. Only enum values given as plain strings (e.g. read back
+    from Parquet) are converted to their Enum, everything else is taken as is.
+    """
+    enums = [
+        (name, enum, enum._value2member_map_)
+        for name, enum in enum_fields(model).items()
+    ]
+    construct = model.model_construct
+    return [construct(**data) for data in _convert_enums(rows, enums)]
+
+
+def _convert_enums(rows: Iterable[dict], enums: list) -> Iterable[dict]:
+    # Copies of the rows with their enum values given as strings converted
+    for row in rows:
+        data = dict(row)
+        for name, enum, members in enums:
+            value = data.get(name)
+            if value is not None and value.__class__ is not enum:
+                data[name] = members[value] if value in members else enum(value)
+        yield data
+
+
+def validate_many(
+    model: Type[BaseModel], rows: Iterable[dict], trusted: bool = False
+) -> List[BaseModel]:
+    """
+    Turns rows (dictionaries) into models of the given schema class.
+
+    Args:
+        model: Schema class, e.g. Vote.
+        rows: Dictionaries with the fields of the model.
+        trusted: Skip validation for rows that come from our own database or
+            Parquet exports, which were validated when they were scraped. Use
+            the default full validation for anything scraped or user provided.
+
+    The adapter validates the whole list in one pydantic-core call, much faster
+    than building the models one by one, and faster than `model_construct` on
+    models without Python validators. Trusted rows therefore skip validation
+    only on models with Python validators, like Membership.
+    """
+    if trusted and has_python_validators(model):
+        return construct_many(model, rows)
+    return list_adapter(model).validate_python(list(rows))
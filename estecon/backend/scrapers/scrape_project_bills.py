@@ -2,8 +2,21 @@ import httpx
 import polars as pl 
 import time
 import base64
-from .schema import Bill
 from .scrape_utils import url_to_cache_file, save_ocr_txt_to_cache
+from .memory_governor import MemoryGovernor, estimate_page_bytes, governor
+from estecon.backend.config import directories, settings
+from estecon.backend.metrics import (
+    DOWNLOAD_BYTES,
+    OCR_CACHE,
+    OCR_PAGES,
+    OCR_SECONDS,
+    PARSE_SECONDS,
+    RENDER_SECONDS,
+    REQUEST_SECONDS,
+)
+from loguru import logger
+from estecon.backend.ingestion.bill_store import BillStore
+from estecon.backend.jobs.state import JobState
 import pytesseract
 import fitz
 from io import BytesIO
@@ -16,10 +29,10 @@ from pathlib import Path
 import random
 
 
-CONGRESS = pl.read_csv("data/congresistas.csv")
 BASE_URL = "https://wb2server.congreso.gob.pe/spley-portal-service/" 
 BASE_DIR = Path(__file__).parent.parent.parent
-OCR_CACHE_DIR = BASE_DIR / "data" / "ocr_cache"
+CONGRESS = pl.read_csv(BASE_DIR.parent / "data" / "congresistas.csv")
+OCR_CACHE_DIR = directories.OCR_CACHE
 BILL_JSONS = BASE_DIR / "data" / "bill_jsons"
 VOTE_PATTERN =  re.compile(
     r"\bSI\s*\+{2,}.*?\bNO\s*-{2,}|\bNO\s*-{2,}.*?\bSI\s*\+{2,}", 
@@ -78,6 +91,29 @@ def get_authors_and_adherents(data: dict) -> tuple[str, list[str], list[str]]:
     return (lead_author, coauthors, adherents)
 
 # Get each step in the bill 
+def is_vote_step(step: dict) -> bool:
+    details = (step.get("detalle") or "").lower()
+    return "votación" in details or "votacion" in details
+
+
+def file_url(file: dict) -> str:
+    b64_id = base64.b64encode(str(file["proyectoArchivoId"]).encode()).decode()
+    return f"{BASE_URL}/archivo/{b64_id}/pdf"
+
+
+def vote_step_file_urls(data: dict) -> list[str]:
+    """
+    Urls of the files of the vote steps, the ones get_steps has to OCR to tell
+    vote PDFs from the rest.
+    """
+    return [
+        file_url(file)
+        for step in data.get("seguimientos", [])
+        if is_vote_step(step)
+        for file in step.get("archivos") or []
+    ]
+
+
 def get_steps(data: dict, year: int, bill_number: int) -> list[dict]:
     """
     Extracts steps in the bill's progress, determine whether each step contains
@@ -104,7 +140,7 @@ def get_steps(data: dict, year: int, bill_number: int) -> list[dict]:
         date = step.get("fecha")
         details = step.get("detalle")
         committee = step.get("desComisiones") 
-        vote_step = ("votación" in details.lower() or "votacion" in details.lower())
+        vote_step = is_vote_step(step)
         vote_id = None
         vote_url = None
         nonvote_url = None
@@ -113,9 +149,7 @@ def get_steps(data: dict, year: int, bill_number: int) -> list[dict]:
         files = step.get("archivos")
         if files:
             for file in files:
-                file_id = file["proyectoArchivoId"]
-                b64_id = base64.b64encode(str(file_id).encode()).decode()
-                url = (f"{BASE_URL}/archivo/{b64_id}/pdf")
+                url = file_url(file)
                 
                 # If vote file within vote step, record as such
                 if vote_step:
@@ -165,33 +199,54 @@ def get_committees(data: dict) -> list[dict]:
         })
     return committees
 
-def extract_text_from_page(page):
+def extract_text_from_page(page, dpi: int = settings.OCR_DPI):
     '''
     Extract text from a single PDF page using Tesseract OCR.
     Args:
         page: A PyMuPDF page object.
+        dpi: Resolution the page is rendered at.
     '''
-    pix = page.get_pixmap(dpi = 300)
-    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 180, 255, cv2.THRESH_BINARY)
-    pil_img = Image.fromarray(thresh)
-    text = pytesseract.image_to_string(pil_img, lang = 'spa', config='--psm 6')
+    with RENDER_SECONDS.time():
+        pix = page.get_pixmap(dpi=dpi)
+    with OCR_SECONDS.time():
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
+            pix.height, pix.width, pix.n
+        )
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        _, thresh = cv2.threshold(gray, 180, 255, cv2.THRESH_BINARY)
+        pil_img = Image.fromarray(thresh)
+        text = pytesseract.image_to_string(pil_img, lang="spa", config="--psm 6")
+    OCR_PAGES.inc()
     return text
 
 
+def download_pdf(pdf_url: str) -> bytes:
+    with REQUEST_SECONDS.time(source="pdf"):
+        response = httpx.get(pdf_url)
+    response.raise_for_status()  # Ensure we raise an error for bad responses
+    DOWNLOAD_BYTES.inc(len(response.content), source="pdf")
+    return response.content
+
+
+def ocr_pdf(content: bytes, memory: MemoryGovernor = governor) -> str:
+    """
+    Extract text from the bytes of a PDF file using PyMuPDF and Tesseract OCR.
+    Every page is rendered once its estimated bytes fit in the memory budget,
+    and gives them back when its OCR finishes.
+    """
+    texts = []
+    with fitz.open(stream=BytesIO(content), filetype="pdf") as pdf:
+        for page in pdf:
+            with memory.reserve(estimate_page_bytes(page, settings.OCR_DPI)):
+                texts.append(extract_text_from_page(page))
+    return " " + " ".join(texts) if texts else ""
+
+
 def render_pdf(pdf_url: str) -> str:
     """
     Extract text from a PDF file using PyMuPDF and Tesseract OCR.
     """
-    response = httpx.get(pdf_url)
-    response.raise_for_status()  # Ensure we raise an error for bad responses
-    pdf_file = BytesIO(response.content)
-    pdf_text = ""
-    with fitz.open(stream=pdf_file, filetype="pdf") as pdf:
-        for page in pdf:
-             pdf_text += " " + extract_text_from_page(page)
-    return pdf_text
+    return ocr_pdf(download_pdf(pdf_url))
 
 
 def is_vote_file(pdf: str) -> bool:
@@ -206,78 +261,99 @@ def cached_get_file_text(url: str) -> str:
     From a given url, check OCR cache for file,
     If exists, get text, otherwise render the text and save it
     '''
-    print("   Looking at url", url)
     cached_url_file = url_to_cache_file(url, OCR_CACHE_DIR)
     if cached_url_file.exists():
-        print("      Found in cache")
+        OCR_CACHE.inc(result="hit")
+        logger.debug(f"OCR cache hit for {url}")
         return cached_url_file.read_text(encoding="utf-8")
     else:
-        print("      Not found in cache, extracting from file now")
+        OCR_CACHE.inc(result="miss")
+        logger.debug(f"OCR cache miss for {url}, extracting from file now")
         file_text = render_pdf(url)
         save_ocr_txt_to_cache(file_text, cached_url_file)
-        print("      Saved cache file")
         return file_text
 
 
-def scrape_bill(year: str, bill_number: str):
-    resp = httpx.get(f"{BASE_URL}/expediente/{year}/{bill_number}", verify=False)
+def fetch_bill_data(year: int, bill_number: int) -> dict:
+    """
+    Returns the expediente of a bill from the Congress API, or None if the
+    request fails.
+    """
+    with REQUEST_SECONDS.time(source="expediente"):
+        resp = httpx.get(f"{BASE_URL}/expediente/{year}/{bill_number}", verify=False)
+    DOWNLOAD_BYTES.inc(len(resp.content), source="expediente")
     if resp.status_code == 200:
-        data = resp.json()["data"]
+        return resp.json()["data"]
+    return None
+
+
+def build_bill(data: dict, year: int, bill_number: int) -> dict:
+    """
+    Builds the bill dictionary, in the layout of data/bill_jsons, from its
+    expediente. The files of the vote steps are OCR'd unless they are cached.
+    """
+    # Includes the OCR of the vote step files that aren't cached yet
+    with PARSE_SECONDS.time(step="bill"):
         general = data["general"]
-             
-        legislative_session = general.get("desPerParAbrev")
-        legislature = general.get("desLegis")
-        presentation_date = general.get("fecPresentacion")
-        proponent = general.get("desProponente")
-        title = general.get("titulo")
-        summary = general.get("sumilla")
-        observations = general.get("observaciones")
-        bancada = general.get("desGpar")
         status = general.get("desEstado")
-        bill_complete = (status == "Publicada en el Diario Oficial El Peruano")
-        
         lead_author, coauthors, adherents = get_authors_and_adherents(data)
-        committees = get_committees(data)      
-        steps = get_steps(data, year, bill_number)
-        
-        return Bill(
-            year, 
-            bill_number, 
-            legislative_session, 
-            legislature, 
-            presentation_date,
-            proponent, 
-            title, 
-            summary, 
-            observations, 
-            lead_author, 
-            coauthors, 
-            adherents, 
-            bancada, 
-            committees, 
-            status, 
-            bill_complete,
-            steps
-        )
+        return {
+            "organization": "Peruvian Parliament",
+            "legislative_session": general.get("desPerParAbrev"),
+            "lead_author": lead_author,
+            "summary": general.get("sumilla"),
+            "id": f"{year}_{bill_number}",
+            "presentation_date": general.get("fecPresentacion"),
+            "status": status,
+            "legislature": general.get("desLegis"),
+            "proponent": general.get("desProponente"),
+            "title": general.get("titulo"),
+            "observations": general.get("observaciones"),
+            "coauthors": coauthors,
+            "adherents": adherents,
+            "parliamentary_group": general.get("desGpar"),
+            "committees": get_committees(data),
+            "bill_complete": status == "Publicada en el Diario Oficial El Peruano",
+            "steps": get_steps(data, year, bill_number),
+        }
+
+
+def scrape_bill(year: int, bill_number: int) -> dict:
+    data = fetch_bill_data(year, bill_number)
+    if data is not None:
+        return build_bill(data, year, bill_number)
 
 if __name__ == '__main__':
-    vote_urls = []
-    for i in range(1, 502):
-        print('\n', "Scraping Bill", i, '\n')
-        
-        # Get bill and save 
-        bill = scrape_bill(2021, i)
-        bill.save_to_json(f"{BILL_JSONS}/{bill.id}.json")
+    # Bills go to the compressed bill store, which the loaders read by default
+    # (`python -m estecon load`); `python -m estecon.backend.ingestion.bill_store
+    # --export-json` still writes them out as bill_jsons.
+    # Finished bills are skipped when the loop is run again after a crash.
+    bill_store = BillStore()
+    state = JobState()
+    bill_ids = [f"2021_{i}" for i in range(1, 502)]
+    for bill_id in state.pending("bill", bill_ids):
+        logger.info(f"Scraping bill {bill_id}")
+        year, number = map(int, bill_id.split("_"))
+        try:
+            with state.track("bill", bill_id):
+                bill = scrape_bill(year, number)
+                if bill is None:
+                    raise ValueError(f"Bill {bill_id} not found")
+                bill_store.put(bill)
+
+                # Keep vote IDs/urls to pass to vote scraper
+                for step in bill["steps"]:
+                    if step.get("vote_id"):
+                        state.finish(
+                            "vote_pdf", step["vote_id"], output=step.get("vote_url")
+                        )
+                state.finish("bill", bill_id, output=bill["id"])
+        except Exception as e:
+            logger.error(f"Bill {bill_id} failed: {e}")
         time.sleep(random.uniform(5, 10))
-        
-        # Get vote IDs/urls to pass to vote scraper
-        for step in bill.steps:
-            id = step.get("vote_id")
-            if id:
-                vote_urls.append({
-                    "id" : id,
-                    "url": step.get("vote_url")
-                })
-                
-    df = pd.DataFrame(vote_urls)
-    df.to_csv(BASE_DIR / "data" / "vote_pdfs.csv", index=False)
\ No newline at end of file
+
+    vote_urls = [
+        {"id": vote_id, "url": url} for vote_id, url in state.outputs("vote_pdf")
+    ]
+    df = pd.DataFrame(vote_urls, columns=["id", "url"])
+    df.to_csv(BASE_DIR / "data" / "vote_pdfs.csv", index=False)
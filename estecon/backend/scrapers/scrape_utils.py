@@ -5,6 +5,7 @@ from lxml.html import HtmlElement, fromstring
 from loguru import logger
 from pathlib import Path
 import re
+from estecon.backend.metrics import DOWNLOAD_BYTES, REQUEST_ERRORS, REQUEST_SECONDS
 
 def clean_string(text: str):
     """
@@ -33,14 +34,15 @@ def xpath2(xpath_query, parse):
 
 def get_url_text(url:str, *args):
     if args:
-        with httpx.Client(verify=False) as client:
+        with httpx.Client(verify=False) as client, REQUEST_SECONDS.time(source="html"):
             response = client.post(url, data = args[0])
-            if response.status_code == 200:
-                return response.text
     else:
-        response = httpx.get(url,verify=False)
-        if response.status_code == 200:
-                return response.text
+        with REQUEST_SECONDS.time(source="html"):
+            response = httpx.get(url, verify=False)
+    DOWNLOAD_BYTES.inc(len(response.content), source="html")
+    if response.status_code == 200:
+        return response.text
+    REQUEST_ERRORS.inc(source="html")
 
 def parse_url(url:str, *args) -> HtmlElement:
     """
@@ -56,14 +58,18 @@ async def get_url_text_async(client: httpx.AsyncClient, url: str, data: dict = N
     Async GET or POST using a shared client
     """
     try:
-        if data:
-            response = await client.post(url, data=data)
-        else:
-            response = await client.get(url)
+        with REQUEST_SECONDS.time(source="html"):
+            if data:
+                response = await client.post(url, data=data)
+            else:
+                response = await client.get(url)
 
+        DOWNLOAD_BYTES.inc(len(response.content), source="html")
         if response.status_code == 200:
             return response.text
+        REQUEST_ERRORS.inc(source="html")
     except httpx.HTTPError as e:
+        REQUEST_ERRORS.inc(source="html")
         logger.info(f"Error fetching {url}: {e}")
         return None
 
@@ -0,0 +1,83 @@
+"""
+Runs the offline benchmark suite and writes the results as JSON.
+
+    python -m estecon.benchmarks --output bench/results.json
+    python -m estecon.benchmarks --only get_steps load_bills --compare bench/results.json
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+from estecon.benchmarks import bench_loading, bench_ocr, bench_scraping
+from estecon.benchmarks.harness import (
+    BenchResult,
+    compare,
+    run_benchmark,
+    write_results,
+)
+
+BENCHMARKS = bench_scraping.BENCHMARKS + bench_ocr.BENCHMARKS + bench_loading.BENCHMARKS
+
+
+def run(
+    names: Optional[List[str]] = None, repeat: int = 3, warmup: int = 1
+) -> List[BenchResult]:
+    unknown = set(names or []) - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    return [
+        run_benchmark(benchmark, repeat, warmup)
+        for benchmark in BENCHMARKS
+        if names is None or benchmark.name in names
+    ]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="estecon.benchmarks", description="Offline ingest benchmarks"
+    )
+    parser.add_argument(
+        "--only", nargs="+", default=None, help="benchmarks to run, all by default"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed passes over the items"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="untimed passes before timing"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("bench_results.json"), help="results JSON"
+    )
+    parser.add_argument(
+        "--compare", type=Path, default=None, help="previous results JSON to compare to"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="keep the info logs of the code benchmarked",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+    results = run(args.only, args.repeat, args.warmup)
+    ratios = compare(args.compare, results) if args.compare else {}
+    write_results(results, args.output)
+    for result in results:
+        if result.skipped:
+            print(f"{result.name:>24}: skipped, {result.skipped}")
+            continue
+        change = f"  x{ratios[result.name]:.2f}" if result.name in ratios else ""
+        print(
+            f"{result.name:>24}: {result.throughput:12,.1f} {result.unit}/s  "
+            f"p50 {result.latency_ms['p50']:9.3f} ms  p95 {result.latency_ms['p95']:9.3f} ms{change}"
+        )
+
+
+if __name__ == "__main__":
+    main()
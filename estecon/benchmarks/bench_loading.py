@@ -0,0 +1,102 @@
+"""
+Validation and loading benchmarks, on the checked-in bill jsons.
+
+    bill_json_to_rows     convert bill jsons into table rows
+    validate_votes        Vote(**row) for a batch of vote rows, as the scrapers do
+    validate_votes_many   validate_many on the same batch
+    load_bills            BulkLoader of all the bill jsons into an empty SQLite
+                          database, creating the schema included
+    upsert_bills          UpsertLoader of the same bills again, with nothing
+                          changed, as a refresh of unchanged bills does
+"""
+
+import itertools
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import create_engine
+
+from estecon.benchmarks.bench_validation import make_rows
+from estecon.benchmarks.harness import Benchmark
+from estecon.backend.ingestion.bill_reader import BILL_JSONS
+from estecon.backend.ingestion.load_to_db import (
+    BulkLoader,
+    bill_json_to_rows,
+    iter_bill_jsons,
+)
+from estecon.backend.ingestion.upsert import UpsertLoader
+from estecon.backend.scrapers.schema import Vote, validate_many
+
+VOTE_BATCH = 10_000
+N_VOTE_BATCHES = 5
+N_LOADS = 5
+
+
+def bill_jsons() -> List[dict]:
+    return list(iter_bill_jsons(BILL_JSONS))
+
+
+@contextmanager
+def bill_json_rows():
+    yield bill_json_to_rows, bill_jsons()
+
+
+@contextmanager
+def validate_votes():
+    rows = make_rows(VOTE_BATCH)
+    yield (lambda batch: [Vote(**row) for row in rows]), range(N_VOTE_BATCHES)
+
+
+@contextmanager
+def validate_votes_many():
+    rows = make_rows(VOTE_BATCH)
+    yield (lambda batch: validate_many(Vote, rows)), range(N_VOTE_BATCHES)
+
+
+@contextmanager
+def load_bills():
+    bills = bill_jsons()
+    counter = itertools.count()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def load(_):
+            engine = create_engine(
+                f"sqlite:///{Path(tmp_dir) / f'bench_{next(counter)}.db'}"
+            )
+            try:
+                BulkLoader(engine, initial_load=True).load_bill_jsons(bills)
+            finally:
+                engine.dispose()
+
+        yield load, [bills] * N_LOADS
+
+
+@contextmanager
+def upsert_bills():
+    bills = bill_jsons()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'bench.db'}")
+        loader = UpsertLoader(engine)
+        loader.load_bill_jsons(bills)
+        try:
+            yield loader.load_bill_jsons, [bills] * N_LOADS
+        finally:
+            engine.dispose()
+
+
+BENCHMARKS = [
+    Benchmark("bill_json_to_rows", bill_json_rows, unit="bills"),
+    Benchmark(
+        "validate_votes", validate_votes, unit="rows", size=lambda batch: VOTE_BATCH
+    ),
+    Benchmark(
+        "validate_votes_many",
+        validate_votes_many,
+        unit="rows",
+        size=lambda batch: VOTE_BATCH,
+    ),
+    Benchmark("load_bills", load_bills, unit="bills", size=len),
+    Benchmark("upsert_bills", upsert_bills, unit="bills", size=len),
+]
@@ -0,0 +1,72 @@
+"""
+OCR and vote text benchmarks.
+
+    extract_text_from_page   render and OCR the pages of a vote PDF generated
+                             locally from the saved vote page text
+    text_to_votes            split the OCR text of a vote page into votes
+"""
+
+from contextlib import contextmanager
+
+from estecon.benchmarks.harness import FIXTURES, Benchmark
+
+# Letter, in points
+PAGE_SIZE = (612, 792)
+N_PAGES = 3
+N_VOTE_PAGES = 50
+
+
+def make_vote_pdf(n_pages: int = N_PAGES) -> bytes:
+    """
+    PDF of `n_pages` pages with the text of a vote page, like the ones the
+    Congress publishes.
+    """
+    import fitz
+
+    lines = (FIXTURES / "vote_page.txt").read_text(encoding="utf-8").splitlines()
+    with fitz.open() as pdf:
+        for _ in range(n_pages):
+            page = pdf.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+            # Two columns, as in the vote PDFs
+            half = len(lines) // 2
+            page.insert_textbox(
+                fitz.Rect(36, 36, 306, 756), "\n".join(lines[:half]), fontsize=7
+            )
+            page.insert_textbox(
+                fitz.Rect(306, 36, 576, 756), "\n".join(lines[half:]), fontsize=7
+            )
+        return pdf.tobytes()
+
+
+@contextmanager
+def extract_text_from_page():
+    import fitz
+    from estecon.backend.scrapers.scrape_project_bills import extract_text_from_page
+
+    with fitz.open(stream=make_vote_pdf(), filetype="pdf") as pdf:
+        yield extract_text_from_page, list(pdf)
+
+
+@contextmanager
+def text_to_votes():
+    from estecon.backend.scrapers.extract_votes import text_to_votes
+
+    text = (FIXTURES / "vote_page.txt").read_text(encoding="utf-8")
+    yield (lambda bill_id: text_to_votes(text, bill_id)), range(N_VOTE_PAGES)
+
+
+BENCHMARKS = [
+    Benchmark(
+        "extract_text_from_page",
+        extract_text_from_page,
+        unit="pages",
+        modules=("fitz", "pytesseract", "cv2"),
+        programs=("tesseract",),
+    ),
+    Benchmark(
+        "text_to_votes",
+        text_to_votes,
+        unit="pages",
+        modules=("fitz", "pytesseract", "cv2"),
+    ),
+]
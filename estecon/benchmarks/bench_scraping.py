@@ -0,0 +1,87 @@
+"""
+Scraper parsing benchmarks, on saved pages instead of the Congress sites.
+
+    congresista_parsing   get_cong_party_info on a saved profile page, served by
+                          an in-memory transport
+    get_steps             get_steps on a saved expediente, its vote step files
+                          read from a temporary OCR cache
+"""
+
+import asyncio
+import json
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+from estecon.benchmarks.harness import FIXTURES, Benchmark, temporary_database
+
+BASE_URL = "https://www.congreso.gob.pe/pleno/congresistas"
+N_CONGRESISTAS = 130
+N_BILLS = 50
+
+
+@contextmanager
+def congresista_parsing():
+    from estecon.backend import LegPeriod
+    from estecon.backend.scrapers.scrape_congresistas import get_cong_party_info
+
+    html = (FIXTURES / "congresista.html").read_text(encoding="utf-8")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text=html))
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(transport=transport)
+    leg_period = LegPeriod.PERIODO_2021_2026
+
+    def parse(link: str):
+        congresista, party = loop.run_until_complete(
+            get_cong_party_info(client, BASE_URL, link, leg_period)
+        )
+        assert congresista is not None
+        return congresista
+
+    # Parties get their ids from the registry, in a throwaway database
+    with temporary_database():
+        try:
+            yield parse, [f"/perfil?id={1000 + i}" for i in range(N_CONGRESISTAS)]
+        finally:
+            loop.run_until_complete(client.aclose())
+            loop.close()
+
+
+@contextmanager
+def get_steps():
+    from estecon.backend.scrapers import scrape_project_bills
+    from estecon.backend.scrapers.scrape_utils import (
+        save_ocr_txt_to_cache,
+        url_to_cache_file,
+    )
+
+    data = json.loads((FIXTURES / "expediente.json").read_text(encoding="utf-8"))
+    vote_text = (FIXTURES / "vote_page.txt").read_text(encoding="utf-8")
+    cache_dir = scrape_project_bills.OCR_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Every other vote step file is a vote, the rest are reports
+        for i, url in enumerate(scrape_project_bills.vote_step_file_urls(data)):
+            text = (
+                vote_text
+                if i % 2 == 0
+                else "DICTAMEN RECAÍDO EN EL PROYECTO DE LEY 10300/2024-CR"
+            )
+            save_ocr_txt_to_cache(text, url_to_cache_file(url, Path(tmp_dir)))
+        scrape_project_bills.OCR_CACHE_DIR = Path(tmp_dir)
+        try:
+            yield (
+                (lambda number: scrape_project_bills.get_steps(data, 2021, number)),
+                range(N_BILLS),
+            )
+        finally:
+            scrape_project_bills.OCR_CACHE_DIR = cache_dir
+
+
+BENCHMARKS = [
+    Benchmark("congresista_parsing", congresista_parsing, unit="pages"),
+    Benchmark(
+        "get_steps", get_steps, unit="bills", modules=("fitz", "pytesseract", "cv2")
+    ),
+]
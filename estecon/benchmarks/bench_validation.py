@@ -0,0 +1,79 @@
+"""
+Compares the ways of turning rows into schema objects on Vote rows:
+
+    per_row     Vote(**row) for every row, as the scrapers do
+    adapter     validate_many, one cached TypeAdapter call for the whole list
+    trusted     validate_many(trusted=True), which uses the adapter too since
+                Vote has no Python validators
+    construct   construct_many, model_construct without validation
+
+Run with `python -m estecon.benchmarks.bench_validation --rows 1000000`.
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+from estecon.backend import VoteOption
+from estecon.backend.scrapers.schema import Vote, construct_many, validate_many
+
+OPTIONS = [option.value for option in VoteOption]
+
+
+def make_rows(n_rows: int) -> List[dict]:
+    """
+    Vote rows as they come out of the database or a Parquet file, with the
+    options as plain strings.
+    """
+    return [
+        {
+            "vote_event_id": f"ev{i // 130}",
+            "voter_id": i % 130,
+            "option": OPTIONS[i % len(OPTIONS)],
+            "bancada_id": i % 11,
+        }
+        for i in range(n_rows)
+    ]
+
+
+PATHS: Dict[str, Callable[[List[dict]], List[Vote]]] = {
+    "per_row": lambda rows: [Vote(**row) for row in rows],
+    "adapter": lambda rows: validate_many(Vote, rows),
+    "trusted": lambda rows: validate_many(Vote, rows, trusted=True),
+    "construct": lambda rows: construct_many(Vote, rows),
+}
+
+
+def run(n_rows: int = 1_000_000, repeat: int = 1) -> Dict[str, float]:
+    """
+    Returns the best time in seconds of each path over `repeat` runs.
+    """
+    rows = make_rows(n_rows)
+    results = {}
+    for name, path in PATHS.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            votes = path(rows)
+            timings.append(time.perf_counter() - start)
+        assert len(votes) == n_rows and votes[-1].option == VoteOption(
+            rows[-1]["option"]
+        )
+        results[name] = min(timings)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the validation paths of the schema layer"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    for name, seconds in results.items():
+        print(
+            f"{name:>9}: {seconds:8.3f} s  {args.rows / seconds:12,.0f} rows/s  "
+            f"x{results['per_row'] / seconds:.1f}"
+        )
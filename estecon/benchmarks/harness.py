@@ -0,0 +1,202 @@
+"""
+Runner of the offline benchmarks.
+
+A benchmark times a function over the items built by its setup from fixed
+local fixtures (no network), reporting the throughput and the latency of every
+call. The setup isn't timed. Benchmarks whose dependencies aren't installed,
+e.g. Tesseract for OCR, are reported as skipped with the reason, so every run
+has an entry for every benchmark. Results are written as JSON, with the
+commit and environment they were measured on, to compare runs over time.
+"""
+
+import importlib.util
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from estecon.backend.config import settings
+from estecon.backend.database.registry import bancada_registry, party_registry
+from estecon.backend.database.session import dispose_engine
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+RESULTS_VERSION = 1
+
+
+@dataclass
+class Benchmark:
+    """
+    Attributes:
+        name (str): Name of the benchmark in the results.
+        setup (Callable): Context manager yielding the function to time and
+            the items to call it on, as (func, items), and cleaning up after
+            the timing (e.g. removing a temporary database). Not timed.
+        unit (str): What an item is, e.g. "pages".
+        modules (Sequence[str]): Modules that must be importable.
+        programs (Sequence[str]): Programs that must be on the PATH.
+        size (Optional[Callable]): Number of units in an item, 1 by default.
+    """
+
+    name: str
+    setup: Callable[[], ContextManager[Tuple[Callable[[Any], Any], Sequence]]]
+    unit: str = "items"
+    modules: Sequence[str] = ()
+    programs: Sequence[str] = ()
+    size: Optional[Callable[[Any], int]] = None
+
+    def missing(self) -> List[str]:
+        return [
+            module
+            for module in self.modules
+            if importlib.util.find_spec(module) is None
+        ] + [program for program in self.programs if shutil.which(program) is None]
+
+
+@dataclass
+class BenchResult:
+    name: str
+    unit: str
+    calls: int = 0
+    units: int = 0
+    seconds: float = 0.0
+    throughput: float = 0.0
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+    skipped: Optional[str] = None
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_benchmark(
+    benchmark: Benchmark, repeat: int = 3, warmup: int = 1
+) -> BenchResult:
+    """
+    Calls the function on every item `warmup` times untimed, then `repeat`
+    times timing every call.
+    """
+    result = BenchResult(benchmark.name, benchmark.unit)
+    missing = benchmark.missing()
+    if missing:
+        result.skipped = f"missing {', '.join(missing)}"
+        return result
+    with ExitStack() as stack:
+        try:
+            func, items = stack.enter_context(benchmark.setup())
+        except Exception as e:
+            result.skipped = f"setup failed: {e!r}"
+            return result
+        sizes = [benchmark.size(item) if benchmark.size else 1 for item in items]
+        for _ in range(warmup):
+            for item in items:
+                func(item)
+        latencies = []
+        for _ in range(repeat):
+            for item in items:
+                start = time.perf_counter()
+                func(item)
+                latencies.append(time.perf_counter() - start)
+
+    result.calls = len(latencies)
+    result.units = sum(sizes) * repeat
+    result.seconds = sum(latencies)
+    result.throughput = result.units / result.seconds if result.seconds else 0.0
+    if latencies:
+        result.latency_ms = {
+            "mean": statistics.fmean(latencies) * 1000,
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "max": max(latencies) * 1000,
+        }
+    return result
+
+
+@contextmanager
+def temporary_database() -> Iterator[Path]:
+    """
+    Points the shared engine and the id registries to an empty SQLite database
+    while the block runs.
+    """
+    url = settings.DB_URL
+    tmp_dir = tempfile.TemporaryDirectory()
+    path = Path(tmp_dir.name) / "bench.db"
+    settings.DB_URL = f"sqlite:///{path.as_posix()}"
+    dispose_engine()
+    party_registry.clear()
+    bancada_registry.clear()
+    try:
+        yield path
+    finally:
+        settings.DB_URL = url
+        dispose_engine()
+        party_registry.clear()
+        bancada_registry.clear()
+        tmp_dir.cleanup()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def write_results(results: List[BenchResult], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "version": RESULTS_VERSION,
+        "environment": environment(),
+        "benchmarks": [asdict(result) for result in results],
+    }
+    path.write_text(json.dumps(document, indent=2), encoding="utf-8")
+
+
+def compare(baseline: Path, results: List[BenchResult]) -> Dict[str, float]:
+    """
+    Throughput of every benchmark relative to a previous results file, for
+    the ones that ran in both.
+    """
+    before = {
+        bench["name"]: bench
+        for bench in json.loads(baseline.read_text(encoding="utf-8"))["benchmarks"]
+    }
+    return {
+        result.name: result.throughput / before[result.name]["throughput"]
+        for result in results
+        if result.skipped is None and before.get(result.name, {}).get("throughput")
+    }
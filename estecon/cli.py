@@ -0,0 +1,455 @@
+"""
+Command line interface of the OpenPeru pipeline: `python -m estecon <command>`.
+
+    congresistas    scrape the congresistas and parties of every period and load them
+    bills           scrape a range of bills through the staged pipeline and load them
+    run             congresistas, then bills through one pipeline, then the identity index
+    load            load the bill store (or a directory of bill jsons) into the database
+    identity        build the identity index of congresistas and signers, or resolve names
+    enqueue-votes   put the vote PDFs found in the work queue, to OCR them with workers
+    worker          process work queue jobs until the queue drains
+
+With `--metrics PATH` (or METRICS_ENABLED), the hot path metrics of the command
+are written to PATH while it runs, as a Prometheus textfile or, for .json, as
+JSON snapshots.
+"""
+
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import chain
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import polars as pl
+from loguru import logger
+
+from estecon.backend import LegPeriod
+from estecon.backend.config import settings
+from estecon.backend.jobs.queue import (
+    HANDLERS,
+    LEASE_SECONDS,
+    WORK_QUEUE_DB,
+    WorkQueue,
+    content_hash,
+    run_worker,
+)
+from estecon.backend.jobs.scheduler import RefreshSchedule
+from estecon.backend.jobs.state import JobState
+from estecon.backend.metrics import start_exporter
+
+VOTE_PDFS = Path(__file__).resolve().parents[1] / "data" / "vote_pdfs.csv"
+# Entity types of the schedule that have a scraper
+REFRESHABLE = ("congresistas", "bills")
+
+
+def get_periodos() -> Dict[str, str]:
+    from estecon.backend import URL
+    from estecon.backend.scrapers.scrape_congresistas import get_dict_periodos
+
+    return get_dict_periodos(URL["congresistas"])
+
+
+def refresh_congresistas(
+    state: JobState, schedule: RefreshSchedule, periods: Optional[Set[str]] = None
+):
+    """
+    Scrapes and loads the periods one by one, skipping the ones already done
+    and, if given, the ones not in `periods`.
+    """
+    from estecon.backend.pipeline import CongresistaLoader, period_jobs
+
+    load_period = CongresistaLoader(state, schedule=schedule)
+    for job in period_jobs(state, get_periodos(), periods):
+        load_period(job)
+    logger.info(f"Congresistas job state: {state.counts('congresistas')}")
+
+
+def refresh_bills(
+    state: JobState,
+    schedule: RefreshSchedule,
+    bill_ids: Iterable[str],
+    args: argparse.Namespace,
+    periodos: Optional[Dict[str, str]] = None,
+):
+    """
+    Runs the bills that aren't done yet through the pipeline, after the
+    periods of congresistas ({periodo: valor}) that aren't done yet, if given.
+    The urls of the vote PDFs found, in this run or before, are written to a
+    csv.
+    """
+    from estecon.backend.pipeline import (
+        BillSink,
+        CongresistaLoader,
+        bill_jobs,
+        bill_pipeline,
+        period_jobs,
+    )
+
+    pipeline = bill_pipeline(
+        BillSink(state, schedule=schedule),
+        state,
+        fetch_concurrency=args.fetch_concurrency,
+        download_concurrency=args.download_concurrency,
+        ocr_concurrency=args.ocr_concurrency,
+        congresistas=(
+            CongresistaLoader(state, schedule=schedule)
+            if periodos is not None
+            else None
+        ),
+        votes=args.parse_votes,
+    )
+    jobs = bill_jobs(state, bill_ids)
+    if periodos is not None:
+        jobs = chain(period_jobs(state, periodos), jobs)
+    result = pipeline.run(jobs)
+    vote_pdfs = state.outputs("vote_pdf")
+    if vote_pdfs:
+        pl.DataFrame(vote_pdfs, schema=["id", "url"], orient="row").write_csv(
+            args.vote_pdfs
+        )
+    logger.info(
+        f"Scraped {result.stats['load'].processed} bills in {result.seconds:.0f} s, "
+        f"job state: {state.counts('bill')}"
+    )
+
+
+def scrape_congresistas(args: argparse.Namespace):
+    state = JobState()
+    if args.restart:
+        state.reset("congresistas")
+    refresh_congresistas(state, RefreshSchedule())
+
+
+def scrape_bills(args: argparse.Namespace, periodos: Optional[Dict[str, str]] = None):
+    state = JobState()
+    if args.restart:
+        state.reset("bill")
+        if periodos is not None:
+            state.reset("congresistas")
+    refresh_bills(
+        state,
+        RefreshSchedule(),
+        [f"{args.year}_{n}" for n in range(args.first, args.last + 1)],
+        args,
+        periodos,
+    )
+
+
+def run(args: argparse.Namespace):
+    """
+    Scrapes the congresistas and then the bills through one pipeline, and
+    updates the identity index with both.
+    """
+    from estecon.backend.database.session import get_engine
+    from estecon.backend.ingestion.identity import build_identity_index
+
+    scrape_bills(args, get_periodos())
+    with get_engine().connect() as conn:
+        build_identity_index(conn)
+
+
+def refresh(args: argparse.Namespace):
+    """
+    Refreshes the stalest congresista periods and bills that fit in the window.
+    Bills are known from the bill store; new ones are found with `bills`.
+    """
+    from estecon.backend.ingestion.bill_store import BillStore
+
+    schedule = RefreshSchedule()
+    schedule.register("congresistas", [period.value for period in LegPeriod])
+    with BillStore() as store:
+        schedule.register("bills", store.ids())
+
+    plan = schedule.plan(
+        window=timedelta(hours=args.window_hours), entities=REFRESHABLE
+    )
+    by_entity = {
+        entity: [item.item_id for item in plan if item.entity == entity]
+        for entity in REFRESHABLE
+    }
+    logger.info(
+        f"Refresh plan: { {entity: len(ids) for entity, ids in by_entity.items()} }, "
+        f"{sum(item.estimated_seconds for item in plan) / 3600:.1f} h estimated"
+    )
+    if args.dry_run:
+        for item in plan:
+            print(
+                f"{item.entity:>13} {item.item_id:<30} due {item.due_at or 'never refreshed'}"
+            )
+        return
+
+    if not plan:
+        return
+    state = JobState()
+    state.reset("congresistas", by_entity["congresistas"])
+    state.reset("bill", by_entity["bills"])
+    periodos = None
+    if by_entity["congresistas"]:
+        periodos = {
+            periodo: valor
+            for periodo, valor in get_periodos().items()
+            if periodo in by_entity["congresistas"]
+        }
+    refresh_bills(state, schedule, by_entity["bills"], args, periodos)
+
+
+def load(args: argparse.Namespace):
+    from estecon.backend.ingestion.bill_reader import iter_bills
+    from estecon.backend.ingestion.load_to_db import BulkLoader, bill_json_to_rows
+    from estecon.backend.ingestion.upsert import UpsertLoader
+
+    loader = BulkLoader(initial_load=True) if args.initial else UpsertLoader()
+    loader.load_bill_rows(
+        iter_bills(
+            args.source,
+            workers=args.workers,
+            transform=bill_json_to_rows,
+            ordered=False,
+        )
+    )
+
+
+def identity(args: argparse.Namespace):
+    """
+    Updates the identity index with the congresistas of the database and the
+    signers of the bills or, with `--resolve`, prints the person id of names.
+    """
+    from estecon.backend.database.session import get_engine
+    from estecon.backend.ingestion.identity import (
+        IDENTITY_FILE,
+        IdentityIndex,
+        build_identity_index,
+    )
+
+    path = args.output or IDENTITY_FILE
+    if args.resolve:
+        index = IdentityIndex.load(path)
+        for name in args.resolve:
+            print(f"{index.resolve_name(name, args.period)}\t{name}")
+        return
+    with get_engine().connect() as conn:
+        build_identity_index(conn, args.source, path)
+
+
+def enqueue_votes(args: argparse.Namespace):
+    """
+    Enqueues a vote_pdf job for every vote PDF in the job state, or in the csv
+    of vote PDFs if the job state has none. PDFs are deduplicated by url, and
+    the ones whose OCR failed for good are queued again.
+    """
+    vote_pdfs = JobState().outputs("vote_pdf")
+    if not vote_pdfs and args.vote_pdfs.exists():
+        vote_pdfs = pl.read_csv(args.vote_pdfs).rows()
+    with WorkQueue(args.queue) as queue:
+        added = sum(
+            queue.enqueue(
+                "vote_pdf", {"id": vote_id, "url": url}, content_hash("vote_pdf", url)
+            )[1]
+            for vote_id, url in vote_pdfs
+            if url
+        )
+        logger.info(
+            f"Enqueued {added} of {len(vote_pdfs)} vote PDFs (new or retried), queue: {queue.counts()}"
+        )
+
+
+def worker(args: argparse.Namespace):
+    """
+    Runs workers in `--processes` processes until the queue drains. More
+    workers can be started on other machines that see the same queue file.
+    """
+    if args.processes == 1:
+        run_worker(args.queue, args.kinds, args.lease)
+        return
+    # Every process writes its own metrics file
+    metrics_path = None
+    if args.metrics is not None:
+        metrics_path = str(
+            args.metrics.with_name(f"{args.metrics.stem}_{{pid}}{args.metrics.suffix}")
+        )
+    with ProcessPoolExecutor(
+        max_workers=args.processes, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = [
+            pool.submit(run_worker, args.queue, args.kinds, args.lease, metrics_path)
+            for _ in range(args.processes)
+        ]
+        done = [future.result() for future in futures]
+    logger.info(
+        f"Workers finished, {sum(d['succeeded'] for d in done)} jobs succeeded, "
+        f"{sum(d['failed'] for d in done)} failed"
+    )
+
+
+def add_bill_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--year", type=int, default=2021, help="period start year of the bills"
+    )
+    parser.add_argument("--first", type=int, default=1, help="first bill number")
+    parser.add_argument("--last", type=int, default=501, help="last bill number")
+    parser.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        default=2,
+        help="bills requested at the same time",
+    )
+    parser.add_argument(
+        "--download-concurrency",
+        type=int,
+        default=4,
+        help="PDFs downloaded at the same time",
+    )
+    parser.add_argument(
+        "--ocr-concurrency",
+        type=int,
+        default=None,
+        help="OCR processes, one per core by default",
+    )
+    parser.add_argument(
+        "--vote-pdfs", type=Path, default=VOTE_PDFS, help="csv of the vote PDFs found"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="forget the job state and start over"
+    )
+    parser.add_argument(
+        "--parse-votes",
+        action="store_true",
+        help="parse the votes of the vote PDFs and load them (experimental)",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="estecon", description="OpenPeru data pipeline"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        default=None,
+        help="write metrics to this .prom or .json file while running",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=None,
+        help="seconds between metric writes",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    congresistas = commands.add_parser(
+        "congresistas", help="scrape and load congresistas and parties"
+    )
+    congresistas.add_argument(
+        "--restart", action="store_true", help="forget the job state and start over"
+    )
+    congresistas.set_defaults(func=scrape_congresistas)
+
+    bills = commands.add_parser("bills", help="scrape and load a range of bills")
+    add_bill_arguments(bills)
+    bills.set_defaults(func=scrape_bills)
+
+    run_parser = commands.add_parser(
+        "run", help="scrape congresistas, then bills, then update the identity index"
+    )
+    add_bill_arguments(run_parser)
+    run_parser.set_defaults(func=run)
+
+    refresh_parser = commands.add_parser(
+        "refresh", help="refresh what is stale, most stale first"
+    )
+    add_bill_arguments(refresh_parser)
+    refresh_parser.add_argument(
+        "--window-hours", type=float, default=6.0, help="time available for the run"
+    )
+    refresh_parser.add_argument(
+        "--dry-run", action="store_true", help="only print the plan"
+    )
+    refresh_parser.set_defaults(func=refresh)
+
+    load_parser = commands.add_parser(
+        "load", help="load the scraped bills into the database"
+    )
+    load_parser.add_argument(
+        "--source",
+        "--bill-jsons",
+        type=Path,
+        default=None,
+        help="bill store or bill jsons directory, by default the bill store if it exists",
+    )
+    load_parser.add_argument(
+        "--workers", type=int, default=None, help="parsing processes"
+    )
+    load_parser.add_argument(
+        "--initial",
+        action="store_true",
+        help="bulk insert into an empty database instead of upserting",
+    )
+    load_parser.set_defaults(func=load)
+
+    identity_parser = commands.add_parser(
+        "identity", help="build the identity index or resolve names with it"
+    )
+    identity_parser.add_argument(
+        "--source",
+        "--bill-jsons",
+        type=Path,
+        default=None,
+        help="bill store or bill jsons directory, by default the bill store if it exists",
+    )
+    identity_parser.add_argument(
+        "--output", type=Path, default=None, help="identity index file"
+    )
+    identity_parser.add_argument(
+        "--resolve", nargs="+", default=None, help="names to print the person id of"
+    )
+    identity_parser.add_argument(
+        "--period",
+        choices=[period.value for period in LegPeriod],
+        default=None,
+        help="legislative period to resolve namesakes with",
+    )
+    identity_parser.set_defaults(func=identity)
+
+    enqueue_parser = commands.add_parser(
+        "enqueue-votes", help="put the vote PDFs found in the work queue"
+    )
+    enqueue_parser.add_argument(
+        "--queue", type=Path, default=WORK_QUEUE_DB, help="work queue database"
+    )
+    enqueue_parser.add_argument(
+        "--vote-pdfs", type=Path, default=VOTE_PDFS, help="csv of the vote PDFs found"
+    )
+    enqueue_parser.set_defaults(func=enqueue_votes)
+
+    worker_parser = commands.add_parser(
+        "worker", help="process work queue jobs until the queue drains"
+    )
+    worker_parser.add_argument(
+        "--queue", type=Path, default=WORK_QUEUE_DB, help="work queue database"
+    )
+    worker_parser.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=sorted(HANDLERS),
+        default=None,
+        help="kinds of jobs to take, all by default",
+    )
+    worker_parser.add_argument(
+        "--processes", type=int, default=1, help="worker processes"
+    )
+    worker_parser.add_argument(
+        "--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds"
+    )
+    worker_parser.set_defaults(func=worker)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.metrics is None and not settings.METRICS_ENABLED:
+        args.func(args)
+        return
+    with start_exporter(args.metrics, args.metrics_interval):
+        args.func(args)
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+import pytest
+from sqlalchemy import create_engine
+
+from estecon.backend import AttendanceStatus, LegPeriod, VoteOption
+from estecon.backend.scrapers.schema import Attendance, Vote, VoteEvent
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+def make_vote_event(
+    event_id: str,
+    options: Sequence[VoteOption],
+    date: datetime = datetime(2025, 3, 1),
+    voter_ids: Optional[Iterable[int]] = None,
+    bancada_id: Union[int, Callable[[int], int]] = 1,
+    attendance: bool = False,
+    **fields,
+) -> VoteEvent:
+    """
+    Vote event where voter `voter_ids[k]` votes `options[k]`, by default voters
+    0, 1, 2... `bancada_id` is the bancada of every voter or a function of the
+    voter id, `attendance` adds every voter as present, and `fields` override
+    the other fields of the event.
+    """
+    voter_ids = list(range(len(options)) if voter_ids is None else voter_ids)
+    bancada_of = bancada_id if callable(bancada_id) else lambda i: bancada_id
+    event = dict(
+        id=event_id,
+        org_id=1,
+        leg_period=LegPeriod.PERIODO_2021_2026,
+        bill_id="2021_10300",
+        date=date,
+        votes=[
+            Vote(
+                vote_event_id=event_id,
+                voter_id=i,
+                option=option,
+                bancada_id=bancada_of(i),
+            )
+            for i, option in zip(voter_ids, options)
+        ],
+    )
+    if attendance:
+        event["attendance"] = [
+            Attendance(
+                org_id=fields.get("org_id", 1),
+                event_id=event_id,
+                attendee_id=i,
+                status=AttendanceStatus.PRESENTE,
+            )
+            for i in voter_ids
+        ]
+    return VoteEvent(**{**event, **fields})
+
+
+def alternate_bancadas(voter_id: int) -> int:
+    """
+    Splits the voters of `make_vote_event` between bancadas 1 and 2.
+    """
+    return 1 + voter_id % 2
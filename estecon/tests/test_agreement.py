@@ -0,0 +1,78 @@
+import numpy as np
+import polars as pl
+from estecon.backend import LegPeriod
+from estecon.backend.analytics.agreement import (
+    AgreementAccumulator,
+    pairwise_counts,
+    update_agreement,
+)
+from estecon.backend.analytics.vote_matrix import VoteMatrix
+
+PERIOD = LegPeriod.PERIODO_2021_2026
+
+
+def brute_force(codes, a, b):
+    both = [(x, y) for x, y in zip(codes[a], codes[b]) if x and y]
+    return {
+        "agreements": sum(x == y and x != 4 for x, y in both),
+        "co_votes": sum(x != 4 and y != 4 for x, y in both),
+        "co_absences": sum(x == y == 4 for x, y in both),
+        "co_participation": len(both),
+    }
+
+
+def make_matrix(codes, n_events=None):
+    n_events = codes.shape[1] if n_events is None else n_events
+    return VoteMatrix(
+        PERIOD,
+        np.asfortranarray(codes[:, :n_events]),
+        list(range(10, 10 + codes.shape[0])),
+        [f"ev{j}" for j in range(n_events)],
+        ["2025-01-01"] * n_events,
+    )
+
+
+def test_pairwise_counts_match_brute_force():
+    codes = np.random.default_rng(0).integers(0, 5, size=(8, 300), dtype=np.int8)
+    counts = pairwise_counts(codes, chunk_size=64)
+    for a in range(8):
+        for b in range(8):
+            assert {name: counts[name][a, b] for name in counts} == brute_force(
+                codes, a, b
+            )
+
+
+def test_incremental_updates():
+    codes = np.random.default_rng(1).integers(0, 5, size=(6, 50), dtype=np.int8)
+    accumulator = AgreementAccumulator(PERIOD)
+    assert accumulator.update(make_matrix(codes, 20)) == 20
+    assert accumulator.update(make_matrix(codes)) == 30
+    full = pairwise_counts(codes)
+    for name in full:
+        assert np.array_equal(accumulator.counts[name], full[name])
+
+    # A rebuilt matrix (new row) is counted from scratch
+    grown = np.vstack([codes, np.ones((1, 50), dtype=np.int8)])
+    assert accumulator.update(make_matrix(grown)) == 50
+    assert accumulator.counts["co_votes"].shape == (7, 7)
+
+
+def test_update_agreement_exports_parquet(tmp_path):
+    codes = np.array([[1, 1, 4, 0], [1, 2, 4, 3], [0, 0, 0, 0]], dtype=np.int8)
+    update_agreement(make_matrix(codes, 2), tmp_path)
+    accumulator = update_agreement(make_matrix(codes), tmp_path)
+    assert accumulator.event_ids == ["ev0", "ev1", "ev2", "ev3"]
+
+    pairs = pl.read_parquet(next(tmp_path.glob("*.parquet")))
+    assert pairs.height == 3
+    first = pairs.filter((pl.col("voter_a") == 10) & (pl.col("voter_b") == 11)).row(
+        0, named=True
+    )
+    assert (
+        first["agreements"],
+        first["co_votes"],
+        first["co_absences"],
+        first["co_participation"],
+    ) == (1, 2, 1, 3)
+    assert first["agreement_rate"] == 0.5
+    assert pairs.filter(pl.col("voter_b") == 12)["agreement_rate"].null_count() == 2
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from estecon.backend.config import settings
+from estecon.benchmarks.__main__ import main, run
+from estecon.benchmarks.harness import (
+    Benchmark,
+    compare,
+    run_benchmark,
+    temporary_database,
+    write_results,
+)
+
+
+def test_run_reports_throughput_and_latency():
+    results = run(["congresista_parsing", "bill_json_to_rows"], repeat=1, warmup=0)
+    assert [result.name for result in results] == [
+        "congresista_parsing",
+        "bill_json_to_rows",
+    ]
+    for result in results:
+        assert result.skipped is None
+        assert result.calls > 0 and result.units >= result.calls
+        assert result.throughput > 0
+        assert set(result.latency_ms) == {"mean", "p50", "p95", "max"}
+    with pytest.raises(ValueError):
+        run(["no_such_benchmark"])
+
+
+def test_text_to_votes_runs():
+    for module in ("fitz", "pytesseract", "cv2"):
+        pytest.importorskip(module)
+    (result,) = run(["text_to_votes"], repeat=1, warmup=0)
+    assert result.skipped is None and result.calls > 0
+
+
+def test_missing_dependencies_and_failed_setup_are_skipped():
+    def setup():
+        raise ImportError("no module named backend")
+
+    missing = run_benchmark(Benchmark("ocr", setup, modules=("no_such_module",)))
+    assert missing.skipped == "missing no_such_module"
+    broken = run_benchmark(Benchmark("broken", setup))
+    assert broken.skipped.startswith("setup failed")
+
+
+def test_results_json_and_comparison(tmp_path):
+    output = tmp_path / "results.json"
+    main(
+        [
+            "--only",
+            "bill_json_to_rows",
+            "--repeat",
+            "1",
+            "--output",
+            str(output),
+            "--verbose",
+        ]
+    )
+    document = json.loads(output.read_text())
+    assert document["environment"]["python"]
+    assert document["benchmarks"][0]["name"] == "bill_json_to_rows"
+
+    results = run(["bill_json_to_rows"], repeat=1, warmup=0)
+    results[0].throughput = document["benchmarks"][0]["throughput"] * 2
+    assert compare(output, results) == {"bill_json_to_rows": pytest.approx(2.0)}
+    write_results(results, tmp_path / "again.json")
+    assert (
+        json.loads((tmp_path / "again.json").read_text())["benchmarks"][0]["throughput"]
+        == results[0].throughput
+    )
+
+
+def test_temporary_database_restores_settings():
+    url = settings.DB_URL
+    with temporary_database() as path:
+        assert settings.DB_URL.endswith(path.name)
+    assert settings.DB_URL == url
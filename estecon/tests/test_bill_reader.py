@@ -0,0 +1,70 @@
+import pytest
+from pathlib import Path
+from estecon.backend.ingestion.bill_reader import bill_key, iter_bills, list_bill_paths
+from estecon.backend.ingestion.bill_store import BillStore
+from estecon.backend.ingestion.load_to_db import bill_json_to_rows, iter_bill_jsons
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+
+
+def test_bill_key_and_id_range():
+    assert bill_key("2021_9999") < bill_key("2021_10300") < bill_key("2026_1")
+    paths = list_bill_paths(BILL_JSONS, id_range=("2021_10302", "2021_10305"))
+    assert [p.stem for p in paths] == [
+        "2021_10302",
+        "2021_10303",
+        "2021_10304",
+        "2021_10305",
+    ]
+    assert (
+        list_bill_paths(BILL_JSONS, id_range=(None, "2021_10301"))[-1].stem
+        == "2021_10301"
+    )
+
+
+@pytest.mark.parametrize("use_threads", [False, True])
+def test_parallel_matches_sequential(use_threads):
+    expected = list(iter_bill_jsons(BILL_JSONS))
+    ordered = list(
+        iter_bills(BILL_JSONS, workers=3, use_threads=use_threads, chunk_size=2)
+    )
+    assert [b["id"] for b in ordered] == [b["id"] for b in expected]
+    assert ordered == expected
+
+    unordered = iter_bills(
+        BILL_JSONS, workers=3, use_threads=use_threads, ordered=False, chunk_size=2
+    )
+    assert sorted(b["id"] for b in unordered) == sorted(b["id"] for b in expected)
+
+
+def test_filters_and_transform():
+    bills = list(iter_bill_jsons(BILL_JSONS))
+    year = int(bills[0]["presentation_date"][:4])
+    in_year = list(iter_bills(BILL_JSONS, workers=2, years=[year], chunk_size=4))
+    assert {b["id"] for b in in_year} == {
+        b["id"] for b in bills if b["presentation_date"].startswith(str(year))
+    }
+
+    rows = list(
+        iter_bills(BILL_JSONS, workers=2, transform=bill_json_to_rows, chunk_size=4)
+    )
+    assert rows == [bill_json_to_rows(b) for b in bills]
+
+
+def test_reads_bill_store(tmp_path):
+    bills = list(iter_bill_jsons(BILL_JSONS))
+    with BillStore(tmp_path / "store", block_size=4) as store:
+        store.put_many(reversed(bills))
+    assert list(iter_bills(tmp_path / "store", workers=1)) == bills
+    ordered = list(iter_bills(tmp_path / "store", workers=2, chunk_size=3))
+    assert ordered == bills
+    in_range = iter_bills(
+        tmp_path / "store",
+        workers=2,
+        id_range=("2021_10302", "2021_10305"),
+        ordered=False,
+        transform=bill_json_to_rows,
+    )
+    assert sorted(rows["bills"][0]["id"] for rows in in_range) == [
+        f"2021_1030{i}" for i in range(2, 6)
+    ]
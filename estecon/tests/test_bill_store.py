@@ -0,0 +1,119 @@
+import json
+import threading
+import pytest
+from pathlib import Path
+from estecon.backend.ingestion.bill_store import BillStore
+from estecon.backend.ingestion.load_to_db import iter_bill_jsons
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+
+
+@pytest.fixture
+def bills():
+    return list(iter_bill_jsons(BILL_JSONS))
+
+
+@pytest.fixture
+def store(tmp_path):
+    with BillStore(tmp_path / "store", block_size=4) as store:
+        yield store
+
+
+def test_put_and_get(store, bills):
+    assert store.put_many(bills) == len(bills)
+    assert len(store) == len(bills)
+    assert store.get(bills[5]["id"]) == bills[5]
+    assert store.get("missing") is None
+    found = store.get_many([bills[0]["id"], bills[-1]["id"], "missing"])
+    assert found == {bills[0]["id"]: bills[0], bills[-1]["id"]: bills[-1]}
+    assert [bill["id"] for bill in store.iter_bills()] == [bill["id"] for bill in bills]
+    assert sum(p.stat().st_size for p in store.segments()) < sum(
+        p.stat().st_size for p in BILL_JSONS.glob("*.json")
+    )
+
+
+def test_updates_delete_and_compaction(store, bills):
+    store.put_many(bills)
+    store.put(dict(bills[0], title="NUEVO\u2028TÍTULO"))
+    assert store.delete(bills[1]["id"])
+    assert bills[1]["id"] not in store
+    assert store.get(bills[0]["id"])["title"] == "NUEVO\u2028TÍTULO"
+
+    stats = store.compact()
+    assert stats["bills"] == len(bills) - 1
+    assert stats["bytes_after"] < stats["bytes_before"]
+    assert store.get(bills[0]["id"])["title"] == "NUEVO\u2028TÍTULO"
+    assert store.get(bills[2]["id"]) == bills[2]
+
+
+def test_rebuild_index(store, bills):
+    store.put_many(bills[:10])
+    store.put_many(bills[5:])
+    store.put(dict(bills[3], status="Archivado"))
+    store._index.execute("DELETE FROM bills")
+    assert store.rebuild_index() == len(bills)
+    assert store.get(bills[3]["id"])["status"] == "Archivado"
+    assert store.get(bills[-1]["id"]) == bills[-1]
+
+
+def test_segments_roll_over(tmp_path, bills):
+    with BillStore(tmp_path / "store", block_size=2, segment_size=1) as store:
+        store.put_many(bills[:6])
+        assert len(store.segments()) == 3
+        assert list(store.iter_bills()) == bills[:6]
+
+
+def test_json_dir_round_trip(store, bills, tmp_path):
+    assert store.import_json_dir(BILL_JSONS) == len(bills)
+    assert store.export_json_dir(tmp_path / "export") == len(bills)
+    exported = json.loads(
+        (tmp_path / "export" / f"{bills[0]['id']}.json").read_text(encoding="utf-8")
+    )
+    assert exported == bills[0]
+
+
+def test_interrupted_compaction_keeps_the_bills(store, bills, monkeypatch):
+    store.put_many(bills)
+    store.put(dict(bills[0], title="NUEVO"))
+    segments = store.segments()
+
+    def crash(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("estecon.backend.ingestion.bill_store.os.replace", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+    assert store.segments() == segments
+    assert (
+        store.get(bills[0]["id"])["title"] == "NUEVO"
+        and store.get(bills[-1]["id"]) == bills[-1]
+    )
+
+    assert store.compact()["bills"] == len(bills)
+    assert not list(store.root.glob("*.tmp"))
+    assert (
+        store.get(bills[0]["id"])["title"] == "NUEVO"
+        and store.get(bills[-1]["id"]) == bills[-1]
+    )
+
+
+def test_writers_on_the_same_root_take_turns(store, bills):
+    written = threading.Event()
+
+    def put():
+        # Another store on the same root, as another process would open
+        with BillStore(store.root, block_size=4) as other:
+            other.put_many(bills[:8])
+        written.set()
+
+    with store._write_lock():
+        thread = threading.Thread(target=put)
+        thread.start()
+        assert not written.wait(0.2)
+        store.put_many(bills[8:16])
+    thread.join(5)
+    assert written.is_set()
+    assert store.get_many([bill["id"] for bill in bills[:16]]) == {
+        bill["id"]: bill for bill in bills[:16]
+    }
@@ -0,0 +1,146 @@
+import pytest
+import polars as pl
+from datetime import datetime
+from pathlib import Path
+from estecon.backend import VoteOption, LegPeriod
+from estecon.backend.analytics.cohesion import (
+    cohesion_metrics,
+    export_cohesion,
+    load_votes,
+    rolling_cohesion,
+)
+from estecon.backend.ingestion.load_to_db import BulkLoader, iter_bill_jsons
+from estecon.backend.scrapers.schema import Congresista
+from estecon.tests.conftest import make_vote_event
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+PERIOD = LegPeriod.PERIODO_2021_2026
+SI, NO, ABS, SR = (
+    VoteOption.SI,
+    VoteOption.NO,
+    VoteOption.ABSTENCION,
+    VoteOption.SIN_RESPUESTA,
+)
+
+
+def five_per_bancada(voter_id):
+    return 1 + voter_id // 5
+
+
+def make_congresista(i):
+    return Congresista(
+        id=i,
+        leg_period=PERIOD,
+        nombre=f"Congresista {i}",
+        party_id=10 + i % 2,
+        votes_in_election=1000,
+        dist_electoral="Lima",
+        condicion="en ejercicio",
+        website="",
+    )
+
+
+@pytest.fixture
+def engine(engine):
+    loader = BulkLoader(engine)
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    loader.load_records([make_congresista(i) for i in range(10)])
+    loader.load_records(
+        [
+            make_vote_event(
+                "ev1",
+                [SI, SI, NO, ABS, SR, NO, NO, NO, NO, NO],
+                datetime(2025, 1, 1),
+                bancada_id=five_per_bancada,
+            ),
+            make_vote_event(
+                "ev2",
+                [SI, NO, SI, NO, SI, SI, SI, SI, SI, ABS],
+                datetime(2025, 3, 1),
+                bancada_id=five_per_bancada,
+            ),
+            make_vote_event(
+                "ev3", [SI] * 10, datetime(2025, 9, 1), bancada_id=five_per_bancada
+            ),
+        ]
+    )
+    return engine
+
+
+def test_bancada_metrics(engine):
+    with engine.connect() as conn:
+        votes = load_votes(conn, PERIOD)
+    assert votes.height == 30
+    metrics = cohesion_metrics(votes, "bancada_id")
+    assert metrics.height == 6
+
+    first = metrics.filter(
+        (pl.col("vote_event_id") == "ev1") & (pl.col("bancada_id") == 1)
+    ).row(0, named=True)
+    assert (first["si"], first["no"], first["abstencion"], first["sin_respuesta"]) == (
+        2,
+        1,
+        1,
+        1,
+    )
+    assert first["majority"] == VoteOption.SI.value
+    assert first["rice_index"] == pytest.approx(1 / 3)
+    assert first["defection_share"] == pytest.approx(2 / 4)
+    assert first["abstention_rate"] == first["absence_rate"] == pytest.approx(1 / 5)
+
+    second = metrics.filter(
+        (pl.col("vote_event_id") == "ev2") & (pl.col("bancada_id") == 1)
+    ).row(0, named=True)
+    assert second["majority"] == VoteOption.SI.value
+    assert second["defection_share"] == pytest.approx(2 / 5)
+    assert metrics.filter(pl.col("vote_event_id") == "ev3")["rice_index"].to_list() == [
+        1.0,
+        1.0,
+    ]
+
+
+def test_party_metrics_and_rolling(engine):
+    with engine.connect() as conn:
+        votes = load_votes(conn, PERIOD)
+    metrics = cohesion_metrics(votes, "party_id")
+    assert sorted(metrics["party_id"].unique().to_list()) == [10, 11]
+
+    rolling = rolling_cohesion(
+        cohesion_metrics(votes, "bancada_id"), "bancada_id", window="90d"
+    )
+    bancada_2 = rolling.filter(pl.col("bancada_id") == 2)
+    assert bancada_2["events"].to_list() == [1, 2, 1]
+    assert bancada_2["rice_index"].to_list() == pytest.approx([1.0, 1.0, 1.0])
+
+
+def test_matches_get_counts_by_bancada():
+    event = make_vote_event(
+        "ev1",
+        [SI, NO, NO, ABS, SR, SI, SI, NO, SR, SR],
+        datetime(2025, 1, 1),
+        bancada_id=five_per_bancada,
+    )
+    votes = pl.DataFrame(
+        {
+            "vote_event_id": [v.vote_event_id for v in event.votes],
+            "date": [event.date] * len(event.votes),
+            "option": [v.option.value for v in event.votes],
+            "bancada_id": [v.bancada_id for v in event.votes],
+        }
+    )
+    metrics = cohesion_metrics(votes)
+    for bancada_id, counts in event.get_counts_by_bancada().items():
+        row = metrics.filter(pl.col("bancada_id") == bancada_id).row(0, named=True)
+        assert {opt: row[opt.name.lower()] for opt in counts} == counts
+
+
+def test_export_cohesion(engine, tmp_path):
+    with engine.connect() as conn:
+        paths = export_cohesion(conn, PERIOD, tmp_path)
+    assert set(paths) == {
+        "bancada_events",
+        "bancada_rolling",
+        "party_events",
+        "party_rolling",
+    }
+    assert pl.read_parquet(paths["party_events"]).height == 6
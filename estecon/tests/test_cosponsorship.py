@@ -0,0 +1,135 @@
+import numpy as np
+import polars as pl
+from pathlib import Path
+from estecon.backend import LegPeriod, RoleTypeBill
+from estecon.backend.analytics.cosponsorship import (
+    ROLE_WEIGHTS,
+    CosponsorshipNetwork,
+    get_signatures,
+    update_network,
+)
+from estecon.backend.ingestion.load_to_db import BulkLoader, iter_bill_jsons
+from estecon.backend.ingestion.upsert import UpsertLoader
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+PERIOD = LegPeriod.PERIODO_2021_2026
+A, C, H = RoleTypeBill.AUTHOR, RoleTypeBill.COAUTHOR, RoleTypeBill.ADHERENTE
+
+
+def dense(network):
+    return network.adjacency.toarray()
+
+
+def test_weights_and_incremental_updates():
+    network = CosponsorshipNetwork(PERIOD)
+    network.add_signatures([("b1", 1, A), ("b1", 2, C), ("b1", 3, H)])
+    assert network.node_ids == [1, 2, 3]
+    assert dense(network)[0, 1] == ROLE_WEIGHTS[A] * ROLE_WEIGHTS[C]
+    assert np.allclose(dense(network), dense(network).T)
+    assert np.all(np.diag(dense(network)) == 0)
+
+    network.add_signatures([("b2", 4, A), ("b2", 1, C)])
+    assert network.node_ids == [1, 2, 3, 4]
+    assert dense(network)[3, 0] == ROLE_WEIGHTS[A] * ROLE_WEIGHTS[C]
+
+    # Replacing a bill removes its previous links
+    network.add_signatures([("b1", 1, A), ("b1", 2, C)])
+    assert dense(network)[0, 2] == 0
+    rebuilt = CosponsorshipNetwork(PERIOD)
+    rebuilt.add_signatures([("b2", 4, A), ("b2", 1, C), ("b1", 1, A), ("b1", 2, C)])
+    # Node 3 stays in the network, without links
+    order = [network.node_index[i] for i in rebuilt.node_ids]
+    assert np.allclose(dense(network)[np.ix_(order, order)], dense(rebuilt))
+    assert network.degree()[network.node_index[3]] == 0
+
+
+def test_metrics():
+    network = CosponsorshipNetwork(PERIOD)
+    # Two cliques joined by a single weak link
+    network.add_signatures(
+        [
+            ("b1", 1, A),
+            ("b1", 2, C),
+            ("b1", 3, C),
+            ("b2", 4, A),
+            ("b2", 5, C),
+            ("b2", 6, C),
+            ("b2", 7, C),
+            ("b3", 3, H),
+            ("b3", 4, H),
+        ]
+    )
+    assert network.degree(weighted=False).tolist() == [2, 2, 3, 4, 3, 3, 3]
+    centrality = network.eigenvector_centrality()
+    assert centrality.max() == 1.0
+    assert network.node_ids[int(centrality.argmax())] in (4, 5, 6, 7)
+
+    communities = network.communities()
+    assert len(set(communities[:3])) == 1 and len(set(communities[3:])) == 1
+    assert communities[0] != communities[3]
+
+
+def test_update_network(tmp_path, engine):
+    bills = list(iter_bill_jsons(BILL_JSONS))
+    BulkLoader(engine).load_bill_jsons(bills[:10])
+    root = tmp_path / "network"
+    with engine.connect() as conn:
+        first = update_network(conn, PERIOD, root)
+    BulkLoader(engine).load_bill_jsons(bills[10:])
+    with engine.connect() as conn:
+        updated = update_network(conn, PERIOD, root)
+    assert len(updated.signers) > len(first.signers)
+
+    full = CosponsorshipNetwork(PERIOD)
+    with engine.connect() as conn:
+        full.add_signatures(get_signatures(conn, PERIOD))
+    order = [full.node_index[i] for i in updated.node_ids]
+    assert np.allclose(dense(updated), dense(full)[np.ix_(order, order)])
+
+    nodes = pl.read_parquet(next(root.glob("nodes_*.parquet")))
+    assert nodes.height == updated.n_nodes
+    assert set(nodes.columns) >= {
+        "person_id",
+        "degree",
+        "eigenvector_centrality",
+        "community",
+    }
+
+
+def test_update_network_rereads_changed_bills(tmp_path, engine):
+    bills = list(iter_bill_jsons(BILL_JSONS))[:10]
+    UpsertLoader(engine).load_bill_jsons(bills)
+    root = tmp_path / "network"
+    with engine.connect() as conn:
+        update_network(conn, PERIOD, root)
+
+    bill = next(b for b in bills if b["coauthors"])
+    moved = bill["coauthors"][0]
+    UpsertLoader(engine).load_bill_jsons(
+        [
+            dict(
+                bill,
+                coauthors=bill["coauthors"][1:],
+                adherents=bill["adherents"] + [moved],
+            )
+        ]
+    )
+    with engine.connect() as conn:
+        # Plus the last bill of the first update, loaded at the boundary
+        changed = {
+            bill_id
+            for bill_id, _, _ in get_signatures(
+                conn, PERIOD, since=read_loaded_through(root)
+            )
+        }
+        assert bill["id"] in changed and len(changed) <= 2
+        updated = update_network(conn, PERIOD, root)
+        full = CosponsorshipNetwork(PERIOD)
+        full.add_signatures(get_signatures(conn, PERIOD))
+    assert updated.signers[bill["id"]][moved["id"]] == ROLE_WEIGHTS[H]
+    order = [full.node_index[i] for i in updated.node_ids]
+    assert np.allclose(dense(updated), dense(full)[np.ix_(order, order)])
+
+
+def read_loaded_through(root):
+    return CosponsorshipNetwork.load(PERIOD, root).loaded_through
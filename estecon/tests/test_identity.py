@@ -0,0 +1,143 @@
+from pathlib import Path
+from estecon.backend import LegPeriod
+from estecon.cli import main
+from estecon.backend.ingestion.identity import (
+    IdentityIndex,
+    build_identity_index,
+    normalize_name,
+)
+from estecon.backend.ingestion.load_to_db import BulkLoader
+from estecon.backend.scrapers.schema import Congresista
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+P2016, P2021 = LegPeriod.PERIODO_2016_2021, LegPeriod.PERIODO_2021_2026
+
+
+def test_normalize_name():
+    assert (
+        normalize_name("Pérez Díaz, Juan")
+        == normalize_name("JUAN PEREZ DIAZ")
+        == "diaz juan perez"
+    )
+    assert (
+        normalize_name("Jáuregui Martínez de Aguayo, María")
+        == "aguayo jauregui maria martinez"
+    )
+
+
+def test_strong_and_fuzzy_keys():
+    index = IdentityIndex()
+    first = index.observe(signer_id=10, dni="12345678", name="Pérez Díaz, Juan Carlos")
+    assert index.observe(signer_id=11, dni="12345678", name="Perez Diaz, Juan") == first
+    other = index.observe(signer_id=12, dni="87654321", name="Torres Vega, Ana")
+    assert other != first
+
+    congresista = index.observe(
+        congresista_id=5,
+        leg_period=P2021,
+        name="JUAN CARLOS PEREZ DIAZ",
+        website="https://www.juanperez.pe/",
+    )
+    # Names are only linked by link_names
+    assert congresista != first
+    # A later period with only a similar name and the same website
+    index.observe(congresista_id=7, leg_period=P2016, name="Juan Carlos Peres Diaz")
+    index.observe(congresista_id=7, leg_period=P2016, website="http://juanperez.pe")
+    assert index.resolve_congresista(7, P2016) == congresista
+
+    # Similar names with different DNIs are never merged
+    index.observe(signer_id=13, dni="11111111", name="Torres Vega, Ana Maria")
+    index.link_names()
+    assert index.resolve_congresista(5, P2021) == first
+    assert index.resolve_congresista(7, P2016) == first
+    assert index.resolve(("signer", "13")) != index.resolve(("signer", "12"))
+
+    assert index.resolve_name("PEREZ DIAZ JUAN CARLOS") == first
+    assert index.resolve_name("PERES DIAZ JUAN KARLOS") == first
+    assert index.resolve_name("Nadie Conocido") is None
+
+
+def test_namesakes_are_not_merged():
+    index = IdentityIndex()
+    # Two congresistas of the same period
+    a = index.observe(congresista_id=1, leg_period=P2021, name="Rojas Quispe, Luis")
+    b = index.observe(congresista_id=2, leg_period=P2021, name="Luis Rojas Quispe")
+    # Two congresistas of different periods with different websites
+    c = index.observe(
+        congresista_id=3, leg_period=P2016, name="Vega Ruiz, Ana", website="anavega.pe"
+    )
+    d = index.observe(
+        congresista_id=4, leg_period=P2021, name="Ana Vega Ruiz", website="anaruiz.pe"
+    )
+    index.link_names()
+    assert len({a, b, c, d}) == 4
+    assert len(index) == 4
+    assert index.resolve_name("LUIS ROJAS QUISPE") is None
+    assert index.resolve_name("LUIS ROJAS QUISPE", P2021) is None
+    assert index.resolve_name("ANA VEGA RUIZ") is None
+    assert index.resolve_name("ANA VEGA RUIZ", P2016) == c
+    assert index.resolve_name("ANA VEGA RUIS", P2021) == d
+
+
+def test_cli_resolves_names(tmp_path, capsys):
+    index = IdentityIndex()
+    index.observe(
+        congresista_id=3, leg_period=P2016, name="Vega Ruiz, Ana", website="anavega.pe"
+    )
+    person_id = index.observe(
+        congresista_id=4, leg_period=P2021, name="Ana Vega Ruiz", website="anaruiz.pe"
+    )
+    index.link_names()
+    index.save(tmp_path / "identity.json")
+
+    main(
+        [
+            "identity",
+            "--output",
+            str(tmp_path / "identity.json"),
+            "--resolve",
+            "ANA VEGA RUIZ",
+            "--period",
+            P2021.value,
+        ]
+    )
+    assert capsys.readouterr().out == f"{person_id}\tANA VEGA RUIZ\n"
+
+
+def test_ids_are_stable(tmp_path):
+    index = IdentityIndex()
+    a = index.observe(signer_id=1, name="Ana Torres Vega")
+    b = index.observe(signer_id=2, dni="222", name="Luis Rojas")
+    c = index.observe(signer_id=3, dni="222")
+    assert b == c and a < b
+    index.save(tmp_path / "index.json")
+
+    loaded = IdentityIndex.load(tmp_path / "index.json")
+    assert loaded.lookup() == index.lookup()
+    assert loaded.names == index.names
+    assert loaded.observe(signer_id=9, name="Maria Quispe") == index.next_person_id
+    # Merging keeps the older id
+    assert loaded.observe(signer_id=9, dni="222") == b
+
+
+def test_build_identity_index(tmp_path, engine):
+    BulkLoader(engine).load_records(
+        [
+            Congresista(
+                id=1,
+                leg_period=P2021,
+                nombre="Jáuregui Martínez de Aguayo, María de los Milagros Jackeline",
+                party_id=1,
+                votes_in_election=100,
+                dist_electoral="Lima",
+                condicion="en ejercicio",
+                website="",
+            ),
+        ]
+    )
+    with engine.connect() as conn:
+        index = build_identity_index(conn, BILL_JSONS, tmp_path / "identity.json")
+    assert index.resolve_congresista(1, P2021) == index.resolve(("dni", "07852432"))
+    assert IdentityIndex.load(tmp_path / "identity.json").resolve(
+        ("signer", "1099")
+    ) == index.resolve(("signer", "1099"))
@@ -0,0 +1,86 @@
+import pytest
+from estecon.backend.jobs.state import DONE, FAILED, RUNNING, JobState
+from estecon.backend.pipeline import Pipeline, Stage, bill_jobs, bill_pipeline
+
+
+@pytest.fixture
+def state(tmp_path):
+    with JobState(tmp_path / "state.db", max_attempts=2) as state:
+        yield state
+
+
+def test_lifecycle(state):
+    state.start("bill", "2021_1", "bills")
+    state.advance("bill", "2021_1", "ocr")
+    record = state.get("bill", "2021_1")
+    assert (record.status, record.stage, record.attempts) == (RUNNING, "ocr", 1)
+
+    state.finish("bill", "2021_1", output="2021_1")
+    state.fail("bill", "2021_2", "timeout")
+    assert state.is_done("bill", "2021_1")
+    assert state.get("bill", "2021_2").last_error == "timeout"
+    assert state.outputs("bill") == [("2021_1", "2021_1")]
+    assert state.counts("bill") == {DONE: 1, FAILED: 1}
+
+
+def test_resume_skips_done_and_retries_failures(state):
+    def crawl(items, fail_on=None):
+        for item in state.pending("bill", items):
+            try:
+                with state.track("bill", item):
+                    if item == fail_on:
+                        raise RuntimeError("boom")
+            except RuntimeError:
+                pass
+
+    crawl(range(5), fail_on=3)
+    assert list(state.pending("bill", range(5))) == [3]
+    crawl(range(5), fail_on=3)
+    # Out of attempts
+    assert list(state.pending("bill", range(5))) == []
+    assert state.get("bill", 3).attempts == 2
+
+    # An item left running by a crash is retried, until it runs out of attempts
+    state.start("bill", 7)
+    assert list(state.pending("bill", [7])) == [7]
+    state.start("bill", 7)
+    assert list(state.pending("bill", [7])) == []
+    assert state.get("bill", 7).status == FAILED
+    assert state.reset("bill") == 6
+
+
+def test_state_survives_reopening(tmp_path):
+    with JobState(tmp_path / "state.db") as state:
+        state.finish("vote_pdf", "2021_3_1", output="https://example.com/a.pdf")
+    with JobState(tmp_path / "state.db") as state:
+        assert state.outputs("vote_pdf") == [("2021_3_1", "https://example.com/a.pdf")]
+
+
+def test_pipeline_records_progress_and_failures(state):
+    def fetch(job):
+        if job.number == 2:
+            raise RuntimeError("not found")
+        return job
+
+    pipeline = Pipeline(
+        [
+            Stage("bills", fetch),
+            Stage("load", lambda job: state.finish("bill", job.bill_id)),
+        ],
+        on_progress=lambda stage, job: state.advance("bill", job.bill_id, stage),
+        on_error=lambda stage, job, e: state.fail("bill", job.bill_id, f"{stage}: {e}"),
+    )
+    pipeline.run(bill_jobs(state, ["2021_1", "2021_2", "2021_3"]))
+    assert state.is_done("bill", "2021_1") and state.is_done("bill", "2021_3")
+    assert state.get("bill", "2021_2").last_error == "bills: not found"
+    assert [
+        job.bill_id for job in bill_jobs(state, ["2021_1", "2021_2", "2021_3"])
+    ] == ["2021_2"]
+
+
+def test_missing_bills_are_recorded_as_failed(state, monkeypatch):
+    scraper = pytest.importorskip("estecon.backend.scrapers.scrape_project_bills")
+    monkeypatch.setattr(scraper, "fetch_bill_data", lambda year, number: None)
+    bill_pipeline(lambda job: None, state).run(bill_jobs(state, ["2021_1"]))
+    record = state.get("bill", "2021_1")
+    assert record.status == FAILED and "not found" in record.last_error
@@ -0,0 +1,88 @@
+from pathlib import Path
+from sqlalchemy import func, inspect, select
+from estecon.backend import (
+    VoteOption,
+    LegPeriod,
+    Legislature,
+    BillStepType,
+    RoleTypeBill,
+)
+from estecon.backend.database.models import Base
+from estecon.backend.ingestion.load_to_db import (
+    BulkLoader,
+    bill_json_to_rows,
+    iter_bill_jsons,
+    parse_legislature,
+    parse_leg_period,
+)
+from estecon.tests.conftest import make_vote_event
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+
+
+def count(engine, table_name):
+    table = Base.metadata.tables[table_name]
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_parse_labels():
+    assert parse_leg_period("2021-2026") == LegPeriod.PERIODO_2021_2026
+    assert (
+        parse_legislature("Primera Legislatura Ordinaria 2024")
+        == Legislature.LEGISLATURA_2024_1
+    )
+    assert (
+        parse_legislature("Segunda Legislatura Ordinaria 2023")
+        == Legislature.LEGISLATURA_2023_2
+    )
+    assert parse_legislature("Legislatura Extraordinaria") is None
+
+
+def test_bill_json_to_rows():
+    data = next(iter_bill_jsons(BILL_JSONS))
+    rows = bill_json_to_rows(data)
+    assert rows["bills"][0]["id"] == data["id"]
+    assert rows["bills_congresistas"][0]["role_type"] == RoleTypeBill.AUTHOR
+    assert len(rows["bill_steps"]) == len(data["steps"])
+    assert rows["bill_steps"][0]["step_type"] == BillStepType.PRESENTED
+
+
+def test_load_bill_jsons(engine):
+    written = BulkLoader(engine, batch_size=7).load_bill_jsons(
+        iter_bill_jsons(BILL_JSONS)
+    )
+    n_bills = len(list(BILL_JSONS.glob("*.json")))
+    assert written["bills"] == n_bills
+    assert count(engine, "bills") == n_bills
+    assert count(engine, "bill_steps") == written["bill_steps"]
+
+
+def test_load_records_explodes_vote_events(engine):
+    events = [
+        make_vote_event(f"ev{i}", [VoteOption.SI] * 130, attendance=True)
+        for i in range(5)
+    ]
+    written = BulkLoader(engine, batch_size=100).load_records(events)
+    assert written == {"vote_events": 5, "votes": 650, "attendance": 650}
+    assert count(engine, "votes") == 650
+
+
+def test_initial_load_rebuilds_indexes(engine):
+    BulkLoader(engine, initial_load=True).load_records(
+        [make_vote_event("ev1", [VoteOption.SI] * 10, attendance=True)]
+    )
+    index_names = {ix["name"] for ix in inspect(engine).get_indexes("votes")}
+    assert {"ix_vote_vote_event_id", "ix_vote_voter_id"} <= index_names
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+
+def test_schema_is_created_once_per_loader(engine, monkeypatch):
+    loader = BulkLoader(engine)
+    assert "votes" in inspect(engine).get_table_names()
+    calls = []
+    monkeypatch.setattr(Base.metadata, "create_all", lambda *a, **kw: calls.append(a))
+    loader.load_records([make_vote_event("ev1", [VoteOption.SI] * 10, attendance=True)])
+    loader.load_records([make_vote_event("ev2", [VoteOption.SI] * 10, attendance=True)])
+    assert calls == [] and count(engine, "votes") == 20
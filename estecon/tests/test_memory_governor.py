@@ -0,0 +1,65 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from estecon.backend.pipeline import Pipeline, Stage
+from estecon.backend.scrapers.memory_governor import (
+    MemoryGovernor,
+    estimate_page_bytes,
+    page_bytes,
+)
+
+
+def test_page_bytes():
+    # Letter page at 300 DPI: 2550 x 3300 pixels, RGB plus the OCR copies
+    assert page_bytes(612, 792) == 2550 * 3300 * 6
+    assert page_bytes(612, 792, dpi=150, channels=1) == 1275 * 1650 * 4
+    page = SimpleNamespace(rect=SimpleNamespace(width=612, height=792))
+    assert estimate_page_bytes(page) == page_bytes(612, 792)
+
+
+def test_governor_waits_for_budget():
+    governor = MemoryGovernor(100)
+    assert governor.acquire(60)
+    assert not governor.acquire(50, timeout=0.05)
+    released = threading.Timer(0.05, governor.release, args=(60,))
+    released.start()
+    assert governor.acquire(50, timeout=1)
+    assert (governor.in_use, governor.peak) == (50, 60)
+    governor.release(50)
+
+
+def test_oversized_allocation_runs_alone():
+    governor = MemoryGovernor(100)
+    with governor.reserve(500):
+        assert governor.in_use == 500
+        assert not governor.acquire(1, timeout=0.01)
+    assert governor.acquire(1, timeout=0.01)
+    with pytest.raises(ValueError):
+        MemoryGovernor(0)
+
+
+def test_stage_runs_what_fits_in_the_budget():
+    in_flight, max_in_flight, lock = [0], [0], threading.Lock()
+
+    def render(x):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return x
+
+    governor = MemoryGovernor(25)
+    stage = Stage(
+        "render", render, concurrency=6, memory=lambda x: 10, governor=governor
+    )
+    result = Pipeline([stage], collect=True).run(range(12))
+    assert sorted(result.outputs) == list(range(12))
+    assert max_in_flight[0] == 2
+    assert governor.in_use == 0 and governor.peak == 20
+
+    with pytest.raises(ValueError):
+        Stage("render", render, memory=lambda x: 10)
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+from estecon.backend.ingestion.load_to_db import BILL_JSONS, BulkLoader, iter_bill_jsons
+from estecon.backend.metrics import (
+    LOAD_SECONDS,
+    ROWS_LOADED,
+    STAGE_SECONDS,
+    Exporter,
+    Registry,
+    metrics,
+)
+from estecon.backend.pipeline import Pipeline, Stage
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.enabled = True
+    metrics.reset()
+    yield metrics
+    metrics.enabled = False
+    metrics.reset()
+
+
+def test_disabled_registry_records_nothing():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests")
+    histogram = registry.histogram("latency_seconds", "Latency")
+    counter.inc(source="pdf")
+    with histogram.time(source="pdf") as timer:
+        pass
+    assert timer is None
+    assert counter.value(source="pdf") == 0 and histogram.count(source="pdf") == 0
+
+
+def test_counter_gauge_and_histogram():
+    registry = Registry(enabled=True)
+    counter = registry.counter("bytes_total", "Bytes")
+    counter.inc(100, source="pdf")
+    counter.inc(50, source="pdf")
+    gauge = registry.gauge("queue_depth", "Depth")
+    gauge.set(3, stage="ocr")
+    gauge.set(1, stage="ocr")
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    with histogram.time():
+        pass
+
+    assert counter.value(source="pdf") == 150
+    assert gauge.value(stage="ocr") == 1
+    assert histogram.count() == 5 and histogram.sum() == pytest.approx(5.65, abs=0.01)
+    assert registry.counter("bytes_total", "Bytes") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("bytes_total", "Bytes")
+
+    text = registry.to_prometheus()
+    assert "# TYPE bytes_total counter" in text
+    assert 'bytes_total{source="pdf"} 150' in text
+    assert 'queue_depth{stage="ocr"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{le="1"} 4' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 5' in text
+    assert "latency_seconds_count 5" in text
+
+
+def test_write_textfile_and_json(tmp_path):
+    registry = Registry(enabled=True, labels={"worker": "w1"})
+    registry.counter("pages_total", "Pages").inc(2)
+    registry.write(tmp_path / "metrics_{pid}.prom")
+    text = (tmp_path / f"metrics_{os.getpid()}.prom").read_text()
+    assert 'pages_total{worker="w1"} 2' in text
+    registry.write(tmp_path / "{run}" / "metrics_{pid}_{0}.prom")
+    assert (tmp_path / "{run}" / f"metrics_{os.getpid()}_{{0}}.prom").exists()
+
+    with Exporter(registry, tmp_path / "metrics.json", interval=60):
+        registry.counter("pages_total", "Pages").inc()
+    snapshot = json.loads((tmp_path / "metrics.json").read_text())
+    assert snapshot["metrics"]["pages_total"]["values"] == [{"labels": {}, "value": 3}]
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_loads_and_stages_are_instrumented(engine, enabled_metrics):
+    written = BulkLoader(engine).load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    assert ROWS_LOADED.value(table="bills") == written["bills"] > 0
+    assert LOAD_SECONDS.count(loader="BulkLoader") == 1
+
+    Pipeline([Stage("double", lambda x: 2 * x, concurrency=2)]).run(range(10))
+    assert STAGE_SECONDS.count(stage="double") == 10
@@ -0,0 +1,87 @@
+import pytest
+import polars as pl
+from datetime import datetime
+from pathlib import Path
+from estecon.backend import VoteOption, LegPeriod, LegislativeYear
+from estecon.backend.analytics.parquet_export import (
+    export_parquet,
+    load_catalog,
+    scan_table,
+    scan_votes,
+)
+from estecon.backend.ingestion.load_to_db import BulkLoader, iter_bill_jsons
+from estecon.backend.scrapers.schema import Bancada
+from estecon.tests.conftest import alternate_bancadas, make_vote_event
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+OPTIONS = [VoteOption.SI if i % 3 else VoteOption.NO for i in range(10)]
+
+
+@pytest.fixture
+def export_root(tmp_path, engine):
+    loader = BulkLoader(engine)
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    loader.load_records(
+        [
+            Bancada(
+                leg_year=LegislativeYear.YEAR_2025,
+                bancada_id=1,
+                bancada_name="Bancada 1",
+            ),
+            Bancada(
+                leg_year=LegislativeYear.YEAR_2025,
+                bancada_id=2,
+                bancada_name="Bancada 2",
+            ),
+            make_vote_event(
+                "ev1", OPTIONS, datetime(2024, 10, 1), bancada_id=alternate_bancadas
+            ),
+            make_vote_event(
+                "ev2", OPTIONS, datetime(2025, 3, 1), bancada_id=alternate_bancadas
+            ),
+        ]
+    )
+    root = tmp_path / "parquet"
+    export_parquet(engine, root)
+    return root
+
+
+def test_catalog_partitions(export_root):
+    votes = load_catalog(export_root)["tables"]["votes"]
+    assert votes["rows"] == 20
+    assert votes["partition_by"] == ["leg_period", "year"]
+    assert sorted(p["values"]["year"] for p in votes["partitions"]) == [2024, 2025]
+
+
+def test_scan_table_prunes_partitions(export_root):
+    lazy = scan_table(
+        "votes", export_root, year=2025, columns=["vote_event_id", "voter_id", "option"]
+    )
+    df = lazy.collect()
+    assert df.columns == ["vote_event_id", "voter_id", "option"]
+    assert df["vote_event_id"].unique().to_list() == ["ev2"]
+
+    empty = scan_table(
+        "votes", export_root, leg_period=LegPeriod.PERIODO_2016_2021
+    ).collect()
+    assert empty.height == 0
+
+
+def test_scan_votes_of_congresista(export_root):
+    df = (
+        scan_votes(export_root, leg_period=LegPeriod.PERIODO_2021_2026)
+        .filter(pl.col("voter_id") == 3)
+        .select("vote_event_id", "option", "bancada_name")
+        .sort("vote_event_id")
+        .collect()
+    )
+    assert df["option"].to_list() == [VoteOption.NO.value, VoteOption.NO.value]
+    assert df["bancada_name"].to_list() == ["Bancada 2", "Bancada 2"]
+
+
+def test_bills_partitioned_by_legislature(export_root):
+    bills = load_catalog(export_root)["tables"]["bills"]
+    assert bills["partition_by"] == ["leg_period", "legislature"]
+    assert scan_table("bills", export_root).collect().height == len(
+        list(BILL_JSONS.glob("*.json"))
+    )
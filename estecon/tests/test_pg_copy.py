@@ -0,0 +1,160 @@
+import os
+import shutil
+import socket
+import subprocess
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects import postgresql
+from estecon.backend import VoteOption, LegPeriod
+from estecon.backend.database.models import Base
+from estecon.backend.ingestion.pg_copy import CopyLoader, merge_statement
+
+VOTES = Base.metadata.tables["votes"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def pg_url(tmp_path_factory):
+    """
+    Uses TEST_PG_URL if set, otherwise launches a throwaway local PostgreSQL
+    with the initdb/pg_ctl binaries on the PATH.
+    """
+    pytest.importorskip("psycopg")
+    if os.getenv("TEST_PG_URL"):
+        yield os.getenv("TEST_PG_URL")
+        return
+
+    initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+    if not initdb or not pg_ctl or os.geteuid() == 0:
+        pytest.skip("No TEST_PG_URL and no local PostgreSQL binaries to launch")
+
+    data_dir = tmp_path_factory.mktemp("pgdata")
+    port = free_port()
+    subprocess.run(
+        [initdb, "-D", data_dir, "-U", "postgres", "-A", "trust"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [
+            pg_ctl,
+            "-D",
+            data_dir,
+            "-l",
+            data_dir / "log",
+            "-w",
+            "start",
+            "-o",
+            f"-p {port} -k {data_dir} -c listen_addresses=''",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    yield f"postgresql+psycopg://postgres@/postgres?host={data_dir}&port={port}"
+    subprocess.run(
+        [pg_ctl, "-D", data_dir, "-m", "fast", "stop"], check=True, capture_output=True
+    )
+
+
+@pytest.fixture
+def pg_engine(pg_url):
+    engine = create_engine(pg_url)
+    Base.metadata.drop_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def vote_event_rows(n_voters, option=VoteOption.SI):
+    rows = [
+        (
+            "bancadas",
+            {"leg_year": "YEAR_2025", "bancada_id": 1, "bancada_name": "Bancada 1"},
+        ),
+        (
+            "bills",
+            {
+                "id": "2021_1",
+                "leg_period": LegPeriod.PERIODO_2021_2026,
+                "legislature": "LEGISLATURA_2024_1",
+                "presentation_date": datetime(2024, 9, 1),
+                "title": "t",
+                "summary": "s",
+                "observations": "",
+                "complete_text": "",
+                "status": "EN COMISIÓN",
+                "proponent": "CONGRESO",
+                "author_id": None,
+                "bancada_id": None,
+                "bill_approved": False,
+            },
+        ),
+        (
+            "vote_events",
+            {
+                "id": "ev1",
+                "org_id": 1,
+                "leg_period": LegPeriod.PERIODO_2021_2026,
+                "bill_id": "2021_1",
+                "date": datetime(2024, 10, 1),
+            },
+        ),
+    ]
+    rows += [
+        (
+            "votes",
+            {"vote_event_id": "ev1", "voter_id": i, "option": option, "bancada_id": 1},
+        )
+        for i in range(n_voters)
+    ]
+    return rows
+
+
+def test_merge_statement_skips_unchanged_rows():
+    class FakeConn:
+        dialect = postgresql.dialect()
+
+    sql = merge_statement(
+        FakeConn(),
+        VOTES,
+        "stg_votes",
+        ["vote_event_id", "voter_id", "option", "bancada_id"],
+    )
+    assert "ON CONFLICT (vote_event_id, voter_id) DO UPDATE" in sql
+    assert "IS DISTINCT FROM" in sql
+    assert sql.endswith("RETURNING votes.vote_event_id, votes.voter_id")
+
+    signers = Base.metadata.tables["bills_congresistas"]
+    sql = merge_statement(
+        FakeConn(), signers, "stg", ["bill_id", "person_id", "role_type", "loaded_at"]
+    )
+    assert "loaded_at = EXCLUDED.loaded_at" in sql
+    assert "(bills_congresistas.role_type) IS DISTINCT FROM (EXCLUDED.role_type)" in sql
+
+
+def test_falls_back_to_upserts_on_sqlite(engine):
+    loader = CopyLoader(engine)
+    assert loader.load_rows(vote_event_rows(130))["votes"] == 130
+    assert loader.load_rows(vote_event_rows(130))["votes"] == 0
+
+
+def test_copy_into_postgres(pg_engine):
+    loader = CopyLoader(pg_engine, batch_size=100)
+    assert loader.load_rows(vote_event_rows(130))["votes"] == 130
+    assert loader.load_rows(vote_event_rows(130))["votes"] == 0
+
+    changed = vote_event_rows(130)
+    changed[-1][1]["option"] = VoteOption.NO
+    assert loader.load_rows(changed)["votes"] == 1
+    with pg_engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(VOTES)).scalar() == 130
+        assert (
+            conn.execute(select(VOTES.c.option).where(VOTES.c.voter_id == 129)).scalar()
+            == VoteOption.NO
+        )
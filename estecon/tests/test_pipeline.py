@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from estecon.backend.ingestion.bill_store import BillStore
+from estecon.backend.ingestion.upsert import UpsertLoader
+from estecon.backend.jobs.state import JobState
+from estecon.backend.pipeline import (
+    BillJob,
+    BillSink,
+    CongresistaLoader,
+    PeriodJob,
+    Pipeline,
+    Stage,
+    bill_pipeline,
+    period_jobs,
+)
+from estecon.backend.scrapers.memory_governor import MemoryGovernor
+from estecon.cli import build_parser
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+
+
+def square(x):
+    return x * x
+
+
+def test_stages_in_order_with_fan_out_and_drops():
+    async def double(x):
+        return [x, x]
+
+    pipeline = Pipeline(
+        [
+            Stage("odd", lambda x: x if x % 2 else None, concurrency=3),
+            Stage("double", double, kind="async", fan_out=True),
+            Stage("square", square, concurrency=2, kind="process"),
+        ],
+        collect=True,
+    )
+    result = pipeline.run(range(10))
+    assert sorted(result.outputs) == sorted([x * x for x in range(1, 10, 2)] * 2)
+    assert result.stats["odd"].processed == 10 and result.stats["odd"].emitted == 5
+    assert result.stats["square"].processed == 10
+
+
+def test_failures_are_counted_and_skipped():
+    def fail_on_three(x):
+        if x == 3:
+            raise RuntimeError("boom")
+        return x
+
+    result = Pipeline([Stage("maybe", fail_on_three, concurrency=2)], collect=True).run(
+        range(5)
+    )
+    assert sorted(result.outputs) == [0, 1, 2, 4]
+    assert result.stats["maybe"].failed == 1
+
+
+def test_backpressure_and_overlap():
+    in_flight, max_in_flight, lock = [0], [0], threading.Lock()
+
+    def fetch(x):
+        with lock:
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        time.sleep(0.001)
+        return x
+
+    def slow(x):
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return x
+
+    start = time.perf_counter()
+    result = Pipeline(
+        [
+            Stage("fetch", fetch, concurrency=4),
+            Stage("slow", slow, concurrency=4, queue_size=2),
+        ],
+        collect=True,
+    ).run(range(40))
+    assert sorted(result.outputs) == list(range(40))
+    # Items waiting for the slow stage are bounded by the queues and workers
+    assert max_in_flight[0] <= 4 + 2 + 4
+    # The slow stage runs its four workers at the same time
+    assert time.perf_counter() - start < 40 * 0.02 / 2
+
+
+def test_async_stage_needs_a_coroutine():
+    with pytest.raises(ValueError):
+        Stage("bad", square, kind="async")
+
+
+def test_cli_parser():
+    args = build_parser().parse_args(["bills", "--first", "3", "--last", "5"])
+    assert (args.first, args.last, args.year) == (3, 5, 2021)
+    assert build_parser().parse_args(["load", "--initial"]).initial
+    assert build_parser().parse_args(["run", "--parse-votes"]).parse_votes
+
+
+def test_bill_sink_in_a_pipeline(tmp_path, engine):
+    bill = json.loads((BILL_JSONS / "2021_10300.json").read_text(encoding="utf-8"))
+    state = JobState(tmp_path / "job_state.db")
+    with BillStore(tmp_path / "bill_store") as store:
+        sink = BillSink(state, store=store, loader=UpsertLoader(engine))
+        result = Pipeline([Stage("load", sink)], collect=True).run(
+            [BillJob(2021, 10300, bill=bill)]
+        )
+        assert result.stats["load"].failed == 0
+        assert result.outputs == ["2021_10300"]
+        assert store.get("2021_10300") == bill
+    assert state.is_done("bill", "2021_10300")
+
+
+def test_congresistas_stage_loads_periods_before_bills(tmp_path):
+    events = []
+
+    def scrape(periodo, valor):
+        time.sleep(0.01)
+        return [f"congresistas of {periodo}"], []
+
+    class Loader:
+        def load_records(self, records):
+            events.extend(records)
+
+    state = JobState(tmp_path / "job_state.db")
+    state.finish("congresistas", "done before")
+    periodos = {"2016": "1", "2021": "2", "done before": "3"}
+    result = Pipeline(
+        [
+            Stage(
+                "congresistas",
+                CongresistaLoader(state, loader=Loader(), scrape=scrape),
+            ),
+            Stage("bills", lambda job: events.append(job.bill_id), concurrency=2),
+        ]
+    ).run([*period_jobs(state, periodos), BillJob(2021, 1), BillJob(2021, 2)])
+    assert events[:2] == ["congresistas of 2016", "congresistas of 2021"]
+    assert sorted(events[2:]) == ["2021_1", "2021_2"]
+    assert result.stats["congresistas"].emitted == 2
+    assert state.is_done("congresistas", "2021")
+    assert list(period_jobs(state, periodos)) == []
+    assert PeriodJob("2016", "1") not in period_jobs(state, periodos, only={"2016"})
+
+
+def test_bill_pipeline_stages():
+    def names(**kwargs):
+        pipeline = bill_pipeline(print, ocr_memory=MemoryGovernor(2**20), **kwargs)
+        return [stage.name for stage in pipeline.stages]
+
+    assert names() == ["bills", "fetch", "ocr", "parse", "load"]
+    assert names(congresistas=print, votes=True) == [
+        "congresistas",
+        "bills",
+        "fetch",
+        "ocr",
+        "parse",
+        "votes",
+        "load",
+    ]
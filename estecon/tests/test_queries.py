@@ -0,0 +1,108 @@
+import pytest
+from datetime import datetime
+from pathlib import Path
+from estecon.backend import VoteOption, RoleTypeBill
+from estecon.backend.database.queries import QueryService, ResultCache
+from estecon.backend.ingestion.load_to_db import iter_bill_jsons
+from estecon.backend.ingestion.upsert import UpsertLoader
+from estecon.tests.conftest import alternate_bancadas, make_vote_event
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def engine(engine):
+    loader = UpsertLoader(engine)
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    loader.load_records(
+        [make_vote_event("ev1", [VoteOption.SI] * 6, bancada_id=alternate_bancadas)]
+    )
+    return engine
+
+
+def test_cache_lru_ttl_and_tags():
+    clock = FakeClock()
+    cache = ResultCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", 1, [("bill", "b1")])
+    cache.set("b", 2, [("bill", "b2")])
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)  # least recently used
+    assert cache.invalidate([("bill", "b1")]) == 1
+    assert cache.get("a") == (False, None)
+    clock.now = 11
+    assert cache.get("c") == (False, None)
+    assert len(cache) == 0
+
+
+def test_queries(engine):
+    service = QueryService(engine, ResultCache())
+    timeline = service.bill_timeline("2021_10300")
+    assert len(timeline) == 2
+    assert timeline[0]["step_date"] <= timeline[1]["step_date"]
+
+    bills = service.bills_by_author(1099)
+    assert any(
+        b["id"] == "2021_10300" and b["role_type"] == RoleTypeBill.AUTHOR for b in bills
+    )
+
+    assert [v["vote_event_id"] for v in service.congresista_votes(3)] == ["ev1"]
+    breakdown = service.vote_event_breakdown("ev1")
+    assert {(r["bancada_id"], r["option"]): r["count"] for r in breakdown} == {
+        (1, VoteOption.SI): 3,
+        (2, VoteOption.SI): 3,
+    }
+
+
+def test_loader_invalidates_cached_results(engine):
+    service = QueryService(engine)
+    service.cache.clear()
+    assert service.vote_event_breakdown("ev1")[0]["option"] == VoteOption.SI
+    assert service.vote_event_breakdown("ev1")[0]["option"] == VoteOption.SI
+    assert service.cache.hits >= 1
+
+    UpsertLoader(engine).load_records(
+        [make_vote_event("ev1", [VoteOption.NO] * 6, bancada_id=alternate_bancadas)]
+    )
+    breakdown = service.vote_event_breakdown("ev1")
+    assert {r["option"] for r in breakdown} == {VoteOption.NO}
+    assert service.congresista_votes(3)[0]["option"] == VoteOption.NO
+
+
+def test_stale_results_are_not_cached():
+    cache = ResultCache()
+    generation = cache.generation()
+    cache.invalidate([("bill", "b1")])  # a load commits while the old rows are read
+    assert not cache.set("a", "old rows", [("bill", "b1")], generation)
+    assert cache.get("a") == (False, None)
+    assert cache.set("a", "new rows", [("bill", "b1")], cache.generation())
+    assert cache.set("b", "other rows", [("bill", "b2")], generation)
+
+
+def test_results_depending_on_other_entities_are_invalidated(engine):
+    service = QueryService(engine)
+    service.cache.clear()
+    coauthor = 1039
+    assert any(b["id"] == "2021_10300" for b in service.bills_by_author(coauthor))
+    assert service.congresista_votes(3)[0]["date"] == datetime(2025, 3, 1)
+
+    bill = next(b for b in iter_bill_jsons(BILL_JSONS) if b["id"] == "2021_10300")
+    event = make_vote_event("ev1", [VoteOption.SI] * 6, bancada_id=alternate_bancadas)
+    event.date = datetime(2025, 3, 2)
+    UpsertLoader(engine).load_bill_jsons([dict(bill, title="NUEVO TITULO")])
+    UpsertLoader(engine).load_records([event])
+    assert (
+        next(b for b in service.bills_by_author(coauthor) if b["id"] == "2021_10300")[
+            "title"
+        ]
+        == "NUEVO TITULO"
+    )
+    assert service.congresista_votes(3)[0]["date"] == datetime(2025, 3, 2)
@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime, timedelta
+from estecon.backend.jobs.scheduler import (
+    CADENCES,
+    EVERY_JULY,
+    WEEKLY,
+    RefreshSchedule,
+    RefreshTimer,
+)
+
+NOW = datetime(2025, 9, 1)
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    with RefreshSchedule(tmp_path / "state.db") as schedule:
+        yield schedule
+
+
+def test_cadences():
+    assert WEEKLY.due_at(datetime(2025, 1, 1)) == datetime(2025, 1, 8)
+    assert EVERY_JULY.due_at(datetime(2025, 3, 10)) == datetime(2025, 7, 1)
+    assert EVERY_JULY.due_at(datetime(2025, 7, 2)) == datetime(2026, 7, 1)
+    assert CADENCES["committees"] is EVERY_JULY and CADENCES["bills"] is WEEKLY
+
+
+def test_plan_is_stale_items_most_stale_first(schedule):
+    assert schedule.register("bills", ["b1", "b2", "b3", "b4"]) == 4
+    assert schedule.register("bills", ["b1"]) == 0
+    schedule.register("congresistas", ["p1"])
+    schedule.mark_refreshed("bills", "b1", at=NOW - timedelta(days=30))
+    schedule.mark_refreshed("bills", "b2", at=NOW - timedelta(days=10))
+    schedule.mark_refreshed("bills", "b3", at=NOW - timedelta(days=2))
+    schedule.mark_refreshed("congresistas", "p1", at=NOW - timedelta(days=100))
+
+    plan = schedule.plan(NOW)
+    # Never refreshed first, then by time overdue; fresh bills and congresistas aren't due
+    assert [item.item_id for item in plan] == ["b4", "b1", "b2"]
+    assert plan[1].overdue == timedelta(days=23)
+    assert [
+        item.item_id for item in schedule.plan(NOW, entities=["congresistas"])
+    ] == []
+
+    # Per record cadence
+    schedule.set_cadence("bills", "b3", timedelta(days=1))
+    assert "b3" in [item.item_id for item in schedule.plan(NOW)]
+    schedule.set_cadence("bills", "b2", timedelta(days=60))
+    assert "b2" not in [item.item_id for item in schedule.plan(NOW)]
+
+
+def test_plan_fits_the_window(schedule):
+    schedule.register("bills", [f"b{i}" for i in range(10)])
+    for i in range(10):
+        schedule.mark_refreshed(
+            "bills", f"b{i}", duration=60.0, at=NOW - timedelta(days=8 + i)
+        )
+    plan = schedule.plan(NOW, window=timedelta(minutes=5))
+    assert [item.item_id for item in plan] == ["b9", "b8", "b7", "b6", "b5"]
+    assert len(schedule.plan(NOW, limit=3)) == 3
+
+
+def test_refresh_timer(schedule):
+    with RefreshTimer(schedule, "congresistas", "p1"):
+        pass
+    assert schedule.last_refreshed("congresistas", "p1") is not None
+    with pytest.raises(RuntimeError):
+        with RefreshTimer(schedule, "congresistas", "p2"):
+            raise RuntimeError("boom")
+    assert schedule.last_refreshed("congresistas", "p2") is None
+    with pytest.raises(ValueError):
+        schedule.register("unknown", ["x"])
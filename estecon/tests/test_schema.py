@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from estecon.backend.scrapers.schema import (
     Vote, VoteEvent, Attendance, VoteOption, AttendanceStatus,
     Bill, BillStep, BillCongresistas, BillCommittees, Committee,
-    Congresista, Organization, Membership) 
+    Congresista, Organization, Membership, VoteColumns, construct_many, validate_many)
 from estecon.backend import (
     RoleTypeBill, Proponents, Legislature, LegislativeYear, 
     LegPeriod, TypeOrganization, RoleOrganization, BillStepType
@@ -65,6 +65,58 @@ def test_attendance_summary(sample_attendance):
     assert summary[AttendanceStatus.PRESENTE] == 2
     assert summary[AttendanceStatus.AUSENTE] == 1
 
+def test_vote_columns_round_trip(sample_votes, sample_attendance):
+    vote_event = VoteEvent(
+        id="ev1",
+        org_id=1,
+        leg_period=LegPeriod.PERIODO_2021_2026,
+        bill_id="123",
+        date=datetime.now(),
+        votes=sample_votes,
+        attendance=sample_attendance,
+    )
+    columns = vote_event.to_columns()
+    assert len(columns) == 3
+    assert columns.to_votes() == sample_votes
+    assert columns.to_attendance() == sample_attendance
+    assert columns.get_counts() == vote_event.get_counts()
+    assert columns.get_counts_by_bancada() == vote_event.get_counts_by_bancada()
+    assert columns.get_attendance_summary() == vote_event.get_attendance_summary()
+
+
+def test_vote_columns_counts():
+    options = [
+        VoteOption.SI,
+        VoteOption.NO,
+        VoteOption.ABSTENCION,
+        VoteOption.SIN_RESPUESTA,
+    ]
+    votes = [
+        Vote(
+            vote_event_id="ev1",
+            voter_id=i,
+            option=options[i % 3 + i % 2],
+            bancada_id=i % 5,
+        )
+        for i in range(130)
+    ]
+    vote_event = VoteEvent(
+        id="ev1",
+        org_id=1,
+        leg_period=LegPeriod.PERIODO_2021_2026,
+        bill_id="123",
+        date=datetime.now(),
+        votes=votes,
+    )
+    columns = vote_event.to_columns()
+    assert columns.get_counts() == vote_event.get_counts()
+    assert columns.get_counts_by_bancada() == vote_event.get_counts_by_bancada()
+    assert columns.nbytes < 130 * 20
+    assert VoteColumns("ev2", [], [], []).get_counts() == {}
+    with pytest.raises(ValueError):
+        VoteColumns("ev2", [1, 2], [1], [1])
+
+
 def test_bill_creation_and_json(tmp_path):
     bill = Bill(
         id="b001",
@@ -155,3 +207,59 @@ def test_bill_step_creation():
         step_url="http://congreso.gob.pe/proyecto/b001"
     )
     assert step.step_type == BillStepType.ASSIGNED
+
+
+def test_validate_many():
+    rows = [
+        {"vote_event_id": "ev1", "voter_id": i, "option": "si", "bancada_id": 10}
+        for i in range(3)
+    ]
+    validated = validate_many(Vote, rows)
+    trusted = validate_many(Vote, rows, trusted=True)
+    assert validated == trusted == [Vote(**row) for row in rows]
+    assert trusted[0].option is VoteOption.SI
+    assert trusted[0].model_fields_set == validated[0].model_fields_set
+    assert rows[0]["option"] == "si"
+
+    with pytest.raises(ValueError):
+        validate_many(Vote, [dict(rows[0], option="maybe")])
+
+    start = datetime(2024, 1, 1)
+    bad_dates = [
+        {
+            "id": 1,
+            "role": "miembro",
+            "person_id": 1,
+            "org_id": 2,
+            "start_date": start,
+            "end_date": start - timedelta(days=1),
+        }
+    ]
+    with pytest.raises(ValueError):
+        validate_many(Membership, bad_dates)
+    assert (
+        validate_many(Membership, bad_dates, trusted=True)[0].role
+        is RoleOrganization.MIEMBRO
+    )
+
+
+def test_validate_many_defaults():
+    rows = [
+        {
+            "id": "ev1",
+            "org_id": 1,
+            "leg_period": LegPeriod.PERIODO_2021_2026.value,
+            "bill_id": "123",
+            "date": datetime(2025, 1, 1),
+        }
+    ]
+    trusted = validate_many(VoteEvent, rows, trusted=True)[0]
+    assert trusted == VoteEvent(**rows[0])
+    assert trusted.votes is None and trusted.model_fields_set == set(rows[0])
+
+    constructed = construct_many(VoteEvent, rows * 2)
+    assert (
+        constructed[0] == trusted
+        and constructed[0].leg_period is LegPeriod.PERIODO_2021_2026
+    )
+    assert constructed[0].model_fields_set is not constructed[1].model_fields_set
@@ -1,7 +1,12 @@
 import pytest
 import respx
 import httpx
-from estecon.backend import LegPeriod, PARTY_ALIASES
+from concurrent.futures import ThreadPoolExecutor
+from estecon.backend import LegPeriod, LegislativeYear, PARTY_ALIASES
+from estecon.backend.config import settings
+from estecon.backend.database.models import Base
+from estecon.backend.database.registry import IdRegistry, party_registry
+from estecon.backend.database.session import dispose_engine
 from estecon.backend.scrapers import scrape_congresistas as sc
 from estecon.backend.scrapers.scrape_congresistas import (
     get_cong_party_info, normalize_party_name, get_or_create_party,
@@ -14,15 +19,45 @@ def test_normalize_party_name():
     assert normalize_party_name("FP") == "Fuerza Popular"
     assert normalize_party_name("Acción Popular") == "Acción Popular"
 
-def test_get_or_create_party_respects_counter():
-    sc.PARTY_ID_MAP = {p: {} for p in LegPeriod._member_names_}
-    sc.PARTY_COUNTER = 1
+@pytest.fixture(autouse=True)
+def party_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    dispose_engine()
+    party_registry.clear()
+    yield
+    dispose_engine()
+    party_registry.clear()
+
+
+def test_get_or_create_party_uses_registry():
     party = get_or_create_party("Mi Partido", LegPeriod["PERIODO_2021_2026"])
     assert party.party_id == 1
     same_party = get_or_create_party("Mi Partido", LegPeriod["PERIODO_2021_2026"])
     assert same_party.party_id == 1
     new_party = get_or_create_party("Otro Partido", LegPeriod["PERIODO_2021_2026"])
     assert new_party.party_id == 2
+    other_period = get_or_create_party("Mi Partido", LegPeriod["PERIODO_2016_2021"])
+    assert other_period.party_id == 3
+
+    # A new process (empty cache) gets the same ids, whatever it scrapes first
+    party_registry.clear()
+    assert (
+        get_or_create_party("Otro Partido", LegPeriod["PERIODO_2021_2026"]).party_id
+        == 2
+    )
+    assert party_registry.preload(LegPeriod["PERIODO_2021_2026"]) == 2
+
+
+def test_registry_is_safe_across_threads():
+    registry = IdRegistry(Base.metadata.tables["bancadas"], "leg_year", "bancada_name")
+    leg_year = list(LegislativeYear)[0]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(
+            pool.map(lambda i: registry.get_id(leg_year, f"Bancada {i % 3}"), range(60))
+        )
+    assert sorted(set(ids)) == [1, 2, 3]
+    fresh = IdRegistry(Base.metadata.tables["bancadas"], "leg_year", "bancada_name")
+    assert [fresh.get_id(leg_year, f"Bancada {i % 3}") for i in range(60)] == ids
 
 @respx.mock
 def test_get_dict_periodos():
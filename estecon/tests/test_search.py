@@ -0,0 +1,85 @@
+import pytest
+from pathlib import Path
+from sqlalchemy import text
+from estecon.backend.config import directories
+from estecon.backend.database import search
+from estecon.backend.database.search import (
+    DOCS_TABLE,
+    index_bills,
+    rebuild_search_index,
+    search_bills,
+    to_match_query,
+)
+from estecon.backend.ingestion.load_to_db import iter_bill_jsons
+from estecon.backend.ingestion.upsert import UpsertLoader
+from estecon.backend.scrapers.scrape_utils import url_to_cache_file
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+DOC_URL = "https://wb2server.congreso.gob.pe/spley-portal-service//archivo/MjU5OTcx/pdf"
+
+
+@pytest.fixture
+def engine(engine):
+    UpsertLoader(engine).load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    return engine
+
+
+def test_to_match_query():
+    assert to_match_query('niñez "orfandad') == '"niñez" "orfandad"*'
+    assert to_match_query("-- ", prefix=False) == ""
+
+
+def test_search_folds_accents(engine):
+    results = search_bills("ninez orfandad adopcion", engine=engine)
+    assert results[0]["bill_id"] == "2021_10300"
+    assert results[0]["title"].startswith("LEY DE COMPROMISO")
+    assert "[NIÑEZ]" in results[0]["snippets"][0]["text"]
+    assert search_bills("mochilas", engine=engine)[0]["bill_id"] == "2021_10302"
+    assert search_bills("mochil", engine=engine)[0]["bill_id"] == "2021_10302"
+    assert search_bills("zzzzqqq", engine=engine) == []
+
+
+def test_loader_reindexes_bills(engine):
+    bill = next(iter_bill_jsons(BILL_JSONS))
+    UpsertLoader(engine).load_bill_jsons(
+        [dict(bill, title="LEY DE PROTECCIÓN DE LOS HUMEDALES")]
+    )
+    assert search_bills("humedales", engine=engine)[0]["bill_id"] == bill["id"]
+    with engine.connect() as conn:
+        n_docs = conn.execute(
+            text(
+                f"SELECT count(*) FROM {DOCS_TABLE} WHERE bill_id = :id AND source = 'bill'"
+            ),
+            {"id": bill["id"]},
+        ).scalar()
+    assert n_docs == 1
+
+
+def test_ocr_documents(engine, tmp_path):
+    ocr_dir = tmp_path / "ocr"
+    cache_file = url_to_cache_file(DOC_URL, ocr_dir)
+    cache_file.parent.mkdir()
+    cache_file.write_text(
+        "Dictamen favorable sobre la adopción de menores", encoding="utf-8"
+    )
+    with engine.begin() as conn:
+        assert index_bills(conn, ["2021_10300"], ocr_dir) == 3
+    results = search_bills("dictamen favorable", engine=engine)
+    assert results[0]["snippets"][0]["source"] == "document"
+    assert results[0]["snippets"][0]["ref"] == DOC_URL
+
+    with engine.begin() as conn:
+        n_docs = rebuild_search_index(conn, ocr_dir)
+    assert search_bills("dictamen", engine=engine)[0]["bill_id"] == "2021_10300"
+    with engine.connect() as conn:
+        assert (
+            conn.execute(text(f"SELECT count(*) FROM {DOCS_TABLE}")).scalar() == n_docs
+        )
+
+
+def test_reads_the_ocr_cache_the_scraper_writes():
+    scrape_project_bills = pytest.importorskip(
+        "estecon.backend.scrapers.scrape_project_bills"
+    )
+    assert search.OCR_CACHE_DIR == scrape_project_bills.OCR_CACHE_DIR
+    assert search.OCR_CACHE_DIR == directories.OCR_CACHE
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+from estecon.backend.config import settings
+from estecon.backend.database import session as db
+from estecon.backend.database.models import Congresista
+from estecon.backend import LegPeriod
+
+
+@pytest.fixture
+def sqlite_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DB_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    db.dispose_engine()
+    yield
+    db.dispose_engine()
+
+
+def test_engine_is_lazy_and_shared(sqlite_settings):
+    assert db._engine is None
+    engine = db.get_engine()
+    assert db.get_engine() is engine
+    assert engine.pool.size() == settings.DB_POOL_SIZE
+
+
+def test_sqlite_uses_wal(sqlite_settings):
+    with db.get_engine().connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+
+def test_session_scope_commits_and_rolls_back(sqlite_settings):
+    from estecon.backend.database.erd import create_schema
+
+    create_schema()
+    congresista = dict(
+        leg_period=LegPeriod.PERIODO_2021_2026,
+        nombre="Ana Torres",
+        party_id=1,
+        votes_in_election=100,
+        condicion="Activo",
+        website="https://example.com",
+    )
+    with db.session_scope() as session:
+        session.add(Congresista(id=1, **congresista))
+
+    with pytest.raises(RuntimeError):
+        with db.session_scope() as session:
+            session.add(Congresista(id=2, **congresista))
+            raise RuntimeError("boom")
+
+    with db.session_scope() as session:
+        assert [c.id for c in session.query(Congresista).all()] == [1]
+
+
+def test_chunked():
+    assert list(db.chunked(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(db.chunked([])) == []
+    assert [len(chunk) for chunk in db.chunked(list(range(1001)))] == [500, 500, 1]
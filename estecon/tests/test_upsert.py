@@ -0,0 +1,141 @@
+from pathlib import Path
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from estecon.backend import LegPeriod, VoteOption
+from estecon.backend.database.models import Base
+from estecon.backend.database.queries import result_cache
+from estecon.backend.ingestion import load_to_db
+from estecon.backend.ingestion.load_to_db import iter_bill_jsons
+from estecon.backend.ingestion.upsert import (
+    UpsertLoader,
+    get_natural_key,
+    row_hash,
+    upsert_statement,
+)
+from estecon.backend.ingestion.vote_counts import rebuild_vote_counts
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+VOTES = Base.metadata.tables["votes"]
+PARTIDOS = Base.metadata.tables["partidos"]
+
+
+def vote_rows(option=VoteOption.SI, n=5):
+    return [
+        (
+            "votes",
+            {"vote_event_id": "ev1", "voter_id": i, "option": option, "bancada_id": 1},
+        )
+        for i in range(n)
+    ]
+
+
+def test_natural_keys():
+    assert get_natural_key(VOTES) == ["vote_event_id", "voter_id"]
+    assert get_natural_key(Base.metadata.tables["congresistas"]) == ["id", "leg_period"]
+    assert get_natural_key(Base.metadata.tables["vote_counts"]) == [
+        "vote_event_id",
+        "option",
+        "bancada_id",
+    ]
+    assert get_natural_key(Base.metadata.tables["bills"]) == ["id"]
+
+
+def test_row_hash_ignores_key_columns():
+    row = {
+        "vote_event_id": "ev1",
+        "voter_id": 1,
+        "option": VoteOption.SI,
+        "bancada_id": 1,
+    }
+    other = dict(row, voter_id=2)
+    assert row_hash(row, ["vote_event_id", "voter_id"]) == row_hash(
+        other, ["vote_event_id", "voter_id"]
+    )
+    assert row_hash(row, ["vote_event_id", "voter_id"]) != row_hash(
+        dict(row, option=VoteOption.NO), ["vote_event_id", "voter_id"]
+    )
+
+
+def test_postgres_statement_compiles():
+    class FakeConn:
+        dialect = postgresql.dialect()
+
+    sql = str(
+        upsert_statement(FakeConn(), VOTES, ["vote_event_id", "voter_id"]).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ON CONFLICT (vote_event_id, voter_id) DO UPDATE" in sql
+
+
+def test_upsert_skips_unchanged_and_updates_changed(engine):
+    loader = UpsertLoader(engine)
+    assert loader.load_rows(vote_rows()) == {"votes": 5}
+    assert loader.load_rows(vote_rows()) == {"votes": 0}
+
+    changed = vote_rows()
+    changed[2][1]["option"] = VoteOption.NO
+    assert loader.load_rows(changed) == {"votes": 1}
+    with engine.connect() as conn:
+        options = {
+            voter: option
+            for voter, option in conn.execute(select(VOTES.c.voter_id, VOTES.c.option))
+        }
+    assert len(options) == 5
+    assert options[2] == VoteOption.NO
+
+
+def test_upsert_bill_jsons_is_idempotent(engine):
+    loader = UpsertLoader(engine, batch_size=50)
+    first = loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    second = loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    assert first["bills"] > 0 and first["bill_steps"] > 0
+    assert all(n == 0 for n in second.values())
+
+
+def test_parties_upsert_on_natural_key(engine):
+    loader = UpsertLoader(engine)
+    party = {
+        "leg_period": LegPeriod.PERIODO_2021_2026,
+        "party_id": 1,
+        "party_name": "Partido A",
+    }
+    assert loader.load_rows([("partidos", party)]) == {"partidos": 1}
+    # Same party under another surrogate id: the stored id is kept
+    assert loader.load_rows([("partidos", dict(party, party_id=2))]) == {"partidos": 1}
+    with engine.connect() as conn:
+        assert conn.execute(select(PARTIDOS.c.party_id)).scalars().all() == [1]
+
+
+def test_deleted_rows_are_written_again(engine):
+    loader = UpsertLoader(engine)
+    count = {
+        "org_id": 1,
+        "vote_event_id": "ev1",
+        "option": VoteOption.SI,
+        "bancada_id": 1,
+        "count": 3,
+    }
+    assert loader.load_rows([("vote_counts", count)]) == {"vote_counts": 1}
+    with engine.begin() as conn:
+        rebuild_vote_counts(conn)
+    assert loader.load_rows([("vote_counts", count)]) == {"vote_counts": 1}
+
+
+def test_unchanged_rows_neither_reindex_nor_invalidate(engine, monkeypatch):
+    loader = UpsertLoader(engine)
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    indexed = []
+    monkeypatch.setattr(
+        load_to_db, "index_bills", lambda conn, bill_ids: indexed.extend(bill_ids)
+    )
+    result_cache.set("cached", "rows", [("bill", "2021_10300")])
+
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    assert indexed == []
+    assert result_cache.get("cached") == (True, "rows")
+
+    bill = next(b for b in iter_bill_jsons(BILL_JSONS) if b["id"] == "2021_10300")
+    loader.load_bill_jsons([dict(bill, title="NUEVO TITULO")])
+    assert indexed == ["2021_10300"]
+    assert result_cache.get("cached") == (False, None)
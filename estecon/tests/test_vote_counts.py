@@ -0,0 +1,131 @@
+from sqlalchemy import delete, select, update
+from estecon.backend import VoteOption
+from estecon.backend.database.session import bulk_connection
+from estecon.backend.ingestion.load_to_db import BulkLoader
+from estecon.backend.ingestion.upsert import UpsertLoader
+from estecon.backend.ingestion.vote_counts import (
+    VOTE_COUNTS,
+    check_vote_counts,
+    rebuild_vote_counts,
+    vote_count_deltas,
+)
+from estecon.tests.conftest import alternate_bancadas, make_vote_event
+
+
+def stored_counts(engine):
+    with engine.connect() as conn:
+        return {
+            (r.vote_event_id, r.option, r.bancada_id): r.count
+            for r in conn.execute(select(VOTE_COUNTS))
+        }
+
+
+def test_vote_count_deltas():
+    old = [
+        {
+            "vote_event_id": "ev1",
+            "voter_id": 1,
+            "option": VoteOption.SI,
+            "bancada_id": 1,
+        }
+    ]
+    new = [dict(old[0], option=VoteOption.NO), dict(old[0], option=VoteOption.NO)]
+    assert vote_count_deltas(new, old) == {
+        ("ev1", VoteOption.SI, 1): -1,
+        ("ev1", VoteOption.NO, 1): 1,
+    }
+
+
+def test_counts_are_written_with_votes(engine):
+    options = [
+        VoteOption.SI,
+        VoteOption.SI,
+        VoteOption.NO,
+        VoteOption.SI,
+        VoteOption.ABSTENCION,
+    ]
+    BulkLoader(engine, batch_size=2).load_records(
+        [make_vote_event("ev1", options, bancada_id=alternate_bancadas, org_id=7)]
+    )
+    assert stored_counts(engine) == {
+        ("ev1", VoteOption.SI, 1): 1,
+        ("ev1", VoteOption.SI, 2): 2,
+        ("ev1", VoteOption.NO, 1): 1,
+        ("ev1", VoteOption.ABSTENCION, 1): 1,
+    }
+    with engine.connect() as conn:
+        assert check_vote_counts(conn) == []
+        assert conn.execute(select(VOTE_COUNTS.c.org_id).limit(1)).scalar() == 7
+
+
+def test_upserts_move_counts(engine):
+    loader = UpsertLoader(engine)
+    loader.load_records(
+        [make_vote_event("ev1", [VoteOption.SI] * 4, bancada_id=alternate_bancadas)]
+    )
+    loader.load_records(
+        [make_vote_event("ev1", [VoteOption.SI] * 4, bancada_id=alternate_bancadas)]
+    )
+    assert stored_counts(engine) == {
+        ("ev1", VoteOption.SI, 1): 2,
+        ("ev1", VoteOption.SI, 2): 2,
+    }
+
+    loader.load_records(
+        [
+            make_vote_event(
+                "ev1",
+                [VoteOption.NO, VoteOption.SI, VoteOption.NO, VoteOption.SI],
+                bancada_id=alternate_bancadas,
+            )
+        ]
+    )
+    assert stored_counts(engine) == {
+        ("ev1", VoteOption.NO, 1): 2,
+        ("ev1", VoteOption.SI, 2): 2,
+    }
+
+
+def test_check_and_rebuild(engine):
+    BulkLoader(engine).load_records(
+        [
+            make_vote_event("ev1", [VoteOption.SI] * 3, bancada_id=alternate_bancadas),
+            make_vote_event("ev2", [VoteOption.NO] * 3, bancada_id=alternate_bancadas),
+        ]
+    )
+    with bulk_connection(engine) as conn:
+        conn.execute(
+            update(VOTE_COUNTS)
+            .where(VOTE_COUNTS.c.vote_event_id == "ev1")
+            .values(count=99)
+        )
+        conn.execute(delete(VOTE_COUNTS).where(VOTE_COUNTS.c.vote_event_id == "ev2"))
+        assert len(check_vote_counts(conn)) == 4
+        assert rebuild_vote_counts(conn) == 4
+        assert check_vote_counts(conn) == []
+
+
+def test_only_touched_counts_are_deleted(engine):
+    loader = UpsertLoader(engine)
+    loader.load_records(
+        [
+            make_vote_event("ev1", [VoteOption.SI] * 2, bancada_id=alternate_bancadas),
+            make_vote_event("ev2", [VoteOption.SI] * 2, bancada_id=alternate_bancadas),
+        ]
+    )
+    with bulk_connection(engine) as conn:
+        conn.execute(
+            update(VOTE_COUNTS)
+            .where(VOTE_COUNTS.c.vote_event_id == "ev2")
+            .values(count=0)
+        )
+
+    loader.load_records(
+        [make_vote_event("ev1", [VoteOption.NO] * 2, bancada_id=alternate_bancadas)]
+    )
+    assert stored_counts(engine) == {
+        ("ev1", VoteOption.NO, 1): 1,
+        ("ev1", VoteOption.NO, 2): 1,
+        ("ev2", VoteOption.SI, 1): 0,
+        ("ev2", VoteOption.SI, 2): 0,
+    }
@@ -0,0 +1,151 @@
+import pytest
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from estecon.backend import NO_VOTE_CODE, VOTE_OPTION_CODES, VoteOption, LegPeriod
+from estecon.backend.analytics.vote_matrix import (
+    append_npy_columns,
+    build_vote_matrix,
+    matrix_paths,
+    open_vote_matrix,
+    save_vote_matrix,
+    truncate_npy_columns,
+    update_vote_matrix,
+)
+from estecon.backend.ingestion.load_to_db import BulkLoader, iter_bill_jsons
+from estecon.tests.conftest import make_vote_event
+
+BILL_JSONS = Path(__file__).resolve().parents[2] / "data" / "bill_jsons"
+PERIOD = LegPeriod.PERIODO_2021_2026
+OPTIONS = [
+    VoteOption.SI,
+    VoteOption.NO,
+    VoteOption.ABSTENCION,
+    VoteOption.SIN_RESPUESTA,
+]
+
+
+@pytest.fixture
+def engine(engine):
+    loader = BulkLoader(engine)
+    loader.load_bill_jsons(iter_bill_jsons(BILL_JSONS))
+    loader.load_records(
+        [
+            make_vote_event(
+                "ev2",
+                [OPTIONS[i % 4] for i in range(5)],
+                datetime(2025, 3, 1),
+                voter_ids=range(5),
+            ),
+            make_vote_event(
+                "ev1",
+                [OPTIONS[i % 4] for i in range(1, 5)],
+                datetime(2024, 3, 1),
+                voter_ids=range(1, 5),
+            ),
+        ]
+    )
+    return engine
+
+
+def test_build_vote_matrix(engine):
+    with engine.connect() as conn:
+        vote_matrix = build_vote_matrix(conn, PERIOD)
+    assert vote_matrix.event_ids == ["ev1", "ev2"]
+    assert vote_matrix.voter_ids == [0, 1, 2, 3, 4]
+    assert vote_matrix.matrix.dtype == np.int8
+    assert vote_matrix.event_votes("ev1").tolist() == [NO_VOTE_CODE, 2, 3, 4, 1]
+    assert vote_matrix.voter_votes(0).tolist() == [
+        NO_VOTE_CODE,
+        VOTE_OPTION_CODES[VoteOption.SI],
+    ]
+
+
+def test_save_open_and_append(engine, tmp_path):
+    root = tmp_path / "matrices"
+    with engine.connect() as conn:
+        vote_matrix = update_vote_matrix(conn, PERIOD, root)
+    assert isinstance(vote_matrix.matrix, np.memmap)
+    assert vote_matrix.shape == (5, 2)
+
+    BulkLoader(engine).load_records(
+        [
+            make_vote_event(
+                "ev3",
+                [OPTIONS[i % 4] for i in [0, 4]],
+                datetime(2025, 4, 1),
+                voter_ids=[0, 4],
+            )
+        ]
+    )
+    with engine.connect() as conn:
+        updated = update_vote_matrix(conn, PERIOD, root)
+    assert updated.event_ids == ["ev1", "ev2", "ev3"]
+    assert updated.event_dates[-1] == "2025-04-01"
+    assert updated.event_votes("ev3").tolist() == [1, 0, 0, 0, 1]
+    assert (
+        updated.event_votes("ev1").tolist() == vote_matrix.event_votes("ev1").tolist()
+    )
+
+    with engine.connect() as conn:
+        rebuilt = build_vote_matrix(conn, PERIOD)
+    assert np.array_equal(np.asarray(updated.matrix), rebuilt.matrix)
+
+
+def test_new_voters_rebuild(engine, tmp_path):
+    root = tmp_path / "matrices"
+    with engine.connect() as conn:
+        update_vote_matrix(conn, PERIOD, root)
+    BulkLoader(engine).load_records(
+        [
+            make_vote_event(
+                "ev3",
+                [OPTIONS[i % 4] for i in [7]],
+                datetime(2025, 4, 1),
+                voter_ids=[7],
+            )
+        ]
+    )
+    with engine.connect() as conn:
+        updated = update_vote_matrix(conn, PERIOD, root)
+    assert updated.voter_ids == [0, 1, 2, 3, 4, 7]
+    assert updated.shape == (6, 3)
+
+
+def test_append_npy_columns(tmp_path):
+    path = tmp_path / "m.npy"
+    np.save(path, np.asfortranarray(np.arange(6, dtype=np.int8).reshape(2, 3)))
+    append_npy_columns(path, np.array([[7], [8]], dtype=np.int8))
+    assert np.load(path).tolist() == [[0, 1, 2, 7], [3, 4, 5, 8]]
+    with pytest.raises(ValueError):
+        append_npy_columns(path, np.zeros((3, 1), dtype=np.int8))
+
+
+def test_open_checks_id_maps(engine, tmp_path):
+    with engine.connect() as conn:
+        save_vote_matrix(build_vote_matrix(conn, PERIOD), tmp_path)
+    npy_path, _ = matrix_paths(PERIOD, tmp_path)
+    np.save(npy_path, np.zeros((1, 1), dtype=np.int8))
+    with pytest.raises(ValueError):
+        open_vote_matrix(PERIOD, tmp_path)
+
+
+def test_open_drops_an_interrupted_append(engine, tmp_path):
+    with engine.connect() as conn:
+        vote_matrix = build_vote_matrix(conn, PERIOD)
+    npy_path = save_vote_matrix(vote_matrix, tmp_path)
+    size = npy_path.stat().st_size
+
+    # Columns appended, but the process died before writing the id maps
+    append_npy_columns(npy_path, np.zeros((5, 2), dtype=np.int8))
+    reopened = open_vote_matrix(PERIOD, tmp_path)
+    assert reopened.shape == (5, 2)
+    assert np.array_equal(np.asarray(reopened.matrix), vote_matrix.matrix)
+    assert npy_path.stat().st_size == size
+
+    # Died halfway through writing the data of the new columns
+    with open(npy_path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    assert open_vote_matrix(PERIOD, tmp_path).shape == (5, 2)
+    assert npy_path.stat().st_size == size
+    assert not truncate_npy_columns(npy_path, 2)
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+from estecon.backend.jobs.queue import (
+    DONE,
+    FAILED,
+    LEASED,
+    QUEUED,
+    WorkQueue,
+    Worker,
+    content_hash,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    with WorkQueue(tmp_path / "queue.db", max_attempts=2) as queue:
+        yield queue
+
+
+def test_enqueue_deduplicates(queue):
+    job_id, added = queue.enqueue("ocr", {"url": "https://example.com/a.pdf"})
+    assert added
+    assert queue.enqueue("ocr", {"url": "https://example.com/a.pdf"}) == (job_id, False)
+    # Same url under another vote id, deduplicated by the given key
+    key = content_hash("vote_pdf", "https://example.com/a.pdf")
+    assert queue.enqueue(
+        "vote_pdf", {"id": "1", "url": "https://example.com/a.pdf"}, key
+    )[1]
+    assert not queue.enqueue(
+        "vote_pdf", {"id": "2", "url": "https://example.com/a.pdf"}, key
+    )[1]
+    assert queue.enqueue_many("ocr", [{"url": "a"}, {"url": "b"}, {"url": "a"}]) == 2
+    assert queue.counts() == {QUEUED: 4}
+
+
+def test_claims_are_exclusive(queue):
+    queue.enqueue("ocr", {"url": "a"})
+    job = queue.claim("w1")
+    assert (job.payload, job.attempts, job.lease_owner) == ({"url": "a"}, 1, "w1")
+    assert queue.claim("w2") is None
+    assert queue.claim("w1", kinds=["vote_pdf"]) is None
+
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.enqueue("ocr", {"url": "a"})
+    crashed = queue.claim("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+    job = queue.claim("w2")
+    assert (job.id, job.lease_owner, job.attempts) == (crashed.id, "w2", 2)
+    # The crashed worker can't renew nor complete the job anymore
+    assert not queue.heartbeat(crashed)
+    assert not queue.complete(crashed, "late")
+    assert queue.heartbeat(job)
+    assert queue.complete(job, "text")
+    assert queue.result(job.id) == "text"
+    assert queue.counts() == {DONE: 1}
+
+
+def test_expired_lease_on_last_attempt_gives_up(queue):
+    queue.enqueue("ocr", {"url": "a"})
+    queue.claim("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+    queue.claim("w2", lease_seconds=0.01)
+    time.sleep(0.05)
+    assert queue.claim("w3") is None
+    assert queue.counts() == {FAILED: 1}
+    assert queue.drained()
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    queue.enqueue("ocr", {"url": "a"})
+    assert queue.fail(queue.claim("w1"), "timeout")
+    assert queue.counts() == {QUEUED: 1}
+    assert queue.fail(queue.claim("w1"), "timeout")
+    assert queue.counts() == {FAILED: 1}
+    assert queue.claim("w1") is None
+
+
+def test_enqueue_retries_failed_jobs(queue):
+    job_id, _ = queue.enqueue("ocr", {"url": "a"})
+    for _ in range(2):
+        queue.fail(queue.claim("w1"), "timeout")
+    assert queue.enqueue("ocr", {"url": "a"}) == (job_id, True)
+    job = queue.claim("w1")
+    assert (job.id, job.attempts) == (job_id, 1)
+    assert queue.complete(job, "text")
+    # Done jobs stay done
+    assert queue.enqueue("ocr", {"url": "a"}) == (job_id, False)
+    assert queue.counts() == {DONE: 1}
+
+
+def test_worker_drains_queue(queue):
+    calls = []
+
+    def double(payload):
+        calls.append(payload)
+        return payload * 2
+
+    def broken(payload):
+        raise ValueError(payload)
+
+    queue.enqueue_many("double", [1, 2, 3])
+    queue.enqueue("broken", 4)
+    done = Worker(queue, {"double": double, "broken": broken}, poll_seconds=0.01).run()
+    assert done == {"succeeded": 3, "failed": 2}
+    assert sorted(calls) == [1, 2, 3]
+    assert queue.counts() == {DONE: 3, FAILED: 1}
+    assert queue.result(1) == 2
+
+
+def test_worker_keeps_lease_with_heartbeats(queue):
+    queue.enqueue("slow", 1)
+    worker = Worker(
+        queue,
+        {"slow": lambda payload: time.sleep(0.3)},
+        worker_id="w1",
+        lease_seconds=0.15,
+    )
+    thread = threading.Thread(target=worker.run_one)
+    thread.start()
+    time.sleep(0.2)
+    assert queue.claim("w2") is None
+    thread.join()
+    assert queue.counts() == {DONE: 1}
+
+
+def test_concurrent_workers_share_queue(tmp_path):
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        queue.enqueue_many("item", range(50))
+    seen = []
+    lock = threading.Lock()
+
+    def handle(payload):
+        with lock:
+            seen.append(payload)
+
+    def work():
+        with WorkQueue(tmp_path / "queue.db") as queue:
+            Worker(queue, {"item": handle}, poll_seconds=0.01).run()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seen) == list(range(50))
+    with WorkQueue(tmp_path / "queue.db") as queue:
+        assert queue.counts() == {DONE: 50}
+        assert LEASED not in queue.counts()